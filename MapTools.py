@@ -27,7 +27,7 @@ from qgis.PyQt.QtCore import Qt, pyqtSignal
 from qgis.PyQt.QtGui import QCursor
 from qgis.PyQt.QtWidgets import QApplication
 
-from qgis.core import QgsWkbTypes, QgsFeatureRequest, QgsRectangle, QgsGeometry, QgsFeature, QgsSettings, Qgis
+from qgis.core import QgsWkbTypes, QgsFeatureRequest, QgsRectangle, QgsGeometry, QgsFeature, QgsPointXY, QgsSettings, Qgis
 from qgis.gui import QgsMapToolEmitPoint, QgsMapTool, QgsRubberBand
 
 
@@ -198,9 +198,17 @@ class FeatureFinder(MapToolEmitPoint):
 		self.pointEmitted.emit(point, button)
 
 	@classmethod
-	def findAtPoint(self, layer, point, canvas, onlyTheClosestOne=True, onlyIds=False):
+	def findAtPoint(self, layer, point, canvas, onlyTheClosestOne=True, onlyIds=False, index=None):
 		QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
+		try:
+			rect = self.searchRect(layer, point, canvas)
+			ret = self.findInRect(layer, rect, onlyTheClosestOne, onlyIds, index)
+		finally:
+			QApplication.restoreOverrideCursor()
+		return ret
 
+	@classmethod
+	def searchRect(self, layer, point, canvas):
 		# recupera il valore del raggio di ricerca
 		settings = QgsSettings()
 		radius = settings.value( "/Map/searchRadiusMM", Qgis.DEFAULT_SEARCH_RADIUS_MM, type=float)
@@ -214,49 +222,64 @@ class FeatureFinder(MapToolEmitPoint):
 		rect.setXMaximum(point.x() + radius)
 		rect.setYMinimum(point.y() - radius)
 		rect.setYMaximum(point.y() + radius)
-		rect = canvas.mapSettings().mapToLayerCoordinates(layer, rect)
+		return canvas.mapSettings().mapToLayerCoordinates(layer, rect)
 
+	@classmethod
+	def findInRect(self, source, rect, onlyTheClosestOne=True, onlyIds=False, index=None):
+		""" look for the features within the rect (in layer coordinates),
+		source is either a layer or a feature source (safe to be used
+		from a worker thread). If the PointIndex of the layer is passed
+		the features are found through it. Only what's needed is
+		requested: no attributes while searching, geometries only to
+		measure distances """
 		# recupera le feature che intersecano il rettangolo
-		ret = None
-
 		if onlyTheClosestOne:
-			request=QgsFeatureRequest()
-			request.setFilterRect(rect)
+			if index is not None:
+				featureId = index.nearestInRect(rect)
+			else:
+				featureId = self._closestInRect(source, rect)
 
-			minDist = -1
-			featureId = None
-			rect = QgsGeometry.fromRect(rect)
-			count = 0
-
-			for f in layer.getFeatures(request):
-				if onlyTheClosestOne:
-					geom = f.geometry()
-					distance = geom.distance(rect)
-					if minDist < 0 or distance < minDist:
-						minDist = distance
-						featureId = f.id()
-
-			if onlyIds:
-				ret = featureId
-			elif featureId != None:
-				f = QgsFeature()
-				feats = layer.getFeature( QgsFeatureRequest(featureId) )
-				feats.nextFeature(f)
-				ret = f
+			if onlyIds or featureId is None:
+				return featureId
 
-		else:
-			IDs = []
-			for f in layer.getFeatures():
-				IDs.append( f.id() )
+			f = QgsFeature()
+			feats = source.getFeatures( QgsFeatureRequest(featureId) )
+			feats.nextFeature(f)
+			return f
 
-			if onlyIds:
-				ret = IDs
-			else:
-				ret = []
-				request = QgsFeatureRequest()
-				QgsFeatureRequest.setFilterFids(IDs)
-				for f in layer.getFeatures( request ):
-					ret.append( f )
+		if onlyIds:
+			if index is not None:
+				return [ fid for fid in index.intersects(rect) if rect.contains( QgsPointXY( *index.points[fid] ) ) ]
 
-		QApplication.restoreOverrideCursor()
-		return ret
+			request = QgsFeatureRequest()
+			request.setFilterRect(rect)
+			request.setFlags(QgsFeatureRequest.NoGeometry)
+			request.setNoAttributes()
+			return [ f.id() for f in source.getFeatures(request) ]
+
+		# get all the features at once
+		request = QgsFeatureRequest()
+		request.setFilterRect(rect)
+		return list( source.getFeatures(request) )
+
+	@classmethod
+	def _closestInRect(self, source, rect):
+		# measure the distance from the rect center of the features within
+		# the rect, without fetching their attributes
+		request = QgsFeatureRequest()
+		request.setFilterRect(rect)
+		request.setNoAttributes()
+
+		minDist = -1
+		featureId = None
+		center = QgsGeometry.fromPointXY(rect.center())
+
+		for f in source.getFeatures(request):
+			if not f.hasGeometry():
+				continue
+			distance = f.geometry().distance(center)
+			if minDist < 0 or distance < minDist:
+				minDist = distance
+				featureId = f.id()
+
+		return featureId
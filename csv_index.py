@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Sidecar index of a CSV time-series table, mapping the key values of a PS to
+the byte ranges of its lines, so a click reads those lines only instead of
+scanning the whole file. The index is saved next to the CSV (.psidx) and
+rebuilt when the CSV changes. Lines are split on newlines, quoted values
+spanning several lines are not supported.
+"""
+
+import os
+import csv
+import threading
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from .date_utils import decodeDates
+
+INDEX_VERSION = 1
+KEY_SEP = b'\x1f'
+DELIMITERS = ( ',', ';', '\t', '|' )
+
+
+class CSVIndexError(Exception):
+	pass
+
+
+def csvLayerOfVrt(path):
+	""" return (csv path, {vrt field name: csv column}) of a VRT wrapping a
+	CSV file, None if it's not the case """
+	try:
+		root = ET.parse( path ).getroot()
+	except (ET.ParseError, EnvironmentError):
+		return
+
+	layer = root.find( 'OGRVRTLayer' )
+	if layer is None:
+		return
+	src = layer.find( 'SrcDataSource' )
+	if src is None or not src.text:
+		return
+
+	csvPath = src.text.strip()
+	if csvPath.upper().startswith( "CSV:" ):
+		csvPath = csvPath[4:]
+	if not csvPath.lower().endswith( (".csv", ".txt", ".tsv") ):
+		return
+	if src.get( 'relativeToVRT', '0' ) == '1' or not os.path.isabs( csvPath ):
+		csvPath = os.path.join( os.path.dirname( path ), csvPath )
+
+	columns = {}
+	for field in layer.findall( 'Field' ):
+		name = field.get( 'name' )
+		if name:
+			columns[ name.lower() ] = field.get( 'src', name )
+	return csvPath, columns
+
+
+def keyText(value):
+	""" return the text of a key value as it's written in the CSV """
+	if isinstance(value, float) and value.is_integer():
+		value = int(value)
+	return str(value).strip()
+
+
+def _joinKey(values):
+	return KEY_SEP.join( v.encode( 'utf-8' ) if isinstance(v, str) else v for v in values )
+
+
+class CSVIndex:
+	""" sorted key values and the byte ranges of their lines. Lines of the
+	same PS which follow one another share a single range """
+
+	def __init__(self, csvPath, keyColumns):
+		self.csvPath = csvPath
+		self.keyColumns = [ c.lower() for c in keyColumns ]
+		self.indexPath = "%s.psidx" % csvPath
+
+		stat = os.stat( csvPath )
+		self.stamp = ( stat.st_mtime_ns, stat.st_size )
+		if not self._load():
+			self._build()
+			self._save()
+
+	def _load(self):
+		try:
+			with np.load( self.indexPath ) as data:
+				meta = data[ 'meta' ]
+				if tuple(meta) != (INDEX_VERSION,) + self.stamp:
+					return False
+				if [ c.decode( 'utf-8' ) for c in data[ 'keyColumns' ] ] != self.keyColumns:
+					return False
+				self.delimiter = str(data[ 'delimiter' ])
+				self.columns = [ c.decode( 'utf-8' ) for c in data[ 'columns' ] ]
+				self.keys = data[ 'keys' ]
+				self.starts = data[ 'starts' ]
+				self.ends = data[ 'ends' ]
+		except (EnvironmentError, KeyError, ValueError):
+			return False
+		return True
+
+	def _save(self):
+		# write it aside first, so a concurrent load never sees half a file
+		tmp = "%s.%d.tmp" % (self.indexPath, os.getpid())
+		try:
+			with open( tmp, 'wb' ) as f:
+				np.savez( f, meta=np.array( (INDEX_VERSION,) + self.stamp, dtype=np.int64 ),
+						keyColumns=np.array( [ c.encode( 'utf-8' ) for c in self.keyColumns ] ),
+						delimiter=np.array( self.delimiter ),
+						columns=np.array( [ c.encode( 'utf-8' ) for c in self.columns ] ),
+						keys=self.keys, starts=self.starts, ends=self.ends )
+			os.replace( tmp, self.indexPath )
+		except EnvironmentError:
+			# read-only directory, the index lives in memory only
+			try:
+				os.remove( tmp )
+			except EnvironmentError:
+				pass
+
+	def _build(self):
+		keys, starts, ends = [], [], []
+		with open( self.csvPath, 'rb' ) as f:
+			header = f.readline()
+			text = header.decode( 'utf-8', 'replace' ).rstrip( '\r\n' )
+			self.delimiter = max( DELIMITERS, key=text.count )
+			self.columns = [ c.strip().lower() for c in next( csv.reader( [ text ], delimiter=self.delimiter ) ) ]
+			try:
+				cols = [ self.columns.index( c ) for c in self.keyColumns ]
+			except ValueError:
+				raise CSVIndexError( "%s has no %s columns" % (self.csvPath, ", ".join( self.keyColumns )) )
+			last = max(cols)
+
+			delim = self.delimiter.encode( 'utf-8' )
+			pos = len(header)
+			prev = None
+			for line in f:
+				end = pos + len(line)
+				if b'"' in line:
+					row = next( csv.reader( [ line.decode( 'utf-8', 'replace' ) ], delimiter=self.delimiter ) )
+					row = [ v.encode( 'utf-8' ) for v in row ]
+				else:
+					row = line.rstrip( b'\r\n' ).split( delim )
+				if len(row) > last:
+					key = _joinKey( row[ c ].strip() for c in cols )
+					if key == prev:
+						ends[-1] = end
+					else:
+						keys.append( key )
+						starts.append( pos )
+						ends.append( end )
+						prev = key
+				pos = end
+
+		keys = np.array( keys, dtype='S' ) if keys else np.array( [], dtype='S1' )
+		order = np.argsort( keys, kind='stable' )
+		self.keys = keys[ order ]
+		self.starts = np.array( starts, dtype=np.int64 )[ order ]
+		self.ends = np.array( ends, dtype=np.int64 )[ order ]
+
+	def ranges(self, values):
+		""" return the byte ranges of the lines of the key values """
+		key = _joinKey( keyText( v ) for v in values )
+		lo = np.searchsorted( self.keys, key, 'left' )
+		hi = np.searchsorted( self.keys, key, 'right' )
+		return list(zip( self.starts[ lo:hi ].tolist(), self.ends[ lo:hi ].tolist() ))
+
+	def rows(self, values):
+		""" return the parsed lines of the key values """
+		chunks = []
+		with open( self.csvPath, 'rb' ) as f:
+			for start, end in self.ranges( values ):
+				f.seek( start )
+				chunks.append( f.read( end - start ).decode( 'utf-8', 'replace' ) )
+		lines = "".join( chunks ).splitlines()
+		return list(csv.reader( lines, delimiter=self.delimiter ))
+
+	def series(self, values, dateColumn, valueColumn):
+		""" return the (dates, values) arrays of the key values sorted by
+		date, None if the columns are missing """
+		columns = self._valueColumns( dateColumn, valueColumn )
+		if columns is None:
+			return
+		return self._series( self.rows( values ), *columns )
+
+	def seriesMany(self, keys, dateColumn, valueColumn):
+		""" return {key values: (dates, values)} of several PS, their lines
+		are read in file order with a single pass. None if the columns are
+		missing """
+		columns = self._valueColumns( dateColumn, valueColumn )
+		if columns is None:
+			return
+		keys = [ tuple(values) for values in keys ]
+		ranges = sorted( (start, end, n) for n, values in enumerate( keys ) for start, end in self.ranges( values ) )
+
+		chunks = [ [] for _ in keys ]
+		with open( self.csvPath, 'rb' ) as f:
+			for start, end, n in ranges:
+				f.seek( start )
+				chunks[ n ].append( f.read( end - start ).decode( 'utf-8', 'replace' ) )
+
+		series = {}
+		for values, chunk in zip( keys, chunks ):
+			rows = list(csv.reader( "".join( chunk ).splitlines(), delimiter=self.delimiter ))
+			series[ values ] = self._series( rows, *columns )
+		return series
+
+	def _valueColumns(self, dateColumn, valueColumn):
+		try:
+			return self.columns.index( dateColumn.lower() ), self.columns.index( valueColumn.lower() )
+		except ValueError:
+			return
+
+	@staticmethod
+	def _series(rows, di, vi):
+		# the parsed lines as arrays sorted by date, None if none of the
+		# dates can be decoded
+		rows = [ r for r in rows if len(r) > max(di, vi) ]
+
+		x = decodeDates( [ r[ di ].strip() for r in rows ] )
+		y = np.array( [ _toFloat( r[ vi ] ) for r in rows ], dtype=np.float64 )
+		valid = ~np.isnat( x )
+		if len(rows) > 0 and not valid.any():
+			# dates in a format we can't decode
+			return
+		x, y = x[ valid ], y[ valid ]
+		order = np.argsort( x, kind='stable' )
+		return x[ order ], y[ order ]
+
+
+def _toFloat(value):
+	try:
+		return float(value)
+	except ValueError:
+		return np.nan
+
+
+_opened = {}	# (csv path, key columns) -> CSVIndex
+_building = {}	# (csv path, key columns) -> Lock held while it's built
+_openedLock = threading.Lock()
+
+def openCsvIndex(csvPath, keyColumns):
+	""" return the index of the CSV, building it or rebuilding it when the
+	CSV has changed. The first call on a big file takes a full scan, only
+	the calls for the same CSV wait for it """
+	stat = os.stat( csvPath )
+	stamp = ( stat.st_mtime_ns, stat.st_size )
+	key = ( csvPath, tuple(c.lower() for c in keyColumns) )
+	with _openedLock:
+		index = _opened.get( key )
+		if index is not None and index.stamp == stamp:
+			return index
+		lock = _building.setdefault( key, threading.Lock() )
+
+	with lock:
+		# it may have been built while waiting
+		with _openedLock:
+			index = _opened.get( key )
+		if index is None or index.stamp != stamp:
+			index = CSVIndex( csvPath, keyColumns )
+			with _openedLock:
+				_opened[ key ] = index
+		return index
+
+def closeCsvIndexes():
+	with _openedLock:
+		_opened.clear()
+		_building.clear()
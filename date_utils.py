@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from datetime import date, datetime
+
+import numpy as np
+
+JULIAN_DAY_1970 = 2440588	# julian day of the datetime64 epoch
+
+
+def isDateSequence(values):
+	""" return True if the values are dates (datetime64 array, date or
+	QDate objects) """
+	if isinstance(values, np.ndarray):
+		if values.dtype.kind == 'M':
+			return True
+		if values.dtype.kind != 'O':
+			return False
+	if len(values) == 0:
+		return False
+	first = values[0]
+	return isinstance(first, (date, datetime, np.datetime64)) or hasattr(first, 'toJulianDay')
+
+
+def decodeDates(values):
+	""" convert a whole column of dates to a datetime64[D] array in one pass.
+	Values can be yyyyMMdd (or yyyy-MM-dd) strings, yyyyMMdd ints, QDate,
+	date or datetime64 objects. Invalid dates become NaT """
+	if isinstance(values, np.ndarray) and values.dtype.kind == 'M':
+		return values.astype( 'datetime64[D]' )
+
+	if len(values) == 0:
+		return np.array( [], dtype='datetime64[D]' )
+
+	first = values[0]
+	if hasattr(first, 'toJulianDay'):
+		# QDate objects
+		days = np.fromiter( ( d.toJulianDay() - JULIAN_DAY_1970 if d.isValid() else np.iinfo(np.int64).min for d in values ),
+				dtype=np.int64, count=len(values) )
+		return days.astype( 'datetime64[D]' )
+
+	if isinstance(first, (date, datetime, np.datetime64)):
+		return np.array( values, dtype='datetime64[D]' )
+
+	arr = np.asarray( values )
+	if arr.dtype.kind in 'iuf':
+		return _fromYyyymmdd( arr.astype(np.int64) )
+
+	# strings: drop the separators, then parse the digits
+	s = np.char.replace( arr.astype('U10'), '-', '' )
+	digits = np.char.isdigit( s ) & (np.char.str_len( s ) == 8)
+	n = np.where( digits, s, '0' ).astype( np.int64 )
+	dates = _fromYyyymmdd( n )
+	dates[ ~digits ] = np.datetime64( 'NaT' )
+	return dates
+
+
+def _fromYyyymmdd(n):
+	""" convert yyyyMMdd integers to datetime64[D], NaT if not valid """
+	y, m, d = n // 10000, n // 100 % 100, n % 100
+	valid = (m >= 1) & (m <= 12) & (d >= 1) & (d <= 31)
+
+	months = (y - 1970).astype( 'datetime64[Y]' ).astype( 'datetime64[M]' ) + (np.clip(m, 1, 12) - 1).astype( 'timedelta64[M]' )
+	dates = months.astype( 'datetime64[D]' ) + (np.clip(d, 1, 31) - 1).astype( 'timedelta64[D]' )
+
+	# days beyond the end of the month overflow in the next one
+	valid &= dates.astype( 'datetime64[M]' ) == months
+	dates[ ~valid ] = np.datetime64( 'NaT' )
+	return dates
+
+
+def datesToNum(values):
+	""" convert a whole column of dates to matplotlib float days """
+	# imported here so the converter runs without matplotlib
+	from matplotlib.dates import date2num
+	return date2num( decodeDates( values ) )
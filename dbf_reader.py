@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import struct
+import threading
+
+import numpy as np
+
+DBF_HEADER = struct.Struct( "<BBBBIHH20x" )
+DBF_FIELD = struct.Struct( "<11sc4xBB14x" )
+
+
+class DBFError(Exception):
+	pass
+
+
+class DBFReader:
+	""" read the numeric fields of shapefile records straight from the .dbf
+	file. Records have a fixed length, so the record of a feature id is
+	found with a seek and only the requested fields are parsed """
+
+	def __init__(self, path):
+		self.path = path
+		with open( path, 'rb' ) as f:
+			header = f.read( DBF_HEADER.size )
+			if len(header) < DBF_HEADER.size:
+				raise DBFError( "%s is not a dBase file" % path )
+			_, _, _, _, self.count, self.headerLength, self.recordLength = DBF_HEADER.unpack( header )
+
+			# field descriptors up to the 0x0D terminator, the values of
+			# a record follow its deletion flag
+			self.fields = {}	# lowercase name -> (type, offset, length)
+			offset = 1
+			while f.tell() + DBF_FIELD.size <= self.headerLength:
+				desc = f.read( DBF_FIELD.size )
+				if desc[:1] == b'\r' or len(desc) < DBF_FIELD.size:
+					break
+				name, ftype, length, _ = DBF_FIELD.unpack( desc )
+				name = name.split( b'\0' )[0].decode( 'latin-1' ).strip().lower()
+				self.fields[ name ] = ( ftype.decode( 'latin-1' ), offset, length )
+				offset += length
+
+		if offset > self.recordLength:
+			raise DBFError( "%s has an invalid record length" % path )
+
+	def hasFields(self, names):
+		return all( name.lower() in self.fields for name in names )
+
+	def records(self, fids):
+		""" return the raw records of the feature ids as a uint8 matrix.
+		The ids are sorted so runs of consecutive records are read at once """
+		fids = np.asarray( fids, dtype=np.int64 )
+		if len(fids) and (fids.min() < 0 or fids.max() >= self.count):
+			raise DBFError( "feature id out of range" )
+
+		order = np.argsort( fids, kind='stable' )
+		sortedFids = fids[ order ]
+		records = np.empty( (len(fids), self.recordLength), dtype=np.uint8 )
+
+		# split the sorted ids where they're not consecutive
+		breaks = np.flatnonzero( np.diff( sortedFids ) != 1 ) + 1
+		starts = np.concatenate( ( [0], breaks ) ).astype( np.int64 )
+		ends = np.concatenate( ( breaks, [len(fids)] ) ).astype( np.int64 )
+
+		with open( self.path, 'rb' ) as f:
+			for start, end in zip( starts, ends ):
+				if start == end:
+					continue
+				first, last = sortedFids[ start ], sortedFids[ end - 1 ]
+				f.seek( self.headerLength + int(first) * self.recordLength )
+				data = f.read( int(last - first + 1) * self.recordLength )
+				run = np.frombuffer( data, dtype=np.uint8 ).reshape( -1, self.recordLength )
+				# duplicated ids read the same record
+				records[ order[ start:end ] ] = run[ sortedFids[ start:end ] - first ]
+		return records
+
+	def read(self, fids, names):
+		""" return a float64 matrix with a row for each feature id and a
+		column for each numeric field, NaN where the value is empty """
+		records = self.records( fids )
+		values = np.empty( (len(records), len(names)), dtype=np.float64 )
+		for col, name in enumerate( names ):
+			ftype, offset, length = self.fields[ name.lower() ]
+			if ftype not in 'NF':
+				raise DBFError( "%s is not a numeric field" % name )
+			values[ :, col ] = _parseNumbers( records[ :, offset:offset + length ] )
+		return values
+
+
+def _parseNumbers(column):
+	# the raw bytes of a column as fixed width strings, parsed by numpy
+	# in one pass. Empty or invalid values become NaN
+	strings = np.ascontiguousarray( column ).view( 'S%d' % column.shape[1] ).ravel()
+	strings = np.char.strip( strings )
+	try:
+		return np.where( strings == b'', b'nan', strings ).astype( np.float64 )
+	except ValueError:
+		def parse(s):
+			try:
+				return float(s)
+			except ValueError:
+				return np.nan
+		return np.array( [ parse(s) for s in strings ], dtype=np.float64 )
+
+
+_opened = {}	# path -> (mtime, size, DBFReader)
+_openedLock = threading.Lock()
+
+def openDbf(path):
+	""" return the reader of the .dbf file, reusing it until the file
+	changes """
+	stat = os.stat( path )
+	with _openedLock:
+		opened = _opened.get( path )
+		if opened is None or opened[:2] != (stat.st_mtime, stat.st_size):
+			opened = ( stat.st_mtime, stat.st_size, DBFReader( path ) )
+			_opened[ path ] = opened
+		return opened[2]
+
+def closeDbfs():
+	with _openedLock:
+		_opened.clear()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+PostGIS series table: one row for each PS of a time-series table, with all its
+dates and values as arrays, so a PS is read with a single index lookup instead
+of hundreds of scattered rows. Its columns are:
+
+	code		PS code, primary key
+	dates		date[] sorted
+	vals		real[] following dates
+	n			number of acquisitions
+	last_date	last acquisition date
+	max_id		greatest id of the TS rows of the PS, NULL if the TS table
+				has no id column
+
+The comment of the table records the stamp of the TS table it was built or
+refreshed from: the series table isn't read once the TS table has changed,
+until it's refreshed.
+"""
+
+from qgis.core import QgsTask
+
+from .ts_sql import psycopg2, DB_ERRORS, TSSqlError, quoteIdentifier, qualifiedName, seriesTableName, \
+		seriesTableComment, postgisTableStamp
+
+DATE_TYPES = ( 'date', 'timestamp without time zone', 'timestamp with time zone' )
+
+
+class SeriesTableBuilder:
+	""" create the series table of a TS table, or refresh the rows of the PS
+	which got new acquisitions since it was last built """
+
+	def __init__(self, conninfo, schema, table, dateField, valueField, keyField="code"):
+		self.conninfo = conninfo
+		self.schema = schema
+		self.table = table
+		self.dateField = dateField
+		self.valueField = valueField
+		self.keyField = keyField
+		self._conn = None
+
+	def run(self, progress=None, isCanceled=None):
+		""" build or refresh the table, return the stats as a dict. Raise
+		TSSqlError on database errors """
+		if psycopg2 is None:
+			raise TSSqlError( "psycopg2 is not installed" )
+
+		def setProgress(value):
+			if progress is not None:
+				progress( value )
+		def checkCanceled():
+			if isCanceled is not None and isCanceled():
+				raise TSSqlError( "canceled" )
+
+		try:
+			self._conn = psycopg2.connect( self.conninfo )
+			try:
+				cur = self._conn.cursor()
+				columns = self._columns( cur )
+				if self.dateField.lower() not in columns or self.keyField.lower() not in columns:
+					raise TSSqlError( "%s has no %s or %s column" % (self.table, self.keyField, self.dateField) )
+				setProgress( 5 )
+				checkCanceled()
+
+				# the version of the TS table the series are read from, taken
+				# first so rows loaded meanwhile leave the series table stale
+				stamp = postgisTableStamp( cur, qualifiedName( self.schema, self.table ) )
+
+				cur.execute( "SELECT to_regclass(%s) IS NOT NULL", (self._seriesTable(),) )
+				if cur.fetchone()[0]:
+					stats = self._refresh( cur, columns, setProgress, checkCanceled )
+				else:
+					stats = self._build( cur, columns, setProgress, checkCanceled )
+				cur.execute( "COMMENT ON TABLE %s IS %%s" % self._seriesTable(), (seriesTableComment( stamp ),) )
+
+				checkCanceled()
+				self._conn.commit()
+				cur.execute( "ANALYZE %s" % self._seriesTable() )
+				self._conn.commit()
+			finally:
+				conn, self._conn = self._conn, None
+				conn.close()
+		except DB_ERRORS as e:
+			raise TSSqlError( str(e) )
+
+		setProgress( 100 )
+		return stats
+
+	def cancel(self):
+		""" stop the running statement, it can be called from any thread """
+		conn = self._conn
+		if conn is not None:
+			try:
+				conn.cancel()
+			except DB_ERRORS:
+				pass
+
+	def _seriesTable(self):
+		return qualifiedName( self.schema, seriesTableName( self.table ) )
+
+	def _columns(self, cur):
+		# lowercase column name -> data type of the TS table
+		cur.execute( "SELECT lower(column_name), data_type FROM information_schema.columns "
+				"WHERE table_schema = coalesce(%s, current_schema()) AND table_name = %s",
+				(self.schema or None, self.table) )
+		return dict( cur.fetchall() )
+
+	def _rows(self, columns, where=""):
+		# the select of the TS rows as (k, d, v[, id]) with decoded dates
+		d = quoteIdentifier( self.dateField )
+		if columns[ self.dateField.lower() ] in DATE_TYPES:
+			date = "%s::date" % d
+		else:
+			# yyyyMMdd or yyyy-MM-dd text and numbers
+			date = "to_date(replace(%s::text, '-', ''), 'YYYYMMDD')" % d
+		rowid = ", id" if 'id' in columns else ""
+		return "SELECT %(k)s::text AS k, %(date)s AS d, %(v)s::real AS v%(rowid)s FROM %(ts)s %(where)s" % {
+				'k': quoteIdentifier( self.keyField ), 'date': date, 'v': quoteIdentifier( self.valueField ),
+				'rowid': rowid, 'ts': qualifiedName( self.schema, self.table ), 'where': where }
+
+	def _aggregate(self, columns, where=""):
+		# the select of the series table rows
+		maxid = "max(id)" if 'id' in columns else "NULL::bigint"
+		return "SELECT k, array_agg(d ORDER BY d), array_agg(v ORDER BY d), count(*), max(d), %s " \
+				"FROM (%s) AS t WHERE d IS NOT NULL GROUP BY k" % (maxid, self._rows( columns, where ))
+
+	def _build(self, cur, columns, setProgress, checkCanceled):
+		series = self._seriesTable()
+		cur.execute( "CREATE TABLE %s (code text PRIMARY KEY, dates date[] NOT NULL, vals real[] NOT NULL, "
+				"n integer NOT NULL, last_date date, max_id bigint)" % series )
+		setProgress( 10 )
+		checkCanceled()
+
+		cur.execute( "INSERT INTO %s %s" % (series, self._aggregate( columns )) )
+		codes = cur.rowcount
+		setProgress( 90 )
+		return { 'mode': 'build', 'codes': codes }
+
+	def _refresh(self, cur, columns, setProgress, checkCanceled):
+		series = self._seriesTable()
+		ts = qualifiedName( self.schema, self.table )
+		k = quoteIdentifier( self.keyField )
+
+		if 'id' in columns:
+			# the rows loaded since the last build have greater ids
+			cur.execute( "SELECT max(max_id) FROM %s" % series )
+			lastId = cur.fetchone()[0]
+			if lastId is None:
+				lastId = -1
+			cur.execute( "CREATE TEMP TABLE pstimeseries_changed ON COMMIT DROP AS "
+					"SELECT DISTINCT %s::text AS code FROM %s WHERE id > %%s" % (k, ts), (lastId,) )
+		else:
+			# compare the number of acquisitions and the last date of each PS
+			cur.execute( "CREATE TEMP TABLE pstimeseries_changed ON COMMIT DROP AS "
+					"SELECT t.k AS code FROM (SELECT k, count(*) AS n, max(d) AS last FROM (%s) AS r WHERE d IS NOT NULL GROUP BY k) AS t "
+					"LEFT JOIN %s AS s ON s.code = t.k "
+					"WHERE s.code IS NULL OR s.n <> t.n OR s.last_date IS DISTINCT FROM t.last" % (self._rows( columns ), series) )
+		setProgress( 40 )
+		checkCanceled()
+
+		cur.execute( "DELETE FROM %s WHERE code IN (SELECT code FROM pstimeseries_changed)" % series )
+		setProgress( 50 )
+		checkCanceled()
+
+		cur.execute( "INSERT INTO %s %s" % (series, self._aggregate( columns,
+				"WHERE %s::text IN (SELECT code FROM pstimeseries_changed)" % k )) )
+		codes = cur.rowcount
+		setProgress( 90 )
+		return { 'mode': 'refresh', 'codes': codes }
+
+
+class SeriesTableTask(QgsTask):
+	""" run the SeriesTableBuilder in background """
+
+	def __init__(self, builder):
+		QgsTask.__init__(self, "PS Time Series Viewer: building the series table of %s" % builder.table, QgsTask.CanCancel)
+		self.builder = builder
+		self.stats = None
+		self.exception = None
+
+	def run(self):
+		try:
+			self.stats = self.builder.run( self.setProgress, self.isCanceled )
+		except TSSqlError as e:
+			self.exception = e
+			return False
+		return not self.isCanceled()
+
+	def cancel(self):
+		self.builder.cancel()
+		QgsTask.cancel(self)
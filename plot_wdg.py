@@ -20,15 +20,21 @@ email				: brush.tyler@gmail.com
 """
 
 from qgis.PyQt.QtWidgets import QDialog, QVBoxLayout, QApplication
-from qgis.PyQt.QtCore import Qt, QVariant
+from qgis.PyQt.QtCore import Qt, QVariant, QTimer
 from qgis.PyQt.QtGui import QCursor
 
 # Matplotlib Figure object
 from matplotlib.figure import Figure
 
+import numpy as np
+
 from datetime import datetime, date
 from matplotlib.dates import date2num, num2date, YearLocator, MonthLocator, DayLocator, DateFormatter
 from matplotlib.lines import Line2D
+from matplotlib.collections import PathCollection
+
+from .date_utils import isDateSequence, datesToNum, decodeDates
+from .ts_lod import RAW_POINTS_PER_COLUMN, decimateLine, decimatePoints
 
 # import the Qt4Agg FigureCanvas object, that binds Figure to
 # Qt4Agg backend. It also inherits from QWidget
@@ -37,6 +43,11 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 
 class PlotWdg(FigureCanvasQTAgg):
 	"""Class to represent the FigureCanvas widget"""
+
+	# delay of the redraw after a change typed in a text edit (ms), the
+	# other changes are drawn as soon as the event loop is idle
+	TYPING_REDRAW_DELAY = 150
+
 	def __init__(self, data=None, labels=None, title=None, props=None):
 
 		self.fig = Figure()
@@ -45,9 +56,36 @@ class PlotWdg(FigureCanvasQTAgg):
 		# initialize the canvas where the Figure renders into
 		FigureCanvasQTAgg.__init__(self, self.fig)
 
+		# the changes only schedule a redraw, so those made by a single
+		# user action cost a single render. renderCount tells how many
+		# renders have been done, blitCount how many overlay updates
+		self.renderCount = 0
+		self.blitCount = 0
+		self._redrawTimer = QTimer(self)
+		self._redrawTimer.setSingleShot(True)
+		self._redrawTimer.timeout.connect(self._redraw)
+		self._fullRedraw = False
+
+		# overlays are animated artists, blitted over the background
+		# cached on each render when nothing else has changed
+		self._overlays = []
+		self._background = None
+		self._printing = False
+		self.mpl_connect('draw_event', self._onDrawEvent)
+
+		# level of detail: lines and points are drawn decimated for the
+		# pixels of the current view, again whenever it's zoomed, panned
+		# or resized. Each artist keeps its whole data here
+		self.lodEnabled = True
+		self._lod = {}		# artist -> [x, y, view, decimated]
+
 		self._dirty = False
 		self.collections = []
 
+		# changed whenever new data are set, results computed on the data
+		# are valid as long as it doesn't change
+		self.dataVersion = 0
+
 		if not data: data = [None]
 		self.setData( *data )
 
@@ -65,9 +103,13 @@ class PlotWdg(FigureCanvasQTAgg):
 	def itemAt(self, index):
 		if index >= len(self.x):
 			return None
-		return (self.x[index] if self.x else None, self.y[index] if self.y else None)
+		return (self.x[index], self.y[index] if index < len(self.y) else None)
 
 	def delete(self):
+		try:
+			self._redrawTimer.stop()
+		except RuntimeError:
+			pass	# the timer was already deleted with the widget
 		self._clear()
 
 		# unset delete function
@@ -87,6 +129,137 @@ class PlotWdg(FigureCanvasQTAgg):
 	def setDirty(self, val):
 		self._dirty = val
 
+	def scheduleRedraw(self, delay=0, overlays=False):
+		""" render the canvas once the event loop gets back control, or
+		after delay ms without further changes. Pending requests are
+		merged into a single render. When only the overlays have changed
+		they're blitted over the cached background instead """
+		if not overlays:
+			self._fullRedraw = True
+		self._redrawTimer.start( delay )
+
+	def _redraw(self):
+		if self._fullRedraw or self._background is None:
+			self.draw()
+			return
+
+		self._applyLod()
+		self.restore_region( self._background )
+		self._drawOverlays()
+		self.blit( self.fig.bbox )
+		self.blitCount += 1
+
+	def draw(self):
+		# it renders what's pending too
+		self._redrawTimer.stop()
+		self._fullRedraw = False
+		self.renderCount += 1
+		self._applyLod()
+		FigureCanvasQTAgg.draw(self)
+
+	def _onDrawEvent(self, event):
+		# the figure has been rendered without the overlays, keep it as
+		# background then draw them on top
+		if self._printing:
+			return
+		self._background = self.copy_from_bbox( self.fig.bbox )
+		self._drawOverlays()
+
+	def _drawOverlays(self):
+		for artist in self._overlays:
+			if artist.get_visible() and artist.axes is not None:
+				artist.axes.draw_artist( artist )
+
+	def print_figure(self, *args, **kwargs):
+		# saved figures are drawn at once with the whole data, overlays
+		# included
+		animated = [ a for a in self._overlays if a.get_animated() ]
+		self._printing = True
+		self._applyLod( full=True )
+		for artist in animated:
+			artist.set_animated( False )
+		try:
+			return FigureCanvasQTAgg.print_figure(self, *args, **kwargs)
+		finally:
+			for artist in animated:
+				artist.set_animated( True )
+			self._printing = False
+
+	def _applyLod(self, full=False):
+		# set the data of the artists decimated for the current view, or
+		# the whole data if full. Those already set for it are skipped
+		if not self._lod:
+			return
+		view = None if full or not self.lodEnabled else self._lodView()
+		for artist, entry in self._lod.items():
+			x, y, shown, decimated = entry
+			if shown == view or (view is not None and not artist.get_visible()):
+				continue
+			entry[2] = view
+
+			idx = self._lodIndexes( artist, x, y ) if view is not None else None
+			if idx is not None:
+				self._setArtistData( artist, x[idx], y[idx] )
+			elif decimated:
+				self._setArtistData( artist, x, y )
+			entry[3] = idx is not None
+
+	def _lodView(self):
+		axes = self.axes
+		return ( tuple(axes.viewLim.bounds), tuple(axes.bbox.bounds), axes.get_xscale(), axes.get_yscale() )
+
+	def _lodIndexes(self, artist, x, y):
+		# the indexes of the data to draw in the view, None if all of them
+		bbox = self.axes.bbox
+		if len(x) <= RAW_POINTS_PER_COLUMN * bbox.width:
+			return
+
+		zeros = np.zeros( len(x) )
+		px = self.axes.get_xaxis_transform().transform( np.column_stack( (x, zeros) ) )[:, 0]
+		py = self.axes.get_yaxis_transform().transform( np.column_stack( (zeros, y) ) )[:, 1]
+
+		if not isinstance(artist, Line2D):
+			return decimatePoints( px, py, bbox.x0, bbox.y0, bbox.x1, bbox.y1 )
+
+		if not np.all( px[1:] >= px[:-1] ):
+			return		# not sorted along the axis
+		idx = decimateLine( px, py, bbox.x0, bbox.x1 )
+		if artist.get_marker() not in ( None, '', ' ', 'None', 'none' ):
+			idx = np.union1d( idx, decimatePoints( px, py, bbox.x0, bbox.y0, bbox.x1, bbox.y1 ) )
+		return idx
+
+	@staticmethod
+	def _setArtistData(artist, x, y):
+		if isinstance(artist, Line2D):
+			artist.set_data( x, y )
+		else:
+			artist.set_offsets( np.column_stack( (x, y) ) )
+
+	def _trackLod(self, items, x, y):
+		""" keep the whole data of the lines and points of items, which are
+		drawn at the level of detail of the view. Points with a color or
+		size for each of them are always drawn as they are """
+		if not isinstance(items, (list, tuple)):
+			items = [ items ]
+		for artist in items:
+			if isinstance(artist, PathCollection):
+				if artist.get_array() is not None or max( len(artist.get_sizes()), len(artist.get_facecolors()) ) > 1:
+					continue
+			elif not isinstance(artist, Line2D):
+				continue
+			entry = self._lod.get( artist )
+			decimated = entry is not None and entry[3]
+			self._lod[ artist ] = [ np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), None, decimated ]
+
+	def _setItemData(self, items, x, y):
+		""" set the whole data of the lines and points of items, see
+		_trackLod """
+		for artist in (items if isinstance(items, (list, tuple)) else [ items ]):
+			self._setArtistData( artist, x, y )
+			if artist in self._lod:
+				self._lod[ artist ][3] = False
+		self._trackLod( items, x, y )
+
 	def showEvent(self, event):
 		if self._dirty:
 			self.refreshData()
@@ -100,22 +273,49 @@ class PlotWdg(FigureCanvasQTAgg):
 		# update axis limits
 		self.axes.relim()	# it doesn't shrink until removing all the objects on the axis
 		# re-draw
-		self.draw()
+		self.scheduleRedraw()
 		# unset the dirty flag
 		self._dirty = False
 
 	def setData(self, x, y=None, info=None):
-		self.x = x if x is not None else []
-		self.y = y if y is not None else []
+		# the values are converted once, dates to datetime64 and numbers
+		# to float64 arrays, and so are the numbers the artists are drawn
+		# from, with dates as matplotlib days
+		self.x = self._toArray( x )
+		self.y = self._toArray( y )
 		self.info = info if info is not None else []
+		self._xIsDate = isDateSequence(self.x)
+		self._yIsDate = isDateSequence(self.y)
+		self.xNum = date2num( self.x ) if self._xIsDate else self.x
+		self.yNum = date2num( self.y ) if self._yIsDate else self.y
+		self.dataVersion += 1
 		self._dirty = True
 
+	@classmethod
+	def _toArray(cls, values):
+		""" return the values as a datetime64 or float64 array """
+		if values is None:
+			return np.array([], dtype=np.float64)
+		if isinstance(values, np.ndarray) and values.dtype.kind in 'Mf':
+			return values if values.dtype.kind == 'M' else np.asarray(values, dtype=np.float64)
+
+		if not isinstance(values, np.ndarray):
+			values = [ cls._valueFromQVariant(v) for v in values ]
+		if isDateSequence(values):
+			if hasattr(values[0], 'toJulianDay'):
+				return decodeDates(values)		# QDate objects
+			return np.array(values, dtype='datetime64')
+		try:
+			return np.asarray(values, dtype=np.float64)
+		except (TypeError, ValueError):
+			return np.asarray(values)
+
 	def getTitle(self):
 		return self.axes.get_title()
 
 	def setTitle(self, title, *args, **kwargs):
 		self.axes.set_title( title or "", *args, **kwargs )
-		self.draw()
+		self.scheduleRedraw( self.TYPING_REDRAW_DELAY )
 
 	def getLabels(self):
 		return self.axes.get_xlabel(), self.axes.get_ylabel()
@@ -123,17 +323,15 @@ class PlotWdg(FigureCanvasQTAgg):
 	def setLabels(self, xLabel=None, yLabel=None, *args, **kwargs):
 		self.axes.set_xlabel( xLabel or "", *args, **kwargs )
 		self.axes.set_ylabel( yLabel or "", *args, **kwargs )
-		self.draw()
+		self.scheduleRedraw( self.TYPING_REDRAW_DELAY )
 
 	def getLimits(self):
 		xlim = self.axes.get_xlim()
-		is_x_date = isinstance(self.x[0], (datetime, date)) if len(self.x) > 0 else False
-		if is_x_date:
+		if self._xIsDate:
 			xlim = num2date(xlim)
 
 		ylim = self.axes.get_ylim()
-		is_y_date = isinstance(self.y[0], (datetime, date)) if self.y is not None and len(self.y) > 0 else False
-		if is_y_date:
+		if self._yIsDate:
 			ylim = num2date(ylim)
 
 		return xlim, ylim
@@ -144,18 +342,24 @@ class PlotWdg(FigureCanvasQTAgg):
 			self.axes.set_xlim(xlim)
 		if ylim is not None:
 			self.axes.set_ylim(ylim)
-		self.draw()
+		self.scheduleRedraw()
 
 	def displayGrids(self, hgrid=False, vgrid=False):
 		self.axes.xaxis.grid(vgrid, 'major')
 		self.axes.yaxis.grid(hgrid, 'major')
-		self.draw()
+		self.scheduleRedraw()
 
 	def _removeItem(self, item):
 		try:
 			self.collections.remove( item )
 		except ValueError:
 			pass
+		try:
+			self._overlays.remove( item )
+		except ValueError:
+			pass
+		for i in (item if isinstance(item, (list, tuple, set)) else [ item ]):
+			self._lod.pop( i, None )
 
 		try:
 			if isinstance(item, (list, tuple, set)):
@@ -173,26 +377,61 @@ class PlotWdg(FigureCanvasQTAgg):
 		self.collections = []
 
 	def _plot(self):
-		# convert values, then create the plot
-		x = map(PlotWdg._valueFromQVariant, self.x)
-		y = map(PlotWdg._valueFromQVariant, self.y)
-
-		items = self._callPlotFunc('plot', x, y)
+		items = self._callPlotFunc('plot', self.x, self.y)
 		self.collections.append( items )
 
+	def _numeric(self, values):
+		# return the numbers to plot and whether they're dates, the data
+		# arrays were converted when set
+		if values is self.x:
+			return self.xNum, self._xIsDate
+		if values is self.y:
+			return self.yNum, self._yIsDate
+		if isDateSequence(values):
+			return datesToNum(values), True
+		return values, False
+
+	def _createOverlay(self, plotfunc, x, y, **kwargs):
+		# create the artist of an overlay keeping the axes limits, x and y
+		# are numbers
+		xlim, ylim = self.axes.get_xlim(), self.axes.get_ylim()
+		items = getattr(self.axes, plotfunc)(x, y, **kwargs)
+		self.axes.set_xlim(xlim)
+		self.axes.set_ylim(ylim)
+
+		artist = items[0] if isinstance(items, list) else items
+		artist.set_animated(True)
+		self._trackLod( artist, x, y )
+		self._overlays.append( artist )
+		self.collections.append( artist )
+		return artist
+
+	def _updateOverlay(self, artist, show, plotfunc=None, x=None, y=None, **kwargs):
+		""" show or hide the overlay artist, updating its data in place or
+		creating it the first time it's shown. Return the artist """
+		if show:
+			if artist is None:
+				artist = self._createOverlay( plotfunc, x, y, **kwargs )
+			else:
+				self._setItemData( artist, x, y )
+		if artist is not None:
+			artist.set_visible( show )
+		return artist
+
 	def _callPlotFunc(self, plotfunc, x, y=None, *args, **kwargs):
-		is_x_date = isinstance(x[0], (datetime, date)) if len(x) > 0 else False
-		is_y_date = isinstance(y[0], (datetime, date)) if y is not None and len(y) > 0 else False
+		# dates are plotted as matplotlib days
+		x, is_x_date = self._numeric(x)
+		y, is_y_date = self._numeric(y) if y is not None else (None, False)
 
 		if is_x_date:
 			self._setAxisDateFormatter( self.axes.xaxis, x )
-			x = date2num(x)
 		if is_y_date:
 			self._setAxisDateFormatter( self.axes.yaxis, y )
-			y = date2num(y)
 
 		if y is not None:
 			items = getattr(self.axes, plotfunc)(x, y, *args, **kwargs)
+			if plotfunc in ('plot', 'scatter'):
+				self._trackLod( items, x, y )
 		else:
 			items = getattr(self.axes, plotfunc)(x, *args, **kwargs)
 
@@ -205,14 +444,15 @@ class PlotWdg(FigureCanvasQTAgg):
 
 	@classmethod
 	def _setAxisDateFormatter(self, axis, data):
-		timedelta = max(data) - min(data)
-		if timedelta.days > 365*5:
+		# data are matplotlib days
+		days = np.nanmax(data) - np.nanmin(data)
+		if days > 365*5:
 			axis.set_major_formatter( DateFormatter('%Y') )
 			#axis.set_major_locator( YearLocator() )
 			#axis.set_minor_locator( MonthLocator() )
 			#bins = timedelta.days * 4 / 356	# four bins for a year
 
-		elif timedelta.days > 30*5:
+		elif days > 30*5:
 			axis.set_major_formatter( DateFormatter('%Y-%m') )
 			#axis.set_major_locator( MonthLocator() )
 			#axis.set_minor_locator( DayLocator() )
@@ -268,10 +508,7 @@ class HistogramPlotWdg(PlotWdg):
 		PlotWdg.__init__(self, *args, **kwargs)
 
 	def _plot(self):
-		# convert values, then create the plot
-		x = map(PlotWdg._valueFromQVariant, self.x)
-
-		items = self._callPlotFunc('hist', x, bins=50)
+		items = self._callPlotFunc('hist', self.x, bins=50)
 		self.collections.append( items )
 
 
@@ -281,11 +518,7 @@ class ScatterPlotWdg(PlotWdg):
 		PlotWdg.__init__(self, *args, **kwargs)
 
 	def _plot(self):
-		# convert values, then create the plot
-		x = map(PlotWdg._valueFromQVariant, self.x)
-		y = map(PlotWdg._valueFromQVariant, self.y)
-
-		items = self._callPlotFunc('scatter', x, y)
+		items = self._callPlotFunc('scatter', self.x, self.y)
 		self.collections.append( items )
 
 
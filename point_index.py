@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import threading
+from concurrent.futures import Future
+
+from qgis.core import QgsApplication, QgsTask, QgsProject, QgsSpatialIndex, QgsFeatureRequest, QgsRectangle, QgsPointXY, QgsMessageLog
+
+
+class PointIndex:
+	""" in-memory index of the points of a layer answering nearest
+	neighbour queries in logarithmic time """
+
+	def __init__(self, source):
+		self.index = QgsSpatialIndex()
+		self.points = {}	# fid -> (x, y)
+		self._lock = threading.Lock()
+
+		request = QgsFeatureRequest()
+		request.setNoAttributes()
+		for f in source.getFeatures( request ):
+			if f.hasGeometry():
+				self._insert( f.id(), f.geometry() )
+
+	def _insert(self, fid, geom):
+		p = geom.boundingBox().center()
+		self.points[ fid ] = (p.x(), p.y())
+		self.index.insertFeature( fid, QgsRectangle( p.x(), p.y(), p.x(), p.y() ) )
+
+	def _delete(self, fid):
+		p = self.points.pop( fid, None )
+		if p is not None:
+			self.index.deleteFeature( fid, QgsRectangle( p[0], p[1], p[0], p[1] ) )
+
+	def insert(self, fid, geom):
+		with self._lock:
+			self._delete( fid )
+			if geom is not None and not geom.isNull():
+				self._insert( fid, geom )
+
+	def delete(self, fid):
+		with self._lock:
+			self._delete( fid )
+
+	def distance2(self, fid, point):
+		p = self.points.get( fid )
+		if p is None:
+			return float('inf')
+		return (p[0] - point.x())**2 + (p[1] - point.y())**2
+
+	def nearest(self, point, count=1):
+		""" return the ids of the count points closest to point """
+		with self._lock:
+			ids = self.index.nearestNeighbor( QgsPointXY(point), count )
+		return sorted( ids, key=lambda fid: self.distance2( fid, point ) )[ :count ]
+
+	def nearestInRect(self, rect):
+		""" return the id of the point closest to the rect center, None if
+		it's outside the rect """
+		ids = self.nearest( rect.center(), 1 )
+		if not ids:
+			return
+		x, y = self.points[ ids[0] ]
+		if not rect.contains( QgsPointXY( x, y ) ):
+			return
+		return ids[0]
+
+	def intersects(self, rect):
+		with self._lock:
+			return self.index.intersects( rect )
+
+
+class PointIndexTask(QgsTask):
+	""" build the PointIndex of a layer in background """
+
+	def __init__(self, registry, layerid, source, generation, future):
+		QgsTask.__init__(self, "PS Time Series Viewer: indexing the PS")
+		self.registry = registry
+		self.layerid = layerid
+		self.source = source
+		self.generation = generation
+		self.future = future
+		self.exception = None
+
+	def run(self):
+		try:
+			self.registry._build( self.layerid, self.source, self.generation, self.future )
+		except Exception as e:
+			self.exception = e
+			self.registry._abandon( self.layerid, self.future )
+			return False
+		return True
+
+
+class PointIndexRegistry:
+	""" point indexes by layer id. They're built in background, or on the
+	first query which can wait for it, updated while the layer is edited
+	and dropped when it's removed. Indexes are built out of the lock, so
+	edits and removals never wait for them: each drop bumps the layer
+	generation and the indexes of the previous ones are thrown away """
+
+	def __init__(self):
+		self._indexes = {}
+		self._building = {}		# layer id -> Future of the index being built
+		self._generations = {}	# layer id -> number of times it was dropped
+		self._watched = {}	# layer id -> [(signal, slot)]
+		self._tasks = set()		# referenced until they actually end
+		self._lock = threading.Lock()
+
+		QgsProject.instance().layerWillBeRemoved.connect( self.remove )
+
+	def index(self, layerid, source, wait=True):
+		""" return the index of the layer. If it's not ready yet, wait for
+		the one being built or build it from the feature source if wait,
+		otherwise return None. It can be called from a worker thread """
+		with self._lock:
+			index = self._indexes.get( layerid )
+			if index is not None or not wait:
+				return index
+			future = self._building.get( layerid )
+			if future is None:
+				future = self._building[ layerid ] = Future()
+				generation = self._generations.get( layerid, 0 )
+			else:
+				generation = None
+
+		if generation is not None:
+			try:
+				self._build( layerid, source, generation, future )
+			finally:
+				self._abandon( layerid, future )
+		return future.result()
+
+	def build(self, layerid, source):
+		""" start building the index of the layer in background unless it's
+		ready or being built, it must be called from the main thread """
+		with self._lock:
+			if layerid in self._indexes or layerid in self._building:
+				return
+			future = self._building[ layerid ] = Future()
+			generation = self._generations.get( layerid, 0 )
+
+		task = PointIndexTask( self, layerid, source, generation, future )
+		def finished():
+			self._tasks.discard( task )
+			if task.exception is not None:
+				QgsMessageLog.logMessage( "indexing the PS failed: %s" % task.exception, "PSTimeSeriesViewer" )
+		task.taskCompleted.connect( finished )
+		task.taskTerminated.connect( finished )
+		self._tasks.add( task )
+		QgsApplication.taskManager().addTask( task )
+
+	def _build(self, layerid, source, generation, future):
+		# scan the layer out of the lock, then publish the index unless the
+		# layer was dropped meanwhile
+		index = PointIndex( source )
+		with self._lock:
+			if self._building.get( layerid ) is future:
+				del self._building[ layerid ]
+			if self._generations.get( layerid, 0 ) != generation:
+				index = None
+			else:
+				self._indexes[ layerid ] = index
+		future.set_result( index )
+
+	def _abandon(self, layerid, future):
+		# the build failed, the next query tries again
+		with self._lock:
+			if self._building.get( layerid ) is future:
+				del self._building[ layerid ]
+		if not future.done():
+			future.set_result( None )
+
+	def _drop(self, layerid):
+		with self._lock:
+			self._indexes.pop( layerid, None )
+			self._building.pop( layerid, None )
+			self._generations[ layerid ] = self._generations.get( layerid, 0 ) + 1
+
+	def watch(self, layer):
+		""" keep the index up to date with the layer edits, it must be
+		called from the main thread """
+		layerid = layer.id()
+		if layerid in self._watched:
+			return
+
+		def added(fid):
+			index = self._indexes.get( layerid )
+			if index is not None:
+				f = layer.getFeature( fid )
+				index.insert( fid, f.geometry() if f.hasGeometry() else None )
+		def changed(fid, geom):
+			index = self._indexes.get( layerid )
+			if index is not None:
+				index.insert( fid, geom )
+		def deleted(fid):
+			index = self._indexes.get( layerid )
+			if index is not None:
+				index.delete( fid )
+		def drop(*args):
+			# feature ids change on commit, rebuild it on next query
+			self._drop( layerid )
+
+		connections = [ (layer.featureAdded, added), (layer.geometryChanged, changed),
+				(layer.featureDeleted, deleted), (layer.afterCommitChanges, drop),
+				(layer.afterRollBack, drop), (layer.dataChanged, drop) ]
+		for signal, slot in connections:
+			signal.connect( slot )
+		self._watched[ layerid ] = connections
+
+	def remove(self, layerid):
+		self._drop( layerid )
+		for signal, slot in self._watched.pop( layerid, [] ):
+			try:
+				signal.disconnect( slot )
+			except (TypeError, RuntimeError):
+				pass
+
+	def clear(self):
+		for layerid in list(self._watched.keys()):
+			self.remove( layerid )
+		with self._lock:
+			self._indexes.clear()
+			self._building.clear()
+
+	def close(self):
+		self.clear()
+		try:
+			QgsProject.instance().layerWillBeRemoved.disconnect( self.remove )
+		except TypeError:
+			pass
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Binary time-series store (.psts), all the values are little endian:
+
+	header		64 bytes: magic "PSTS", version (uint32), number of PS
+				(uint64), number of dates (uint64), code width (uint32),
+				byte offsets of the dates, values, codes and rows sections
+				(uint64 each)
+	dates		int32 days since 1970-01-01, shared by all the PS
+	values		float32 matrix of N_ps x N_dates, NaN where missing
+	codes		PS codes sorted, fixed width byte strings
+	rows		int64 row of the values matrix for each sorted code
+
+Columnar time-series archive (.psa), for PS with different dates:
+
+	header		64 bytes: magic "PSTA", version (uint32), number of PS
+				(uint64), number of rows (uint64), code width (uint32),
+				byte offsets of the dates, values, codes and offsets
+				sections (uint64 each)
+	codec		version 2 only: precision of the values (float64), size
+				of the values (uint8, 0 for float32 or 2 and 4 for
+				quantized int16 and int32), byte offset of the starts
+				section (uint64)
+	dates		version 1: int32 days since 1970-01-01. Version 2: uint16
+				days since the previous date of the same PS, 0 for the
+				first one. Sorted by code then date
+	values		float32 or quantized values (see ts_codec), one for each
+				date
+	codes		PS codes sorted, fixed width byte strings
+	offsets		int64 N_ps + 1 offsets, the rows of the i-th code are
+				[offsets[i], offsets[i+1])
+	starts		version 2 only: int32 first day of each PS
+
+Each section starts at a multiple of 64 bytes.
+"""
+
+import os
+import struct
+import threading
+
+import numpy as np
+
+from .date_utils import decodeDates
+from .ts_codec import PRECISION, quantize, dequantize, decodeDays
+
+MAGIC = b"PSTS"
+ARCHIVE_MAGIC = b"PSTA"
+VERSION = 1
+ARCHIVE_VERSION = 2
+HEADER = struct.Struct( "<4sIQQI4xQQQQ" )
+CODEC = struct.Struct( "<dB7xQ" )
+
+# size of the values in the codec header -> their dtype
+_VALUE_DTYPES = { 0: np.dtype('<f4'), 2: np.dtype('<i2'), 4: np.dtype('<i4') }
+ALIGN = 64
+
+
+def _align(offset):
+	return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+class PSStoreError(Exception):
+	pass
+
+
+def _findCode(codes, code):
+	# return the position of the code within the sorted codes or None
+	key = str(code).encode( 'utf-8' )
+	pos = np.searchsorted( codes, key )
+	if pos >= len(codes) or codes[ pos ] != key:
+		return
+	return int(pos)
+
+
+_opened = {}	# path -> (mtime, PSStore or PSArchive)
+_openedLock = threading.Lock()
+
+def openStore(path):
+	""" return the store or archive at path, reusing it until the file
+	changes """
+	mtime = os.path.getmtime( path )
+	with _openedLock:
+		opened = _opened.get( path )
+		if opened is None or opened[0] != mtime:
+			with open( path, 'rb' ) as f:
+				magic = f.read( 4 )
+			if magic == ARCHIVE_MAGIC:
+				opened = ( mtime, PSArchive( path ) )
+			else:
+				opened = ( mtime, PSStore( path ) )
+			_opened[ path ] = opened
+		return opened[1]
+
+def closeStores():
+	with _openedLock:
+		_opened.clear()
+
+
+class PSStore:
+	""" read-only access to a .psts file through numpy.memmap, opening a PS
+	is a row slice of the values matrix with no parsing """
+
+	def __init__(self, path):
+		self.path = path
+		self._mm = np.memmap( path, dtype=np.uint8, mode='r' )
+		if len(self._mm) < HEADER.size:
+			raise PSStoreError( "%s is not a time-series store" % path )
+
+		magic, version, nps, ndates, width, datesOff, valuesOff, codesOff, rowsOff = \
+				HEADER.unpack( self._mm[ :HEADER.size ].tobytes() )
+		if magic != MAGIC or version != VERSION:
+			raise PSStoreError( "%s is not a time-series store" % path )
+
+		self.dates = self._section( datesOff, '<i4', (ndates,) ).astype( 'datetime64[D]' )
+		self.values = self._section( valuesOff, '<f4', (nps, ndates) )
+		self.codes = self._section( codesOff, 'S%d' % width, (nps,) )
+		self.rows = self._section( rowsOff, '<i8', (nps,) )
+
+	def _section(self, offset, dtype, shape):
+		return np.ndarray( shape, dtype=dtype, buffer=self._mm, offset=offset )
+
+	def __len__(self):
+		return len(self.codes)
+
+	def row(self, code):
+		""" return the row of the values matrix for the PS code or None """
+		pos = _findCode( self.codes, code )
+		if pos is None:
+			return
+		return int(self.rows[ pos ])
+
+	def fetch(self, code):
+		""" return the (dates, values) arrays of the PS code, or None if
+		it's not in the store. The values are a view on the file unless
+		some of them are missing """
+		row = self.row( code )
+		if row is None:
+			return
+		values = self.values[ row ]
+		valid = ~np.isnan( values )
+		if valid.all():
+			return self.dates, values
+		return self.dates[ valid ], values[ valid ]
+
+
+def writeStore(path, codes, dates, values):
+	""" write a .psts file, values is a N_ps x N_dates matrix whose rows
+	follow codes and columns follow dates """
+	codes = np.array( [ str(c).encode( 'utf-8' ) for c in codes ] )
+	days = decodeDates( dates ).astype( np.int64 ).astype( '<i4' )
+	values = np.asarray( values, dtype='<f4' )
+	if values.shape != (len(codes), len(days)):
+		raise PSStoreError( "values must be a %d x %d matrix" % (len(codes), len(days)) )
+
+	order = np.argsort( codes, kind='stable' )
+	sortedCodes = codes[ order ]
+	rows = order.astype( '<i8' )
+
+	datesOff = _align( HEADER.size )
+	valuesOff = _align( datesOff + days.nbytes )
+	codesOff = _align( valuesOff + values.nbytes )
+	rowsOff = _align( codesOff + sortedCodes.nbytes )
+
+	with open( path, 'wb' ) as f:
+		f.write( HEADER.pack( MAGIC, VERSION, len(codes), len(days), sortedCodes.dtype.itemsize,
+				datesOff, valuesOff, codesOff, rowsOff ) )
+		for offset, arr in ( (datesOff, days), (valuesOff, values), (codesOff, sortedCodes), (rowsOff, rows) ):
+			f.seek( offset )
+			f.write( np.ascontiguousarray( arr ).tobytes() )
+
+
+class StoreWriter:
+	""" write a .psts file one PS at a time, the codes must be added in
+	ascending order and the dates of all of them must be known. The dates
+	a PS has no value for are NaN, a PS can't have a date twice """
+
+	def __init__(self, path, dates, bufferRows=4096):
+		self.path = path
+		self.days = np.unique( decodeDates( dates ).astype( np.int64 ) ).astype( '<i4' )
+		self.bufferRows = bufferRows
+
+		self.codes = []
+		self._buffer = []
+
+		self.datesOff = _align( HEADER.size )
+		self.valuesOff = _align( self.datesOff + self.days.nbytes )
+		self._written = 0
+
+		self._file = open( path, 'wb' )
+
+	def add(self, code, dates, values):
+		""" add the series of a PS, dates are days since 1970 """
+		if self.codes and code <= self.codes[-1]:
+			raise PSStoreError( "codes must be added in ascending order" )
+		dates = np.asarray( dates, dtype=np.int64 )
+		pos = np.searchsorted( self.days, dates )
+		if len(pos) and (pos.max() >= len(self.days) or np.any( self.days[ np.minimum( pos, len(self.days) - 1 ) ] != dates )):
+			raise PSStoreError( "dates of %s are not in the store" % code )
+		if len(pos) > 1 and np.any( np.diff( np.sort( pos ) ) == 0 ):
+			raise PSStoreError( "dates of %s are repeated, they can be stored in an archive (.psa)" % code )
+
+		row = np.full( len(self.days), np.nan, dtype='<f4' )
+		row[ pos ] = values
+		self.codes.append( code )
+		self._buffer.append( row )
+		if len(self._buffer) >= self.bufferRows:
+			self._flush()
+
+	def _flush(self):
+		if not self._buffer:
+			return
+		self._file.seek( self.valuesOff + self.days.nbytes * self._written )
+		self._file.write( np.vstack( self._buffer ).tobytes() )
+		self._written += len(self._buffer)
+		self._buffer = []
+
+	def close(self):
+		self._flush()
+
+		codes = np.array( self.codes, dtype='S' ) if self.codes else np.array( [], dtype='S1' )
+		rows = np.arange( len(codes), dtype='<i8' )
+		codesOff = _align( self.valuesOff + self.days.nbytes * len(codes) )
+		rowsOff = _align( codesOff + codes.nbytes )
+
+		for offset, arr in ( (self.datesOff, self.days), (codesOff, codes), (rowsOff, rows) ):
+			self._file.seek( offset )
+			self._file.write( arr.tobytes() )
+
+		self._file.seek( 0 )
+		self._file.write( HEADER.pack( MAGIC, VERSION, len(codes), len(self.days), max(1, codes.dtype.itemsize),
+				self.datesOff, self.valuesOff, codesOff, rowsOff ) )
+		self._file.close()
+
+
+class PSArchive:
+	""" read-only access to a .psa file through numpy.memmap, the series of
+	a PS are contiguous slices of the dates and values arrays """
+
+	def __init__(self, path):
+		self.path = path
+		self._mm = np.memmap( path, dtype=np.uint8, mode='r' )
+		if len(self._mm) < HEADER.size:
+			raise PSStoreError( "%s is not a time-series archive" % path )
+
+		magic, version, nps, nrows, width, datesOff, valuesOff, codesOff, offsetsOff = \
+				HEADER.unpack( self._mm[ :HEADER.size ].tobytes() )
+		if magic != ARCHIVE_MAGIC or version not in (1, ARCHIVE_VERSION):
+			raise PSStoreError( "%s is not a time-series archive" % path )
+
+		self.version = version
+		self.codes = self._section( codesOff, 'S%d' % width, (nps,) )
+		self.offsets = self._section( offsetsOff, '<i8', (nps+1,) )
+		if version == 1:
+			self.precision = None
+			self.starts = None
+			self.dates = self._section( datesOff, '<i4', (nrows,) )
+			self.values = self._section( valuesOff, '<f4', (nrows,) )
+			return
+
+		self.precision, valueSize, startsOff = CODEC.unpack( self._mm[ HEADER.size:HEADER.size + CODEC.size ].tobytes() )
+		self.starts = self._section( startsOff, '<i4', (nps,) )
+		self.dates = self._section( datesOff, '<u2', (nrows,) )
+		self.values = self._section( valuesOff, _VALUE_DTYPES[ valueSize ], (nrows,) )
+
+	def _section(self, offset, dtype, shape):
+		return np.ndarray( shape, dtype=dtype, buffer=self._mm, offset=offset )
+
+	def __len__(self):
+		return len(self.codes)
+
+	def fetch(self, code):
+		""" return the (dates, values) arrays of the PS code, or None if
+		it's not in the archive. The values are a view on the file """
+		pos = _findCode( self.codes, code )
+		if pos is None:
+			return
+		start, end = self.offsets[ pos ], self.offsets[ pos+1 ]
+		if self.version == 1:
+			return self.dates[ start:end ].astype( 'datetime64[D]' ), self.values[ start:end ]
+
+		values = self.values[ start:end ]
+		if values.dtype.kind != 'f':
+			values = dequantize( values, self.precision )
+		if end == start:
+			return np.array( [], dtype='datetime64[D]' ), values
+		return decodeDays( self.starts[ pos ], self.dates[ start+1:end ] ), values
+
+
+class ArchiveWriter:
+	""" write a .psa file one PS at a time, the codes must be added in
+	ascending order and the total number of rows must be known. Values
+	are quantized when valueDtype is int16 or int32 (see ts_codec) """
+
+	def __init__(self, path, nrows, valueDtype=None, precision=PRECISION, bufferRows=1 << 20):
+		self.path = path
+		self.nrows = nrows
+		self.valueDtype = np.dtype( valueDtype or '<f4' ).newbyteorder( '<' )
+		self.precision = precision
+		self.bufferRows = bufferRows
+
+		self.codes = []
+		self.offsets = [ 0 ]
+		self.starts = []
+		self._buffer = []
+		self._buffered = 0
+
+		self.datesOff = _align( HEADER.size + CODEC.size )
+		self.valuesOff = _align( self.datesOff + 2 * nrows )
+		self._written = 0
+
+		self._file = open( path, 'wb' )
+
+	def add(self, code, dates, values):
+		""" add the series of a PS, dates are sorted days since 1970 """
+		if self.codes and code <= self.codes[-1]:
+			raise PSStoreError( "codes must be added in ascending order" )
+		dates = np.asarray( dates, dtype=np.int64 )
+		deltas = np.diff( dates, prepend=dates[:1] )
+		if len(deltas) and (deltas.min() < 0 or deltas.max() > 0xffff):
+			raise PSStoreError( "dates of %s are not sorted" % code )
+
+		self.codes.append( code )
+		self.offsets.append( self.offsets[-1] + len(dates) )
+		self.starts.append( dates[0] if len(dates) else 0 )
+		if self.offsets[-1] > self.nrows:
+			raise PSStoreError( "more rows than expected" )
+
+		if self.valueDtype.kind != 'f':
+			values = quantize( values, self.valueDtype, self.precision )
+		self._buffer.append( (deltas, values) )
+		self._buffered += len(dates)
+		if self._buffered >= self.bufferRows:
+			self._flush()
+
+	def _flush(self):
+		if not self._buffer:
+			return
+		dates = np.concatenate( [ d for d, v in self._buffer ] ).astype( '<u2' )
+		values = np.concatenate( [ v for d, v in self._buffer ] ).astype( self.valueDtype )
+
+		self._file.seek( self.datesOff + 2 * self._written )
+		self._file.write( dates.tobytes() )
+		self._file.seek( self.valuesOff + self.valueDtype.itemsize * self._written )
+		self._file.write( values.tobytes() )
+
+		self._written += len(dates)
+		self._buffer = []
+		self._buffered = 0
+
+	def close(self):
+		self._flush()
+		if self.offsets[-1] != self.nrows:
+			self._file.close()
+			raise PSStoreError( "%d rows written, %d expected" % (self.offsets[-1], self.nrows) )
+
+		codes = np.array( self.codes, dtype='S' ) if self.codes else np.array( [], dtype='S1' )
+		offsets = np.array( self.offsets, dtype='<i8' )
+		starts = np.array( self.starts, dtype='<i4' )
+		codesOff = _align( self.valuesOff + self.valueDtype.itemsize * self.nrows )
+		offsetsOff = _align( codesOff + codes.nbytes )
+		startsOff = _align( offsetsOff + offsets.nbytes )
+
+		for offset, arr in ( (codesOff, codes), (offsetsOff, offsets), (startsOff, starts) ):
+			self._file.seek( offset )
+			self._file.write( arr.tobytes() )
+
+		valueSize = 0 if self.valueDtype.kind == 'f' else self.valueDtype.itemsize
+		self._file.seek( 0 )
+		self._file.write( HEADER.pack( ARCHIVE_MAGIC, ARCHIVE_VERSION, len(codes), self.nrows, max(1, codes.dtype.itemsize),
+				self.datesOff, self.valuesOff, codesOff, offsetsOff ) )
+		self._file.write( CODEC.pack( self.precision, valueSize, startsOff ) )
+		self._file.close()
@@ -29,9 +29,9 @@ from qgis.PyQt.QtGui import QIcon
 from qgis.core import QgsFeature, QgsFeatureRequest, QgsSettings
 
 import numpy as np
-from matplotlib.dates import date2num
 
 from .plot_wdg import PlotDlg, PlotWdg, NavigationToolbar
+from .ts_fit import FitCache, polyFit, splineFit, splineEval
 from . import resources_rc
 
 from .graph_settings_dialog import GraphSettings_Dlg
@@ -138,15 +138,22 @@ class PlotGraph(PlotWdg):
 	def __init__(self, *args, **kwargs):
 		PlotWdg.__init__(self,	*args, **kwargs)
 
-		self._origY = None
 		self._showDetrendedValues = False
 
+		# the fits are computed once for each version of the data, the
+		# overlays are toggled and restyled without computing them again
+		self._fits = FitCache()
+
+		# the artists are created the first time they're shown, then their
+		# data is updated in place and they're hidden instead of removed.
+		# All but the points are overlays (see PlotWdg.scheduleRedraw)
 		self._points = None
 		self._lines = None
 		self._smoothLines = None
 		self._trendLines = {}
 		self._upReplica = None
 		self._downReplica = None
+		self._replicaDist = None
 
 		self.updateSettings()
 
@@ -164,65 +171,107 @@ class PlotGraph(PlotWdg):
 		self._titleSettings = settingsToDict( settings.value("/pstimeseries/titleProps", {'fontsize':'large'}) )
 		self._labelsSettings = settingsToDict( settings.value("/pstimeseries/labelsProps", {'fontsize':'medium'}) )
 
-	def _plot(self):
-		if self._showDetrendedValues:
-			self._origY = self.y
-			self.y = np.array( self.y ) - np.array( self._getTrendLineData()[1] )
+		# the artists are created again with the new settings
+		for artist in [ self._points, self._lines, self._smoothLines, self._upReplica, self._downReplica ] + list(self._trendLines.values()):
+			if artist is not None:
+				self._removeItem( artist )
+		self._forgetArtists()
 
-		elif self._origY is not None:
-			self.y = self._origY
-			self._origY = None
+	def _forgetArtists(self):
+		self._points = None
+		self._lines = None
+		self._smoothLines = None
+		self._trendLines = {}
+		self._upReplica = None
+		self._downReplica = None
 
-		# remove and re-draw points
-		self._removeItem( self._points )
-		self._points = self._callPlotFunc('scatter', self.x, self.y, **self._pointsSettings)
-		self.collections.append( self._points )
+	def _clear(self):
+		PlotWdg._clear(self)
+		self._forgetArtists()
 
-		# update lines related to the main plot
-		self.displayLines( bool(self._lines) )
-		for grade in self._trendLines:
-			self.displayTrendLine( True, grade )
-		self.displaySmoothLines( bool(self._smoothLines) )
+	@staticmethod
+	def _isShown(artist):
+		return artist is not None and artist.get_visible()
 
-	def displayLines(self, show=True):
-		# destroy the lines
-		if self._lines:
-			self._removeItem( self._lines )
-			self._lines = None
+	def _plot(self):
+		# update the points, creating them the first time
+		y = self._displayedValues()
+		if self._points is None:
+			self._points = self._callPlotFunc('scatter', self.x, y, **self._pointsSettings)
+			self.collections.append( self._points )
+		else:
+			offsets = np.column_stack( (self.xNum, y) )
+			if self._xIsDate:
+				self._setAxisDateFormatter( self.axes.xaxis, self.xNum )
+			self._setItemData( self._points, self.xNum, y )
+			self.axes.update_datalim( offsets )
 
-		if show:
-			lim = self.getLimits()
+		# update lines related to the main plot
+		self.displayLines( self._isShown( self._lines ) )
+		for grade, line in list(self._trendLines.items()):
+			if line.get_visible():
+				self.displayTrendLine( True, grade )
+		self.displaySmoothLines( self._isShown( self._smoothLines ) )
+		if self._replicaDist is not None:
+			self.setReplicas( self._replicaDist, (self._isShown( self._upReplica ), self._isShown( self._downReplica )) )
 
-			self._lines = self._callPlotFunc('plot', self.x, self.y, **self._linesSettings)
-			self.collections.append( self._lines )
+		self.scheduleRedraw()
 
-			self.setLimits( *lim )
+	def displayLines(self, show=True):
+		x, y = (self.xNum, self._displayedValues()) if show else (None, None)
+		self._lines = self._updateOverlay( self._lines, show, 'plot', x, y, **self._linesSettings )
+		self.scheduleRedraw( overlays=True )
+
+	def _fitVersion(self, detrended=None):
+		# the fits of the detrended values differ from the original ones
+		if detrended is None:
+			detrended = self._showDetrendedValues
+		return ( self.dataVersion, detrended )
+
+	def _displayedValues(self, detrended=None):
+		# the values as displayed, the original ones or those detrended
+		if detrended is None:
+			detrended = self._showDetrendedValues
+		if not detrended:
+			return self.yNum
+		return self._fits.get( self._fitVersion( True ), 'detrended', (),
+				lambda: self.yNum - self._getTrendLineData( 1, False )[1] )
+
+	def _getTrendLineData(self, d=1, detrended=None):
+		# the polynomial fit of grade d of the values as displayed, or of
+		# the original ones when detrended is False
+		version = self._fitVersion( detrended )
+		y = self._displayedValues( version[1] )
+		return self.xNum, self._fits.get( version, 'poly', (d,), lambda: polyFit( self.xNum, y, d ) )
+
+	def _getSmoothLineData(self):
+		# the spline of the values, evaluated at about one point for each
+		# pixel column the series spans. None if it can't be computed
+		x = self.xNum
+		version = self._fitVersion()
+		tck = self._fits.get( version, 'spline', (), lambda: splineFit( x, self._displayedValues() ) )
+		if tck is None or len(x) < 2:
+			return
 
-		self.draw()
+		xmin, xmax = float(np.min(x)), float(np.max(x))
+		samples = self._splineSamples( xmin, xmax, len(x) )
+		return self._fits.get( version, 'splev', (samples,), lambda: splineEval( tck, xmin, xmax, samples ) )
 
-	def _getTrendLineData(self, d=1):
-		x = date2num( np.array(self.x) )
-		y = np.array(self.y)
-		p = np.polyfit(x, y, d)
-		return x, np.polyval(p, x)
+	def _splineSamples(self, xmin, xmax, count):
+		# the pixel columns spanned at the current zoom, rounded up so
+		# small resizes reuse the evaluated spline, and between the number
+		# of values and 20 times as many
+		xlim = self.axes.get_xlim()
+		pixels = self.axes.bbox.width * (xmax - xmin) / max(xlim[1] - xlim[0], 1e-9)
+		samples = int(np.ceil( pixels / 64.0 )) * 64
+		return int(np.clip( samples, count, count * 20 ))
 
 	def displayTrendLine(self, show=True, grade=1):
-		# destroy the trend line
-		if grade in self._trendLines:
-			self._removeItem( self._trendLines[grade] )
-			del self._trendLines[ grade ]
-
-		if show:
-			lim = self.getLimits()
-
-			x, y = self._getTrendLineData( grade )
-			trendline = self._callPlotFunc('plot', x, y, **self._trendLineSettings)
-			self.collections.append( trendline )
-			self._trendLines[ grade ] = trendline
-
-			self.setLimits( *lim )
-
-		self.draw()
+		x, y = self._getTrendLineData( grade ) if show else (None, None)
+		line = self._updateOverlay( self._trendLines.get( grade ), show, 'plot', x, y, **self._trendLineSettings )
+		if line is not None:
+			self._trendLines[ grade ] = line
+		self.scheduleRedraw( overlays=True )
 
 	def displayDetrendedValues(self, show):
 		if self._showDetrendedValues == show:
@@ -230,35 +279,18 @@ class PlotGraph(PlotWdg):
 
 		self._showDetrendedValues = show
 		self._plot()
-		self.draw()
 
 	def displaySmoothLines(self, show=True):
-		# destroy the smooth line
-		if self._smoothLines:
-			self._removeItem( self._smoothLines )
-			self._smoothLines = None
-
+		xnew = ynew = None
 		if show:
-			try:
-				from scipy import interpolate
-				x = date2num( np.array(self.x) )
-				y = np.array(self.y)
-
-				tck = interpolate.splrep(x,y)
-				xmin, xmax = np.min(x), np.max(x)
-				xnew = np.arange( xmin, xmax, float(xmax-xmin)/len(x)/20.0 )
-				ynew = interpolate.splev(xnew, tck, der=0)
-			except (ImportError, ValueError):
-				return
-
-			lim = self.getLimits()
-
-			self._smoothLines = self._callPlotFunc('plot', xnew, ynew, **self._linesSettings)
-			self.collections.append( self._smoothLines )
+			series = self._getSmoothLineData()
+			if series is None:
+				show = False
+			else:
+				xnew, ynew = series
 
-			self.setLimits( *lim )
-
-		self.draw()
+		self._smoothLines = self._updateOverlay( self._smoothLines, show, 'plot', xnew, ynew, **self._linesSettings )
+		self.scheduleRedraw( overlays=True )
 
 	def updateTitle(self, title):
 		self.setTitle(title, fontdict=self._titleSettings)
@@ -269,26 +301,18 @@ class PlotGraph(PlotWdg):
 	def setReplicas(self, dist, positions):
 		""" set up and/or down replicas for the graph """
 		up, down = positions
+		self._replicaDist = dist
 
-		if self._upReplica:
-			self._removeItem( self._upReplica )
-			self._upReplica = None
-
-		if up:
-			y = list(map(lambda v: v+dist, self.y))
-			self._upReplica = self._callPlotFunc('scatter', self.x, y, **self._upReplicaSettings)
-			self.collections.append( self._upReplica )
-
-		if self._downReplica:
-			self._removeItem( self._downReplica )
-			self._downReplica = None
+		x = y = None
+		if up or down:
+			x, y = self.xNum, self._displayedValues()
 
-		if down:
-			y = list(map(lambda v: v-dist, self.y))
-			self._downReplica = self._callPlotFunc('scatter', self.x, y, **self._downReplicaSettings)
-			self.collections.append( self._downReplica )
+		self._upReplica = self._updateOverlay( self._upReplica, up, 'scatter',
+				x, y + dist if up else None, **self._upReplicaSettings )
+		self._downReplica = self._updateOverlay( self._downReplica, down, 'scatter',
+				x, y - dist if down else None, **self._downReplicaSettings )
 
-		self.draw()
+		self.scheduleRedraw( overlays=True )
 
 
 from .ui.tool_ps_toolbar_ui import Ui_ToolPSToolBar
@@ -21,11 +21,16 @@ email               : brush.tyler@gmail.com
  ***************************************************************************/
 """
 
-from qgis.PyQt.QtCore import Qt, QRegExp, QDate, QFileInfo, QDir
-from qgis.PyQt.QtGui import QIcon, QCursor
-from qgis.PyQt.QtWidgets import QAction, QInputDialog, QMessageBox, QApplication
+from qgis.PyQt.QtGui import QIcon
+from qgis.PyQt.QtWidgets import QAction, QInputDialog, QMessageBox, QFileDialog
 
-from qgis.core import QgsMapLayer, QgsWkbTypes, QgsFeature, QgsFeatureRequest, QgsMessageLog, QgsDataSourceUri, QgsVectorLayer
+from qgis.core import QgsApplication, QgsTask, QgsProject, QgsMapLayer, QgsWkbTypes, QgsFeature, QgsMessageLog, QgsDataSourceUri, QgsExpression, QgsSettings
+
+import os
+import time
+import sqlite3
+
+import numpy as np
 
 from . import resources_rc
 
@@ -37,11 +42,95 @@ class PSTimeSeries_Plugin:
 		self.featFinder = None
 		self.running = False
 
+		# background fetch in flight and the dialog displaying its result,
+		# canceled tasks are referenced until they actually end
+		self.fetchTask = None
+		self._runningTasks = set()
+		self.dlg = None
+
+		# loads the series of the PS around the clicked one
+		self.prefetcher = None
+
+		# points of the PS layers, to find the nearest PS
+		self.pointIndexes = None
+
 		# used to know where to ask for a new time-series tablename
 		self.last_ps_layerid = None
 		self.ts_tablename = None
 
+		# open time-series layers reused across clicks
+		self.tsLayerPool = None
+
+		# time series already fetched, and the PS layers whose reload
+		# invalidates them
+		self.seriesCache = None
+		self._watchedLayerIds = set()
+
+		# time series kept on disk across sessions, and the versions of
+		# the database tables they're checked against
+		self.diskCache = None
+		self._tableStamps = {}
+
+		# GeoPackage time-series tables found in this session, as (dbpath,
+		# table), so they're looked for once and not on every click
+		self._gpkgTables = set()
+
+		# time-series tables whose index on the code field has been
+		# checked in this session, as (providerType, conninfo, schema, table)
+		self._indexChecked = set()
+
+		# fields of the PS and time-series layers, by layer id
+		self.schemaProfiles = None
+
+		# connections used to query the whole series with one statement,
+		# and the time spent on each kind of lookup
+		self.tsSql = None
+		self.fetchLatency = None
+		self.sqlFetch = True
+
+		# dump to archive conversion running in background
+		self.convertTask = None
+
+		# PostGIS series table build running in background, and the series
+		# tables found older than their TS table in this session, as
+		# (conninfo, schema, table)
+		self.seriesTableTask = None
+		self._staleSeriesTables = set()
+
 	def initGui(self):
+		from .ts_layer_pool import TSLayerPool
+		self.tsLayerPool = TSLayerPool()
+
+		from .schema_profile import SchemaProfileCache
+		self.schemaProfiles = SchemaProfileCache()
+
+		from .ts_sql import TSSqlReader, LatencyStats
+		self.tsSql = TSSqlReader()
+		self.fetchLatency = LatencyStats()
+
+		from .point_index import PointIndexRegistry
+		self.pointIndexes = PointIndexRegistry()
+
+		from .ts_prefetch import TSPrefetcher
+		self.prefetcher = TSPrefetcher( self._prefetchSeries )
+
+		from .ts_cache import SeriesCache
+		# False reads the series through the time-series layer only
+		self.sqlFetch = QgsSettings().value( "/pstimeseries/sqlFetch", True, type=bool )
+
+		cacheSize = QgsSettings().value( "/pstimeseries/seriesCacheSizeMB", 64, type=int )
+		self.seriesCache = SeriesCache( cacheSize * 1024 * 1024 )
+
+		# 0 disables the disk cache
+		diskCacheSize = QgsSettings().value( "/pstimeseries/diskCacheSizeMB", 256, type=int )
+		if diskCacheSize > 0:
+			from .ts_disk_cache import DiskSeriesCache
+			path = os.path.join( QgsApplication.qgisSettingsDirPath(), "pstimeseries", "series_cache.sqlite" )
+			try:
+				self.diskCache = DiskSeriesCache( path, diskCacheSize * 1024 * 1024 )
+			except (sqlite3.Error, EnvironmentError) as e:
+				QgsMessageLog.logMessage( "unable to open the disk cache %s: %s" % (path, e), "PSTimeSeriesViewer" )
+
 		# create the actions
 		self.action = QAction( QIcon( ":/pstimeseries_plugin/icons/logo" ), "PS Time Series Viewer", self.iface.mainWindow() )
 		self.action.triggered.connect( self.run )
@@ -50,23 +139,235 @@ class PSTimeSeries_Plugin:
 		self.aboutAction = QAction( QIcon( ":/pstimeseries_plugin/icons/about" ), "About", self.iface.mainWindow() )
 		self.aboutAction.triggered.connect( self.about )
 
+		self.convertAction = QAction( "Convert time-series dump...", self.iface.mainWindow() )
+		self.convertAction.triggered.connect( self.convertDump )
+
+		self.seriesTableAction = QAction( "Build PostGIS series table...", self.iface.mainWindow() )
+		self.seriesTableAction.triggered.connect( self.buildSeriesTable )
+
+		self.clearCacheAction = QAction( "Clear time-series cache", self.iface.mainWindow() )
+		self.clearCacheAction.triggered.connect( self.clearCache )
+
 		# add actions to toolbars and menus
 		self.iface.addToolBarIcon( self.action )
 		self.iface.addPluginToMenu( "&Permanent Scatterers", self.action )
+		self.iface.addPluginToMenu( "&Permanent Scatterers", self.convertAction )
+		self.iface.addPluginToMenu( "&Permanent Scatterers", self.seriesTableAction )
+		self.iface.addPluginToMenu( "&Permanent Scatterers", self.clearCacheAction )
 		#self.iface.addPluginToMenu( "&Permanent Scatterers", self.aboutAction )
 
 	def unload(self):
+		self._cancelFetch()
+		if self.prefetcher is not None:
+			self.prefetcher.cancel()
+			self.prefetcher = None
+		if self.dlg is not None:
+			self.dlg.close()
+			self.dlg.deleteLater()
+			self.dlg = None
+
 		# remove actions from toolbars and menus
 		self.iface.removeToolBarIcon( self.action )
 		self.iface.removePluginMenu( "&Permanent Scatterers", self.action )
+		self.iface.removePluginMenu( "&Permanent Scatterers", self.convertAction )
+		self.iface.removePluginMenu( "&Permanent Scatterers", self.seriesTableAction )
+		self.iface.removePluginMenu( "&Permanent Scatterers", self.clearCacheAction )
 		#self.iface.removePluginMenu( "&Permanent Scatterers", self.aboutAction )
 
+		# close the open time-series layers
+		if self.tsLayerPool is not None:
+			self.tsLayerPool.close()
+			self.tsLayerPool = None
+
+		if self.seriesCache is not None:
+			QgsMessageLog.logMessage( "series cache: %(hits)d hits, %(misses)d misses" % self.seriesCache.stats(), "PSTimeSeriesViewer" )
+			self.seriesCache.clear()
+			self.seriesCache = None
+
+		if self.diskCache is not None:
+			QgsMessageLog.logMessage( "disk cache: %(hits)d hits, %(misses)d misses, %(errors)d errors" % self.diskCache.stats(), "PSTimeSeriesViewer" )
+			self.diskCache.close()
+			self.diskCache = None
+
+		if self.schemaProfiles is not None:
+			self.schemaProfiles.clear()
+			self.schemaProfiles = None
+
+		if self.tsSql is not None:
+			self.tsSql.close()
+			self.tsSql = None
+
+		if self.fetchLatency is not None:
+			summary = self.fetchLatency.summary()
+			if summary:
+				QgsMessageLog.logMessage( "time-series lookups: %s" % summary, "PSTimeSeriesViewer" )
+			self.fetchLatency = None
+
+		if self.pointIndexes is not None:
+			self.pointIndexes.close()
+			self.pointIndexes = None
+
+		if self.convertTask is not None:
+			self.convertTask.cancel()
+			self.convertTask = None
+
+		if self.seriesTableTask is not None:
+			self.seriesTableTask.cancel()
+			self.seriesTableTask = None
+
+		from .ps_store import closeStores
+		closeStores()
+
+		from .dbf_reader import closeDbfs
+		closeDbfs()
+
+		from .csv_index import closeCsvIndexes
+		closeCsvIndexes()
+
 	def about(self):
 		""" display the about dialog """
 		from .about_dlg import AboutDlg
 		dlg = AboutDlg( self.iface.mainWindow() )
 		dlg.exec_()
 
+	def clearCache(self):
+		""" drop the time series fetched so far, from memory and disk """
+		if self.seriesCache is not None:
+			self.seriesCache.clear()
+		if self.diskCache is not None:
+			try:
+				self.diskCache.clear()
+			except sqlite3.Error as e:
+				QgsMessageLog.logMessage( "unable to clear the disk cache: %s" % e, "PSTimeSeriesViewer" )
+		self._tableStamps.clear()
+		self.iface.mainWindow().statusBar().showMessage( "Time-series cache cleared", 3000 )
+
+	def buildSeriesTable(self):
+		""" create the PostGIS table holding the series of the selected PS
+		layer as arrays, one row per PS, or refresh the PS which got new
+		acquisitions since it was built """
+		from .ts_sql import TSSqlReader
+		layer = self.iface.activeLayer()
+		if layer is None or layer.type() != QgsMapLayer.VectorLayer or layer.providerType() != 'postgres':
+			QMessageBox.information( self.iface.mainWindow(), "PS Time Series Viewer", "Select a PostGIS PS layer and try again." )
+			return
+		if not TSSqlReader.isAvailable( 'postgres' ):
+			QMessageBox.warning( self.iface.mainWindow(), "PS Time Series Viewer", "The psycopg2 module is needed to build the series table." )
+			return
+		if self.seriesTableTask is not None:
+			QMessageBox.information( self.iface.mainWindow(), "PS Time Series Viewer", "The series table is already being built." )
+			return
+
+		dsuri = QgsDataSourceUri( layer.source() )
+		if not self._askTStablename( layer, "ts_%s" % dsuri.table() ):
+			return
+
+		self._startSeriesTableTask( dsuri.connectionInfo( True ), dsuri.schema(), self.ts_tablename )
+
+	def _startSeriesTableTask(self, conninfo, schema, tblname):
+		# utility function used to build or refresh the series table of the
+		# TS table in background
+		from .ts_sql import seriesTableName
+		from .pg_series_table import SeriesTableBuilder, SeriesTableTask
+		builder = SeriesTableBuilder( conninfo, schema, tblname, "dataripresa", "valore" )
+		task = SeriesTableTask( builder )
+
+		def finished():
+			self.seriesTableTask = None
+			if task.stats is None:
+				QMessageBox.warning( self.iface.mainWindow(), "PS Time Series Viewer",
+						"Unable to build the table %s:\n%s" % (seriesTableName( builder.table ), task.exception or "canceled") )
+				return
+
+			# the series are read from the new table from now on
+			if self.tsSql is not None:
+				self.tsSql.forgetSeriesTables()
+			self._staleSeriesTables.discard( (conninfo, schema, tblname) )
+			verb = "built" if task.stats['mode'] == 'build' else "refreshed"
+			QgsMessageLog.logMessage( "%s %s: %d PS" % (seriesTableName( builder.table ), verb, task.stats['codes']), "PSTimeSeriesViewer" )
+			self.iface.mainWindow().statusBar().showMessage( "Series table %s, %d PS %s" % (seriesTableName( builder.table ), task.stats['codes'], verb), 5000 )
+
+		task.taskCompleted.connect( finished )
+		task.taskTerminated.connect( finished )
+		self.seriesTableTask = task
+		QgsApplication.taskManager().addTask( task )
+
+	def _adviseSeriesTableRefresh(self):
+		# utility function used to offer the refresh of the series tables
+		# found older than their TS table, which are not read meanwhile.
+		# It's asked once per session for each table
+		from .ts_sql import seriesTableName
+		if self.tsSql is None:
+			return
+		for key in self.tsSql.popStaleSeriesTables() - self._staleSeriesTables:
+			self._staleSeriesTables.add( key )
+			conninfo, schema, tblname = key
+			QgsMessageLog.logMessage( "%s is older than %s, the series are read from %s until it's refreshed" % (
+					seriesTableName( tblname ), tblname, tblname ), "PSTimeSeriesViewer" )
+			if self.seriesTableTask is not None:
+				continue
+
+			answer = QMessageBox.question( self.iface.mainWindow(),
+					"PS Time Series Viewer",
+					"The table '%s' has changed since its series table '%s' was built, so the "
+					"series are read from '%s' instead.\n\nRefresh the series table now? "
+					"It runs in background and can be canceled from the task manager." % (
+					tblname, seriesTableName( tblname ), tblname ),
+					QMessageBox.Yes | QMessageBox.No )
+			if answer == QMessageBox.Yes:
+				self._startSeriesTableTask( conninfo, schema, tblname )
+
+	def convertDump(self):
+		""" convert a long-format time-series dump to an archive the plugin
+		reads the time series from """
+		if self.convertTask is not None:
+			QMessageBox.information( self.iface.mainWindow(), "PS Time Series Viewer", "A conversion is already running." )
+			return
+
+		src, _ = QFileDialog.getOpenFileName( self.iface.mainWindow(), "Select the time-series dump", "",
+				"Time-series dumps (*.txt *.tsv *.csv);;All files (*)" )
+		if not src:
+			return
+		dst, selected = QFileDialog.getSaveFileName( self.iface.mainWindow(), "Save the time-series archive as",
+				"%s.psa" % os.path.splitext( src )[0],
+				"PS time-series archives (*.psa);;PS time-series stores, for PS sharing the same dates (*.psts)" )
+		if not dst:
+			return
+		# the format is that of the extension, or of the selected filter
+		if os.path.splitext( dst )[1].lower() not in ('.psa', '.psts'):
+			dst += ".psts" if "*.psts" in selected else ".psa"
+
+		# the archive will be used for the PS layer selected now
+		layer = self.iface.activeLayer()
+		layerid = layer.id() if layer is not None and layer.type() == QgsMapLayer.VectorLayer else None
+
+		def convert(task):
+			from .ts_convert import convertDump
+			return convertDump( src, dst, progress=task.setProgress, isCanceled=task.isCanceled )
+
+		def finished(exception, stats=None):
+			self.convertTask = None
+			if exception is not None or stats is None:
+				QMessageBox.warning( self.iface.mainWindow(), "PS Time Series Viewer",
+						"Unable to convert %s\n\n%s" % (src, exception or "conversion canceled") )
+				return
+
+			from .ts_convert import formatStats
+			report = formatStats( stats )
+			QgsMessageLog.logMessage( "%s: %s" % (src, report), "PSTimeSeriesViewer" )
+
+			layer = QgsProject.instance().mapLayer( layerid ) if layerid else None
+			if layer is not None and QMessageBox.question( self.iface.mainWindow(), "PS Time Series Viewer",
+					"%s\n\nRead the time series of the layer \"%s\" from the archive?" % (report, layer.name()),
+					QMessageBox.Yes | QMessageBox.No ) == QMessageBox.Yes:
+				layer.setCustomProperty( "pstimeseries/store", dst )
+			elif layer is None:
+				QMessageBox.information( self.iface.mainWindow(), "PS Time Series Viewer", report )
+
+		self.convertTask = QgsTask.fromFunction( "PS Time Series Viewer: converting %s" % os.path.basename( src ),
+				convert, on_finished=finished )
+		QgsApplication.taskManager().addTask( self.convertTask )
+
 	def run(self):
 		# create a maptool to select a point feature from the canvas
 		if not self.featFinder:
@@ -85,187 +386,453 @@ class PSTimeSeries_Plugin:
 			QMessageBox.information(self.iface.mainWindow(), "PS Time Series Viewer", "Select a vector layer and try again.")
 			return
 
-		# set the waiting cursor
-		QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
-		try:
-			dlg = self._onPointClicked( layer, point )
-		finally:
-			# restore the cursor
-			QApplication.restoreOverrideCursor()
+		# a newer click replaces the fetch still in flight, and the
+		# prefetch must not slow it down
+		self._cancelFetch()
+		self.prefetcher.cancel()
 
-		if dlg:
-			dlg.exec_()
+		job = self._onPointClicked( layer, point )
 
+		# keep the maptool enabled, so the canvas stays usable while fetching
 		self.run()
+		if job is None:
+			return
+
+		# look for the PS and fetch its time series in background, the
+		# plot is displayed as soon as the data arrives
+		from .ts_fetch_task import TSFetchTask
+		self.fetchTask = TSFetchTask( job, self._fetchSeries, self._onSeriesFetched )
+		self._runningTasks.add( self.fetchTask )
+		QgsApplication.taskManager().addTask( self.fetchTask )
+		self.iface.mainWindow().statusBar().showMessage( "Loading time series..." )
+
+	def _cancelFetch(self):
+		if self.fetchTask is None:
+			return
+		try:
+			self.fetchTask.cancel()
+		except RuntimeError:
+			pass	# the task was already deleted
+		self.fetchTask = None
 
 	def _onPointClicked(self, ps_layer, point):
-		# get the id of the point feature under the mouse click
+		# collect in the main thread what's needed to look for the clicked
+		# feature and to fetch its time series
 		from .MapTools import FeatureFinder
-		fid = FeatureFinder.findAtPoint(ps_layer, point, canvas=self.iface.mapCanvas(), onlyTheClosestOne=True, onlyIds=True)
-		if fid is None:
+		from .ts_fetch_task import TSFetchJob
+		from .ts_backends import findBackend, FeatureBackend
+		job = TSFetchJob( ps_layer, FeatureFinder.searchRect( ps_layer, point, self.iface.mapCanvas() ) )
+
+		job.psProfile = ps_profile = self.schemaProfiles.profile( ps_layer )
+		self._watchLayer( ps_layer )
+		self.pointIndexes.watch( ps_layer )
+		self.pointIndexes.build( ps_layer.id(), job.psSource )
+		job.pointIndexes = self.pointIndexes
+
+		# the backend reading the kind of source of the time series, a
+		# binary store of the layer first
+		providerType = ps_layer.providerType()
+		source = self._findStore( ps_layer ) or ps_layer.source()
+		backendClass = findBackend( providerType, source )
+		if backendClass is None:
+			QMessageBox.warning( self.iface.mainWindow(),
+					"PS Time Series Viewer",
+					"Time series are not supported for the '%s' data source." % providerType )
 			return
 
-		# get the attribute map of the selected feature
-		feat = QgsFeature()
-		feats = ps_layer.getFeatures( QgsFeatureRequest(fid) )
-		feats.nextFeature(feat)
-		attrs = feat.attributes()
+		# fields containing values, and those needed to join PS and TS
+		# tables. When the values are stored within the PS features, info
+		# fields are all except those containing dates
+		job.keyFields = list(backendClass.keyFields)
+		job.dateField = backendClass.dateField
+		job.valueField = backendClass.valueField
+		job.infoFields = ps_profile.allFields() if job.keyFields else ps_profile.infoFields
 
-		x, y = [], []	# lists containg x,y values
-		infoFields = {}	# hold the index->name of the fields containing info to be displayed
-
-		ps_source = ps_layer.source()
-		ps_fields = ps_layer.dataProvider().fields()
+		# each kind of source has its own time-series table
+		if not backendClass.setupJob( self, job, ps_layer, source ):
+			return
 
-		providerType = ps_layer.providerType()
-		uri = ps_source
-		subset = ""
-
-		if providerType == 'ogr' and ps_source.lower().endswith( ".shp" ):
-			# Shapefile
-			for idx, fld in enumerate(ps_fields):
-				if QRegExp( "D\\d{8}", Qt.CaseInsensitive ).indexIn( fld.name() ) < 0:
-					# info fields are all except those containing dates
-					infoFields[ idx ] = fld
-				else:
-					x.append( QDate.fromString( fld.name()[1:], "yyyyMMdd" ).toPyDate() )
-					y.append( float(attrs[ idx ]) )
-
-		elif providerType == 'ogr' and (ps_source.upper().startswith("OCI:") or ps_source.lower().endswith(".vrt")):	# Oracle Spatial
-
-			# fields containing values
-			dateField = "data_misura"
-			valueField = "spost_rel_mm"
-			infoFields = dict(enumerate(ps_fields))
-
-			# search for the id_dataset and code_target fields needed to join
-			# PS and TS tables
-			idDataset = codeTarget = None
-			for idx, fld in enumerate(ps_fields):
-				if fld.name().lower() == "id_dataset":
-					idDataset = attrs[ idx ]
-				if fld.name().lower() == "code_target":
-					codeTarget = attrs[ idx ]
-
-			if idDataset is None or codeTarget is None:
-				QgsMessageLog.logMessage( "idDataset is %s, codeTarget is %s. Exiting" % (idDataset, codeTarget), "PSTimeSeriesViewer" )
+		if backendClass.tsLayer:
+			# get the layer containing time series
+			ts_layer = self._createTSlayer( ps_layer, job.uri, providerType )
+			if ts_layer is None:
 				return
-			subset = "id_dataset='%s' AND code_target='%s'" % (idDataset, codeTarget)
 
-			# create the uri
-			if ps_source.upper().startswith( "OCI:" ):
-				default_tbl_name = "RISKNAT.RNAT_TARGET_SSTO"
-			elif ps_source.lower().endswith(".vrt"):
-				default_tbl_name = "rnat_target_sso.vrt"
-			else:
-				default_tbl_name = ""
-			if not self._askTStablename( ps_layer,  default_tbl_name ):
-				return
+			job.tsTable = self.ts_tablename
+			job.setTSLayer( ts_layer, self.schemaProfiles.profile( ts_layer ) )
 
-			if ps_source.upper().startswith( "OCI:" ):
-				# uri is like OCI:userid/password@database:table
-				pos = uri.indexOf(':', 4)
-				if pos >= 0:
-					uri = uri[0:pos]
-				uri = "%s:%s" % (uri, self.ts_tablename)
-			else:
-				# it's a VRT file
-				uri = "%s/%s" % (QFileInfo(ps_source).path(), self.ts_tablename)
-				uri = QDir.toNativeSeparators( uri )
+			# its features are read when the backend can't read the series
+			if not isinstance(job.backend, FeatureBackend):
+				job.fallback = FeatureBackend( job.featureRows, job.keyFields, job.uri )
 
-			# load the layer containing time series
-			ts_layer = self._createTSlayer( uri, providerType, subset )
-			if ts_layer is None:
-				return
+		return job
+
+	def _fetchSeries(self, task, job):
+		# look for the clicked feature and get its time series, it runs
+		# in a worker thread so it must not touch layers and widgets
+		from .MapTools import FeatureFinder
+		# the rect query answers until the index is built in background
+		index = job.pointIndex( wait=False )
+		fid = FeatureFinder.findInRect( job.psSource, job.rect, onlyTheClosestOne=True, onlyIds=True, index=index )
+		if fid is None or task.isCanceled():
+			return
+
+		if not job.keyFields and job.backend is not None and self._readFeatureSeries( job, fid ):
+			return
+
+		# get the attribute map of the selected feature
+		feat = QgsFeature()
+		feats = job.psSource.getFeatures( job.attributesRequest( [fid] ) )
+		feats.nextFeature(feat)
+		attrs = feat.attributes()
+		job.fid = fid
+
+		if not job.keyFields:
+			# the values are stored within the PS feature, in the fields
+			# whose names are the dates
+			job.x = job.psProfile.dates
+			job.y = np.array( [ attrs[ idx ] for idx in job.psProfile.dateIndexes ], dtype=np.float64 )
+			return
+
+		keys = [ self._attrValue( job.psProfile, attrs, name ) for name in job.keyFields ]
+		if None in keys:
+			QgsMessageLog.logMessage( "%s is %s. Exiting" % (", ".join(job.keyFields), keys), "PSTimeSeriesViewer" )
+			return
+		job.subset = self._keysSubset( job, keys )
+
+		start = time.perf_counter()
+		series = self._fetchKeySeries( task, job, keys, self.tsSql )
+		if series is not None:
+			job.x, job.y = series
+			QgsMessageLog.logMessage( "time series of %s read in %.1f ms" % (", ".join( str(k) for k in keys ),
+					1000.0 * (time.perf_counter() - start)), "PSTimeSeriesViewer" )
+
+	def _readFeatureSeries(self, job, fid):
+		# get the values of the PS by its feature id, from the .dbf record
+		# of the shapefile. Return False to read the feature instead
+		from .ts_backends import TSBackendError
+		try:
+			job.x, job.y = job.backend.fetch( fid )
+		except TSBackendError as e:
+			QgsMessageLog.logMessage( "unable to read the %s: %s" % (job.backend.label, e), "PSTimeSeriesViewer" )
+			return False
+		job.fid = fid
+		return True
 
-			# get time series X and Y values
+	@staticmethod
+	def _seriesCode(keys):
+		# utility function used to get the code of the PS within backends
+		# and caches, a tuple of the key values when there are several
+		return keys[0] if len(keys) == 1 else tuple(keys)
+
+	def _fetchKeySeries(self, task, job, keys, tsSql):
+		# get time series X and Y values of the PS identified by the key
+		# field values, unless they were already fetched
+		code = self._seriesCode( keys )
+		if not job.backend.cached:
+			return self._backendFetch( task, job, [code], tsSql )[0][ code ]
+
+		key = ( job.source, job.tsTable, code )
+		series = self._getCachedXYvalues( key )
+		if series is not None:
+			return series
+
+		# fetched in a previous session, if the table hasn't changed since
+		stamp = self._tableStamp( job, tsSql ) if self.diskCache is not None else None
+		if stamp is not None:
+			series = self.diskCache.get( key, stamp )
+			if series is not None:
+				self.seriesCache.put( key, *series )
+				return series
+
+		series = self._backendFetch( task, job, [code], tsSql )[0][ code ]
+		if not task.isCanceled():
+			self._cacheSeries( job, {code: series}, stamp )
+		return series
+
+	def _fetchManyKeySeries(self, task, job, keysList, tsSql):
+		# get the time series of several PS at once into the caches, with
+		# the batched fetch of the backend. Return how many were fetched
+		codes = [ self._seriesCode( keys ) for keys in keysList ]
+		codes = [ code for code in codes if (job.source, job.tsTable, code) not in self.seriesCache ]
+		if not codes:
+			return 0
+
+		# those fetched in a previous session first
+		fetched = 0
+		stamp = self._tableStamp( job, tsSql ) if self.diskCache is not None else None
+		if stamp is not None:
+			missing = []
+			for code in codes:
+				key = ( job.source, job.tsTable, code )
+				series = self.diskCache.get( key, stamp )
+				if series is None:
+					missing.append( code )
+					continue
+				self.seriesCache.put( key, *series )
+				fetched += 1
+			codes = missing
+		if not codes:
+			return fetched
+
+		found = self._backendFetch( task, job, codes, tsSql )[0]
+		if task.isCanceled():
+			return fetched
+		return fetched + self._cacheSeries( job, found, stamp )
+
+	def _backendFetch(self, task, job, codes, tsSql):
+		# utility function used to get {code: (X, Y)} from the first backend
+		# able to read them, and the way they've been read. The SQL backends
+		# can be disabled to compare them with the filtered feature request
+		from .ts_backends import SqlBackend, TSBackendError, emptySeries
+		start = time.perf_counter()
+		for backend in job.backends():
+			if isinstance(backend, SqlBackend) and not self.sqlFetch:
+				continue
 			try:
-				x, y = self._getXYvalues( ts_layer, dateField, valueField )
-			finally:
-				ts_layer.deleteLater()
-				del ts_layer
-
-		elif providerType in ['postgres', 'spatialite']:# either PostGIS or SpatiaLite
-
-			# fields containing values
-			dateField = "dataripresa"
-			valueField = "valore"
-			infoFields = dict(enumerate(ps_fields))
-
-			# search for the id_dataset and code_target fields needed to join
-			# PS and TS tables
-			code = None
-			for idx, fld in enumerate( ps_fields ):
-				if fld.name().lower() == "code":
-					code = attrs[ idx ]
-
-			if code is None:
-				QgsMessageLog.logMessage( "code is None. Exiting" % code, "PSTimeSeriesViewer" )
-				return
-			subset = "code='%s'" % code
+				backend = backend.bind( tsSql, task.isCanceled )
+				found = backend.fetchMany( codes ) if len(codes) > 1 else { codes[0]: backend.fetch( codes[0] ) }
+			except TSBackendError as e:
+				QgsMessageLog.logMessage( "%s: %s" % (backend.label, e), "PSTimeSeriesViewer" )
+				continue
+			if found is None or None in found.values():
+				continue
+
+			if self.fetchLatency is not None and not task.isCanceled():
+				path = backend.label if len(codes) == 1 else "%s batch" % backend.label
+				self.fetchLatency.add( path, time.perf_counter() - start )
+			return found, backend.label
+
+		return dict( (code, emptySeries()) for code in codes ), None
+
+	def _cacheSeries(self, job, found, stamp):
+		# utility function used to put the fetched series into the memory
+		# and disk caches. Return how many were cached
+		cached = 0
+		for code, series in found.items():
+			if len(series[0]) == 0:
+				continue
+			key = ( job.source, job.tsTable, code )
+			self.seriesCache.put( key, *series )
+			if stamp is not None:
+				self.diskCache.put( key, stamp, *series )
+			cached += 1
+		return cached
+
+	def _tableStamp(self, job, tsSql):
+		# utility function used to get the version of the time-series
+		# table, disk cached series with another one are stale. It's the
+		# mtime of files and the row count of database tables, queried
+		# once per session. None if it can't be told
+		from .ts_backends import TSBackendError
+		backend = job.backend if job.backend is not None else job.fallback
+		if backend is None:
+			return
+		backend = backend.bind( tsSql )
+		if not backend.costlyStamp:
+			return backend.stamp()
 
-			# create the uri
-			dsuri = QgsDataSourceUri( ps_layer.source() )
-			default_tbl_name = "ts_%s" % dsuri.table()
-			if not self._askTStablename( ps_layer,  default_tbl_name ):
+		key = ( job.source, job.tsTable )
+		stamp = self._tableStamps.get( key )
+		if stamp is None:
+			try:
+				stamp = backend.stamp()
+			except TSBackendError as e:
+				QgsMessageLog.logMessage( str(e), "PSTimeSeriesViewer" )
 				return
-			dsuri.setDataSource( dsuri.schema(), self.ts_tablename, None ) # None or "" ? check during tests
-			dsuri.setWkbType(QgsWkbTypes.Unknown)
-			dsuri.setSrid(None)
-			uri = dsuri.uri()
-
-			# load the layer containing time series
-			ts_layer = self._createTSlayer( uri, providerType, subset )
-			if ts_layer is None:
+			if stamp is None:
 				return
+			self._tableStamps[ key ] = stamp
+		return stamp
+
+	def _prefetchSeries(self, task, job, attrsList, tsSql):
+		# get the time series of the PS close to the clicked one, it runs
+		# in a worker thread. Return how many have been fetched
+		keysList = []
+		for attrs in attrsList:
+			keys = [ self._attrValue( job.psProfile, attrs, name ) for name in job.keyFields ]
+			if None not in keys:
+				keysList.append( keys )
+		if not keysList:
+			return 0
+		return self._fetchManyKeySeries( task, job, keysList, tsSql )
+
+	@staticmethod
+	def _keysSubset(job, keys):
+		# utility function used to create the filter on the key fields
+		return " AND ".join( QgsExpression.createFieldEqualityExpression( name, value ) \
+				for name, value in zip(job.keyFields, keys) )
+
+	def _onSeriesFetched(self, task, ok):
+		# called in the main thread when the background fetch ends
+		self._runningTasks.discard( task )
+		if task is not self.fetchTask:
+			return	# replaced by a newer click
+		self.fetchTask = None
+		self.iface.mainWindow().statusBar().clearMessage()
+
+		if task.exception is not None:
+			QgsMessageLog.logMessage( "fetching time series failed: %s" % task.exception, "PSTimeSeriesViewer" )
+		self._adviseSeriesTableRefresh()
+		if not ok:
+			return
 
-			# get time series X and Y values
-			try:
-				x, y = self._getXYvalues( ts_layer, dateField, valueField )
-			finally:
-				ts_layer.deleteLater()
-				del ts_layer
+		job = task.job
+		ps_layer = QgsProject.instance().mapLayer( job.layerId )
+		if job.fid is None or ps_layer is None:
+			return
 
+		x, y = job.x, job.y
 		if len(x) * len(y) <= 0:
 			QMessageBox.warning( self.iface.mainWindow(),
 					"PS Time Series Viewer",
 					"No time series values found for the selected point." )
-			QgsMessageLog.logMessage( "provider: %s - uri: %s\nsubset: %s" % (providerType, uri, subset), "PSTimeSeriesViewer" )
+			QgsMessageLog.logMessage( "provider: %s - uri: %s\nsubset: %s" % (job.providerType, job.uri, job.subset), "PSTimeSeriesViewer" )
 			return
 
-		# display the plot dialog
+		# display the plot dialog, replacing the previous one
+		if self.dlg is not None:
+			self.dlg.close()
+			self.dlg.deleteLater()
+
 		from .pstimeseries_dlg import PSTimeSeries_Dlg
-		dlg = PSTimeSeries_Dlg( ps_layer, infoFields )
-		dlg.setFeatureId( fid )
-		dlg.setData( x, y )
-		return dlg
-
-	def _getXYvalues(self, ts_layer, dateField, valueField):
-		# utility function used to get the X and Y values
-		x, y = [], []
-
-		# get indexes of date (x) and value (y) fields
-		dateIdx, valueIdx = None, None
-		for idx, fld in enumerate(ts_layer.dataProvider().fields()):
-			if fld.name().lower() == dateField:
-				dateIdx = idx
-			elif fld.name().lower() == valueField:
-				valueIdx = idx
-
-		if dateIdx is None or valueIdx is None:
-			QgsMessageLog.logMessage("field %s -> index %s, field %s -> index %s. Exiting" % (dateField, dateIdx, valueField, valueIdx), "PSTimeSeriesViewer")
+		self.dlg = PSTimeSeries_Dlg( ps_layer, job.infoFields, self.iface.mainWindow() )
+		self.dlg.setFeatureId( job.fid )
+		self.dlg.setData( x, y )
+		self.dlg.show()
+
+		# the next click is likely on a PS nearby, load them in background
+		if job.keyFields and job.backend.cached:
+			canvas = self.iface.mapCanvas()
+			extent = canvas.mapSettings().mapToLayerCoordinates( ps_layer, canvas.extent() )
+			self.prefetcher.start( job, extent )
+
+	@staticmethod
+	def _attrValue(profile, attrs, fieldName):
+		# utility function used to get the value of a field by its name
+		idx = profile.indexOf( fieldName )
+		if idx is None:
 			return
+		return attrs[ idx ]
 
-		# fetch and loop through all the features
-		request = QgsFeatureRequest()
-		request.setSubsetOfAttributes([dateIdx, valueIdx])
-		for f in ts_layer.getFeatures( request ):
-			# get x and y values
-			a = f.attributes()
-			x.append( QDate.fromString( a[ dateIdx ], "yyyyMMdd" ).toPyDate() )
-			y.append( float(a[ valueIdx ]) )
+	def _getCachedXYvalues(self, key):
+		# utility function used to get the X and Y values from the cache
+		return self.seriesCache.get( key )
 
-		return x, y
+	def _watchLayer(self, ps_layer):
+		# drop the cached series when the PS layer is reloaded
+		if ps_layer.id() in self._watchedLayerIds:
+			return
+		self._watchedLayerIds.add( ps_layer.id() )
+
+		source = ps_layer.source()
+		def invalidate():
+			if self.seriesCache is not None:
+				self.seriesCache.invalidate( source )
+			for key in list(self._tableStamps.keys()):
+				if key[0] == source:
+					del self._tableStamps[ key ]
+		ps_layer.dataChanged.connect( invalidate )
+
+	def _findStore(self, ps_layer):
+		# utility function used to get the binary time-series store of
+		# the PS layer: the file set in the "pstimeseries/store" layer
+		# property or a .psts/.psa file next to the layer source
+		path = ps_layer.customProperty( "pstimeseries/store", "" )
+		if path:
+			return path if os.path.isfile( path ) else None
+
+		if ps_layer.providerType() in ('ogr', 'spatialite', 'delimitedtext'):
+			source = ps_layer.source().split( '|' )[0]
+			if ps_layer.providerType() == 'spatialite':
+				source = QgsDataSourceUri( ps_layer.source() ).database()
+			for ext in (".psts", ".psa"):
+				path = os.path.splitext( source )[0] + ext
+				if os.path.isfile( path ):
+					return path
+
+	def checkGpkgTable(self, dbpath, tblname):
+		""" check the time-series table of the GeoPackage exists, warning
+		the user if it doesn't. A table dropped later makes the fetch fail
+		and fall back to the feature request """
+		if (dbpath, tblname) in self._gpkgTables:
+			return True
+
+		from .ts_sql import sqliteHasTable
+		try:
+			found = sqliteHasTable( dbpath, tblname )
+		except sqlite3.Error as e:
+			QgsMessageLog.logMessage( "unable to read %s: %s" % (dbpath, e), "PSTimeSeriesViewer" )
+			found = False
+		if not found:
+			QMessageBox.warning( self.iface.mainWindow(),
+					"PS Time Series Viewer",
+					"The table '%s' wasn't found." % tblname )
+			self.ts_tablename = None
+			return False
+
+		self._gpkgTables.add( (dbpath, tblname) )
+		self._adviseTSIndex( 'gpkg', dbpath, "", tblname )
+		return True
+
+	def _adviseTSIndex(self, providerType, conninfo, schema, tblname, column="code"):
+		# utility function used to check the time-series table has an index
+		# on the field the series are looked up by, offering to create it.
+		# It's done once per session for each table
+		from .ts_sql import TSSqlReader, TSSqlError
+		from .ts_index import inspectIndex, IndexBuilder, TSIndexTask
+		key = ( providerType, conninfo, schema, tblname )
+		if key in self._indexChecked or not TSSqlReader.isAvailable( providerType ):
+			return
+		self._indexChecked.add( key )
+
+		try:
+			status = inspectIndex( providerType, conninfo, schema, tblname, column )
+		except TSSqlError as e:
+			QgsMessageLog.logMessage( "unable to inspect %s: %s" % (tblname, e), "PSTimeSeriesViewer" )
+			return
+		if status['indexed']:
+			return
+
+		# what each click costs without the index
+		cost = []
+		if status['rows'] is not None:
+			cost.append( "about %d rows" % status['rows'] )
+		if status['bytes'] is not None:
+			cost.append( "%.1f MB %s" % (status['bytes'] / 1048576.0, "of table" if providerType == 'postgres' else "of database") )
+		if status['cost'] is not None:
+			cost.append( "planner cost %.0f" % status['cost'] )
+		QgsMessageLog.logMessage( "%s has no index on %s: %s scanned per click" % (tblname, column, ", ".join( cost )), "PSTimeSeriesViewer" )
+
+		answer = QMessageBox.question( self.iface.mainWindow(),
+				"PS Time Series Viewer",
+				"The table '%s' has no index on the %s field, each time series is read "
+				"scanning the whole table (%s).\n\nCreate the index now? It runs in background "
+				"and can be canceled from the task manager." % (tblname, column, ", ".join( cost ) or "unknown size"),
+				QMessageBox.Yes | QMessageBox.No )
+		if answer != QMessageBox.Yes:
+			return
+
+		task = TSIndexTask( IndexBuilder( providerType, conninfo, schema, tblname, column, status['rows'] ) )
+		def finished():
+			self._runningTasks.discard( task )
+			if task.seconds is not None:
+				QgsMessageLog.logMessage( "index on %s.%s created in %.1f s" % (tblname, column, task.seconds), "PSTimeSeriesViewer" )
+				self.iface.mainWindow().statusBar().showMessage( "Index on %s created" % tblname, 5000 )
+			else:
+				self._indexChecked.discard( key )	# ask again next time
+				QgsMessageLog.logMessage( "index on %s.%s not created: %s" % (tblname, column, task.exception or "canceled"), "PSTimeSeriesViewer" )
+		task.taskCompleted.connect( finished )
+		task.taskTerminated.connect( finished )
+		self._runningTasks.add( task )
+		QgsApplication.taskManager().addTask( task )
+
+	def askTSTable(self, ps_layer, default_tblname=None):
+		""" return the name of the table containing the time series of the
+		PS layer, asked to the user once per layer. None if canceled """
+		if not self._askTStablename( ps_layer, default_tblname ):
+			return
+		return self.ts_tablename
 
 	def _askTStablename(self, ps_layer, default_tblname=None):
 		# utility function used to ask to the user the name of the table
@@ -282,23 +849,31 @@ class PSTimeSeries_Plugin:
 			if not ok:
 				return False
 
+			# series read from a different table are no more valid
+			if self.seriesCache is not None and tblname != self.ts_tablename:
+				self.seriesCache.invalidate( ps_layer.source() )
+
 			self.ts_tablename = tblname
 			self.last_ps_layerid = ps_layer.id()
 
+			# the series are looked up by code, check it's indexed
+			providerType = ps_layer.providerType()
+			if providerType in ('postgres', 'spatialite'):
+				dsuri = QgsDataSourceUri( ps_layer.source() )
+				conninfo = dsuri.connectionInfo( True ) if providerType == 'postgres' else dsuri.database()
+				self._adviseTSIndex( providerType, conninfo, dsuri.schema(), tblname )
+
 		return True
 
-	def _createTSlayer(self, uri, providerType, subset=None):
-		# utility function used to create the vector layer containing time
-		# series data
-		layer = QgsVectorLayer( uri, "time_series_layer", providerType )
-		if not layer.isValid():
+	def _createTSlayer(self, ps_layer, uri, providerType):
+		# utility function used to get the vector layer containing time
+		# series data, it's kept open in the pool and reused by next clicks
+		layer = self.tsLayerPool.acquire( ps_layer, self.ts_tablename, uri, providerType )
+		if layer is None:
 			QMessageBox.warning( self.iface.mainWindow(),
 					"PS Time Series Viewer",
 					"The layer '%s' wasn't found." % self.ts_tablename )
 			self.ts_tablename = None
 			return
 
-		if subset is not None:
-			layer.setSubsetString( subset )
-
 		return layer
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import re
+
+import numpy as np
+
+from .date_utils import decodeDates
+
+
+class SchemaProfile:
+	""" what the plugin needs to know about the fields of a layer,
+	computed once instead of on every click """
+
+	DATE_FIELD_RE = re.compile( r"D(\d{8})", re.IGNORECASE )
+
+	def __init__(self, fields):
+		self.fields = fields
+
+		# lowercase field name -> index
+		self.fieldIndexes = {}
+		for idx, fld in enumerate(fields):
+			self.fieldIndexes.setdefault( fld.name().lower(), idx )
+
+		# fields named like Dyyyymmdd contain the values acquired at that
+		# date (shapefile layers), all the others contain info
+		names = []
+		for fld in fields:
+			match = self.DATE_FIELD_RE.search( fld.name() )
+			names.append( match.group(1) if match else "" )
+		dates = decodeDates( names )
+		isDate = ~np.isnat( dates )
+
+		self.dateIndexes = np.flatnonzero( isDate ).tolist()
+		self.dates = dates[ isDate ]
+		self.infoFields = dict( (idx, fld) for idx, fld in enumerate(fields) if not isDate[ idx ] )
+
+	def indexOf(self, name):
+		""" return the index of the field (case insensitive) or None """
+		return self.fieldIndexes.get( name.lower() )
+
+	def allFields(self):
+		""" return the index->field map of all the fields """
+		return dict(enumerate(self.fields))
+
+
+class SchemaProfileCache:
+	""" schema profiles by layer id, rebuilt when the layer fields change """
+
+	def __init__(self):
+		self._profiles = {}
+		self._watched = set()
+
+	def profile(self, layer):
+		layerid = layer.id()
+		profile = self._profiles.get( layerid )
+		if profile is None:
+			profile = SchemaProfile( layer.dataProvider().fields() )
+			self._profiles[ layerid ] = profile
+			self._watch( layer )
+
+		return profile
+
+	def _watch(self, layer):
+		layerid = layer.id()
+		if layerid in self._watched:
+			return
+		self._watched.add( layerid )
+
+		def drop():
+			self._profiles.pop( layerid, None )
+		def forget():
+			drop()
+			self._watched.discard( layerid )
+		layer.updatedFields.connect( drop )
+		layer.willBeDeleted.connect( forget )
+
+	def remove(self, layerid):
+		self._profiles.pop( layerid, None )
+
+	def clear(self):
+		self._profiles.clear()
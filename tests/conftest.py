@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+"""
+The modules which don't need QGIS are tested as the pstimeseries package,
+the name the plugin is installed with, wherever the plugin directory is.
+"""
+
+import os
+import sqlite3
+import sys
+import importlib.util
+
+import pytest
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+TESTDATA = os.path.join( ROOT, "testdata" )
+
+
+def _loadPlugin():
+	if "pstimeseries" in sys.modules:
+		return
+	spec = importlib.util.spec_from_file_location( "pstimeseries", os.path.join( ROOT, "__init__.py" ),
+			submodule_search_locations=[ ROOT ] )
+	module = importlib.util.module_from_spec( spec )
+	sys.modules[ "pstimeseries" ] = module
+	spec.loader.exec_module( module )
+
+_loadPlugin()
+
+
+@pytest.fixture
+def testdata():
+	return TESTDATA
+
+
+def dumpRows():
+	""" return the (code, dataripresa, valore, id) rows of the sample dump """
+	rows = []
+	with open( os.path.join( TESTDATA, "PostGIS-Spatialite", "ts_all_asce.txt" ), 'r' ) as f:
+		f.readline()
+		for line in f:
+			code, date, value, rowid = line.rstrip( '\r\n' ).split( '\t' )[:4]
+			rows.append( ( code, date, float(value), int(rowid) ) )
+	return rows
+
+
+@pytest.fixture(scope="session")
+def tsDatabase(tmp_path_factory):
+	""" SQLite database with the time-series table ts of the sample dump """
+	path = str(tmp_path_factory.mktemp( "db" ) / "ts.sqlite")
+	conn = sqlite3.connect( path )
+	conn.execute( "CREATE TABLE ts (id INTEGER PRIMARY KEY, code TEXT, dataripresa TEXT, valore REAL)" )
+	conn.execute( "CREATE INDEX ts_code ON ts (code)" )
+	conn.executemany( "INSERT INTO ts (code, dataripresa, valore, id) VALUES (?, ?, ?, ?)", dumpRows() )
+	conn.commit()
+	conn.close()
+	return path
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from pstimeseries.csv_index import CSVIndex, CSVIndexError, csvLayerOfVrt, keyText, openCsvIndex, closeCsvIndexes
+from pstimeseries.ts_backends import VrtBackend
+
+LINES = [
+	"ID_DATASET;CODE_TARGET;DATA_MISURA;SPOST_REL_MM",
+	"1;A1;2003-04-10;2.5",
+	"1;A1;2003-03-17;0",
+	"2;A1;2003-03-17;7",
+	"1;B2;2003-03-17;-1.25",
+	"1;A1;2003-05-04;x",
+	"1;\"C;3\";2003-03-17;4",
+	"1;B2;bad date;5",
+]
+
+VRT = """<OGRVRTDataSource>
+	<OGRVRTLayer name="ts">
+		<SrcDataSource relativeToVRT="1">%s</SrcDataSource>
+		<Field name="id_dataset" src="ID_DATASET"/>
+		<Field name="code_target" src="CODE_TARGET"/>
+		<Field name="data_misura" src="DATA_MISURA"/>
+		<Field name="spost_rel_mm" src="SPOST_REL_MM"/>
+	</OGRVRTLayer>
+</OGRVRTDataSource>
+"""
+
+DATE_COLUMN, VALUE_COLUMN = "data_misura", "spost_rel_mm"
+
+
+@pytest.fixture
+def csvPath(tmp_path):
+	closeCsvIndexes()
+	path = str(tmp_path / "ts.csv")
+	with open( path, 'w', newline='' ) as f:
+		f.write( "\r\n".join( LINES ) + "\r\n" )
+	yield path
+	closeCsvIndexes()
+
+
+def _dates(*dates):
+	return np.array( dates, dtype='datetime64[D]' )
+
+
+def test_series(csvPath):
+	index = CSVIndex( csvPath, [ "ID_DATASET", "CODE_TARGET" ] )
+	assert index.delimiter == ";"
+	assert os.path.isfile( csvPath + ".psidx" )
+
+	# the first two lines of 1/A1 share a range
+	assert len(index.ranges( (1, "A1") )) == 2
+	assert len(index.rows( (1.0, "A1") )) == 3
+
+	x, y = index.series( (1, "A1"), DATE_COLUMN, VALUE_COLUMN )
+	np.testing.assert_array_equal( x, _dates( '2003-03-17', '2003-04-10', '2003-05-04' ) )
+	np.testing.assert_array_equal( y, [ 0.0, 2.5, np.nan ] )
+
+	# lines with no valid date are skipped
+	x, y = index.series( (1, "B2"), DATE_COLUMN, VALUE_COLUMN )
+	np.testing.assert_array_equal( y, [ -1.25 ] )
+
+	np.testing.assert_array_equal( index.series( (1, "C;3"), DATE_COLUMN, VALUE_COLUMN )[1], [ 4.0 ] )
+	assert len(index.series( (3, "A1"), DATE_COLUMN, VALUE_COLUMN )[0]) == 0
+	assert index.series( (1, "A1"), "data", VALUE_COLUMN ) is None
+
+
+def test_series_many(csvPath):
+	index = CSVIndex( csvPath, [ "id_dataset", "code_target" ] )
+	keys = [ ("2", "A1"), ("1", "A1"), ("3", "A1"), ("1", "B2") ]
+	series = index.seriesMany( keys, DATE_COLUMN, VALUE_COLUMN )
+	assert sorted( series ) == sorted( keys )
+	for key in keys:
+		for a, b in zip( series[ key ], index.series( key, DATE_COLUMN, VALUE_COLUMN ) ):
+			np.testing.assert_array_equal( a, b )
+	assert index.seriesMany( keys, DATE_COLUMN, "spost" ) is None
+
+
+def test_saved_index(csvPath, monkeypatch):
+	index = CSVIndex( csvPath, [ "id_dataset", "code_target" ] )
+
+	def build(self):
+		raise AssertionError( "the saved index was not used" )
+	with monkeypatch.context() as m:
+		m.setattr( CSVIndex, "_build", build )
+		loaded = CSVIndex( csvPath, [ "id_dataset", "code_target" ] )
+	np.testing.assert_array_equal( loaded.keys, index.keys )
+	assert loaded.columns == index.columns
+
+	# other key columns or another CSV version need a new index
+	assert len(CSVIndex( csvPath, [ "code_target" ] ).ranges( ("A1",) )) == 2
+	with open( csvPath, 'a' ) as f:
+		f.write( "1;D4;2003-03-17;1\n" )
+	assert len(CSVIndex( csvPath, [ "id_dataset", "code_target" ] ).ranges( (1, "D4") )) == 1
+
+
+def test_missing_key_columns(csvPath):
+	with pytest.raises( CSVIndexError ):
+		CSVIndex( csvPath, [ "id_dataset", "code" ] )
+
+
+def test_key_text():
+	assert keyText( 12.0 ) == "12"
+	assert keyText( 1.5 ) == "1.5"
+	assert keyText( " A1 " ) == "A1"
+
+
+def test_open_csv_index(csvPath, monkeypatch):
+	builds = []
+	build = CSVIndex._build
+	def countedBuild(self):
+		builds.append( self.csvPath )
+		build( self )
+	monkeypatch.setattr( CSVIndex, "_build", countedBuild )
+
+	# the threads opening the same CSV wait for a single build
+	indexes = []
+	threads = [ threading.Thread( target=lambda: indexes.append( openCsvIndex( csvPath, [ "id_dataset", "code_target" ] ) ) ) \
+			for _ in range(8) ]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	assert len(indexes) == 8 and all( index is indexes[0] for index in indexes )
+	assert builds == [ csvPath ]
+
+	# rebuilt once the CSV changes
+	with open( csvPath, 'a' ) as f:
+		f.write( "1;D4;2003-03-17;1\n" )
+	index = openCsvIndex( csvPath, [ "ID_DATASET", "CODE_TARGET" ] )
+	assert index is not indexes[0]
+	assert len(index.ranges( (1, "D4") )) == 1
+	assert len(builds) == 2
+
+
+def test_build_does_not_block_other_csv(csvPath, tmp_path, monkeypatch):
+	other = str(tmp_path / "other.csv")
+	with open( other, 'w' ) as f:
+		f.write( "code;data_misura;spost_rel_mm\nA1;2003-03-17;1\n" )
+
+	started, release = threading.Event(), threading.Event()
+	build = CSVIndex._build
+	def slowBuild(self):
+		if self.csvPath == csvPath:
+			started.set()
+			release.wait( 5 )
+		build( self )
+	monkeypatch.setattr( CSVIndex, "_build", slowBuild )
+
+	thread = threading.Thread( target=openCsvIndex, args=( csvPath, [ "id_dataset", "code_target" ] ) )
+	thread.start()
+	try:
+		assert started.wait( 5 )
+		# the other CSV is indexed while the first one is being built
+		assert len(openCsvIndex( other, [ "code" ] ).ranges( ("A1",) )) == 1
+		assert thread.is_alive()
+	finally:
+		release.set()
+		thread.join()
+
+
+def test_csv_layer_of_vrt(csvPath, tmp_path):
+	vrt = str(tmp_path / "ts.vrt")
+	with open( vrt, 'w' ) as f:
+		f.write( VRT % "CSV:ts.csv" )
+	path, columns = csvLayerOfVrt( vrt )
+	assert path == csvPath
+	assert columns[ "data_misura" ] == "DATA_MISURA"
+
+	with open( vrt, 'w' ) as f:
+		f.write( VRT % "ts.shp" )
+	assert csvLayerOfVrt( vrt ) is None
+	assert csvLayerOfVrt( str(tmp_path / "none.vrt") ) is None
+
+
+def test_vrt_backend(csvPath, tmp_path):
+	vrt = str(tmp_path / "ts.vrt")
+	with open( vrt, 'w' ) as f:
+		f.write( VRT % "ts.csv" )
+	backend = VrtBackend( vrt )
+	assert backend.csvPath == csvPath
+	series = backend.fetchMany( [ (1, "A1"), (3, "A1") ] )
+	np.testing.assert_array_equal( series[ (1, "A1") ][1], [ 0.0, 2.5, np.nan ] )
+	assert len(series[ (3, "A1") ][0]) == 0
+
+	with open( vrt, 'w' ) as f:
+		f.write( VRT % "ts.shp" )
+	assert VrtBackend( vrt ).fetchMany( [ (1, "A1") ] ) is None
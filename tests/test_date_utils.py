@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+
+from pstimeseries.date_utils import JULIAN_DAY_1970, decodeDates, isDateSequence, datesToNum
+
+EXPECTED = np.array( [ '2003-03-17', '2004-02-29', 'NaT' ], dtype='datetime64[D]' )
+
+
+class FakeQDate:
+	""" the QDate methods decodeDates uses """
+
+	def __init__(self, day=None):
+		self.day = day
+
+	def isValid(self):
+		return self.day is not None
+
+	def toJulianDay(self):
+		return JULIAN_DAY_1970 + int(np.datetime64( self.day, 'D' ).astype( np.int64 ))
+
+
+@pytest.mark.parametrize( "values", [
+	[ "20030317", "20040229", "20030229" ],
+	[ "2003-03-17", "2004-02-29", "" ],
+	[ "20030317", "20040229", "x" ],
+	[ "20030317", "20040229", None ],
+	np.array( [ b"20030317", b"20040229", b"2003" ] ),
+	[ 20030317, 20040229, 20031301 ],
+	np.array( [ 20030317.0, 20040229.0, 20030132.0 ] ),
+	[ date( 2003, 3, 17 ), datetime( 2004, 2, 29, 12 ), None ],
+	EXPECTED.astype( 'datetime64[s]' ),
+	[ FakeQDate( '2003-03-17' ), FakeQDate( '2004-02-29' ), FakeQDate() ],
+] )
+def test_decode_dates(values):
+	dates = decodeDates( values )
+	assert dates.dtype == np.dtype('datetime64[D]')
+	np.testing.assert_array_equal( dates, EXPECTED )
+
+
+def test_decode_no_dates():
+	dates = decodeDates( [] )
+	assert dates.dtype == np.dtype('datetime64[D]') and len(dates) == 0
+
+
+def test_is_date_sequence():
+	assert isDateSequence( EXPECTED )
+	assert isDateSequence( [ date( 2003, 3, 17 ) ] )
+	assert isDateSequence( [ FakeQDate( '2003-03-17' ) ] )
+	assert isDateSequence( np.array( [ date( 2003, 3, 17 ) ], dtype=object ) )
+	assert not isDateSequence( [] )
+	assert not isDateSequence( [ "20030317" ] )
+	assert not isDateSequence( np.array( [ 1.0, 2.0 ] ) )
+
+
+def test_dates_to_num():
+	pytest.importorskip( "matplotlib" )
+	from matplotlib.dates import date2num
+	np.testing.assert_array_equal( datesToNum( [ "20030317", "20040229" ] ), date2num( EXPECTED[ :2 ] ) )
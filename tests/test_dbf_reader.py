@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pytest
+
+from pstimeseries.dbf_reader import DBF_HEADER, DBF_FIELD, DBFReader, DBFError, openDbf, closeDbfs
+
+SHAPEFILE = os.path.join( "shape", "BOISSANO_RSAT_S3_A_T290_COMUNEBOISSANO_GBO-TSR.dbf" )
+
+
+def _records(path, reader):
+	# the raw records read one by one
+	with open( path, 'rb' ) as f:
+		f.seek( reader.headerLength )
+		return [ f.read( reader.recordLength ) for _ in range( reader.count ) ]
+
+
+def test_fields(testdata):
+	reader = DBFReader( os.path.join( testdata, SHAPEFILE ) )
+	assert reader.count == 1372
+	assert reader.fields[ 'code' ] == ( 'C', 1, 5 )
+	assert reader.fields[ 'd20030317' ][0] == 'N'
+	assert reader.hasFields( [ 'CODE', 'd20030410' ] )
+	assert not reader.hasFields( [ 'code', 'd19990101' ] )
+
+
+def test_read(testdata):
+	path = os.path.join( testdata, SHAPEFILE )
+	reader = DBFReader( path )
+	records = _records( path, reader )
+	fids = [ 5, 0, 1, 2, reader.count - 1, 1 ]
+	names = [ 'vel', 'd20030317', 'd20030410' ]
+
+	raw = reader.records( fids )
+	assert raw.shape == (len(fids), reader.recordLength)
+	for row, fid in zip( raw, fids ):
+		assert row.tobytes() == records[ fid ]
+
+	values = reader.read( fids, names )
+	for row, fid in zip( values, fids ):
+		for value, name in zip( row, names ):
+			ftype, offset, length = reader.fields[ name ]
+			assert value == float( records[ fid ][ offset:offset + length ] )
+
+	with pytest.raises( DBFError ):
+		reader.read( [ 0 ], [ 'code' ] )
+	with pytest.raises( DBFError ):
+		reader.records( [ reader.count ] )
+
+
+def _writeDbf(path, values):
+	# a .dbf with the numeric field d20030317 of width 6
+	header = DBF_HEADER.pack( 3, 126, 10, 18, len(values), DBF_HEADER.size + DBF_FIELD.size + 1, 1 + 6 )
+	field = DBF_FIELD.pack( b'd20030317', b'N', 6, 2 )
+	with open( path, 'wb' ) as f:
+		f.write( header + field + b'\r' )
+		for value in values:
+			f.write( b' ' + value.rjust( 6 ) )
+		f.write( b'\x1a' )
+
+
+def test_empty_values(tmp_path):
+	path = str(tmp_path / "ps.dbf")
+	_writeDbf( path, [ b'1.50', b'', b'x', b'-2.25' ] )
+	values = DBFReader( path ).read( range(4), [ 'd20030317' ] )
+	np.testing.assert_array_equal( values[ :, 0 ], [ 1.5, np.nan, np.nan, -2.25 ] )
+
+
+def test_not_a_dbf(tmp_path):
+	path = str(tmp_path / "ps.dbf")
+	with open( path, 'wb' ) as f:
+		f.write( b'\x03' )
+	with pytest.raises( DBFError ):
+		DBFReader( path )
+
+
+def test_open_dbf(tmp_path):
+	closeDbfs()
+	path = str(tmp_path / "ps.dbf")
+	_writeDbf( path, [ b'1.50' ] )
+	reader = openDbf( path )
+	assert openDbf( path ) is reader
+
+	# rewritten with another size
+	_writeDbf( path, [ b'1.50', b'2.50' ] )
+	assert openDbf( path ).count == 2
+	closeDbfs()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pytest
+
+from pstimeseries.ps_store import HEADER, MAGIC, VERSION, ALIGN, PSStore, PSArchive, PSStoreError, \
+		StoreWriter, ArchiveWriter, writeStore, openStore, closeStores
+from pstimeseries.ts_convert import convertDump
+
+DATES = np.array( [ '2003-03-17', '2003-04-10', '2003-05-04' ], dtype='datetime64[D]' )
+
+
+def _header(path):
+	with open( path, 'rb' ) as f:
+		return HEADER.unpack( f.read( HEADER.size ) )
+
+
+def test_write_store_round_trip(tmp_path):
+	path = str(tmp_path / "ts.psts")
+	values = np.array( [ [ 1.5, 2.5, 3.5 ], [ -1.0, np.nan, 0.25 ], [ 0.0, 0.0, 0.0 ] ], dtype=np.float32 )
+	writeStore( path, [ "B2", "A1", "C3" ], DATES, values )
+
+	magic, version, nps, ndates, width, datesOff, valuesOff, codesOff, rowsOff = _header( path )
+	assert (magic, version, nps, ndates, width) == (MAGIC, VERSION, 3, 3, 2)
+	assert all( offset % ALIGN == 0 for offset in (datesOff, valuesOff, codesOff, rowsOff) )
+
+	store = PSStore( path )
+	assert len(store) == 3
+	assert list(store.codes) == [ b"A1", b"B2", b"C3" ]
+
+	dates, vals = store.fetch( "B2" )
+	np.testing.assert_array_equal( dates, DATES )
+	np.testing.assert_array_equal( vals, values[0] )
+	assert not vals.flags.owndata
+
+	# the missing values are dropped with their dates
+	dates, vals = store.fetch( "A1" )
+	np.testing.assert_array_equal( dates, DATES[ [0, 2] ] )
+	np.testing.assert_array_equal( vals, [ -1.0, 0.25 ] )
+
+	assert store.fetch( "D4" ) is None
+	assert store.row( "C3" ) == 2
+
+
+def test_write_store_shape(tmp_path):
+	with pytest.raises( PSStoreError ):
+		writeStore( str(tmp_path / "ts.psts"), [ "A1" ], DATES, np.zeros( (2, 3) ) )
+
+
+def test_store_writer_round_trip(tmp_path):
+	path = str(tmp_path / "ts.psts")
+	days = DATES.astype( np.int64 )
+	writer = StoreWriter( path, DATES )
+	writer.add( b"A1", days, [ 1.0, 2.0, 3.0 ] )
+	writer.add( b"B2", days[1:], [ 4.0, 5.0 ] )
+	with pytest.raises( PSStoreError ):
+		writer.add( b"A0", days, [ 1.0, 2.0, 3.0 ] )		# not ascending
+	with pytest.raises( PSStoreError ):
+		writer.add( b"C3", [ days[0] + 1 ], [ 1.0 ] )	# unknown date
+	writer.close()
+
+	store = PSStore( path )
+	assert len(store) == 2
+	np.testing.assert_array_equal( store.fetch( "A1" )[1], [ 1.0, 2.0, 3.0 ] )
+	dates, vals = store.fetch( "B2" )
+	np.testing.assert_array_equal( dates, DATES[1:] )
+	np.testing.assert_array_equal( vals, [ 4.0, 5.0 ] )
+
+
+def test_store_writer_empty(tmp_path):
+	path = str(tmp_path / "ts.psts")
+	StoreWriter( path, [] ).close()
+	store = PSStore( path )
+	assert len(store) == 0
+	assert store.fetch( "A1" ) is None
+
+
+@pytest.mark.parametrize( "valueDtype", [ None, '<i2', '<i4' ] )
+def test_archive_round_trip(tmp_path, valueDtype):
+	path = str(tmp_path / "ts.psa")
+	series = {
+		b"A1": ( DATES.astype( np.int64 ), np.array( [ 0.0, -8.33, 12.5 ], dtype=np.float32 ) ),
+		b"B2": ( DATES[1:].astype( np.int64 ), np.array( [ np.nan, 3.3 ], dtype=np.float32 ) ),
+		b"C3": ( np.array( [], dtype=np.int64 ), np.array( [], dtype=np.float32 ) ),
+	}
+	writer = ArchiveWriter( path, 5, valueDtype, bufferRows=2 )
+	for code in sorted( series ):
+		writer.add( code, *series[ code ] )
+	writer.close()
+
+	archive = PSArchive( path )
+	assert len(archive) == 3
+	for code, (days, values) in series.items():
+		dates, vals = archive.fetch( code.decode() )
+		np.testing.assert_array_equal( dates, days.astype( 'datetime64[D]' ) )
+		np.testing.assert_allclose( vals, values, atol=1e-6 )
+	assert archive.fetch( "D4" ) is None
+
+
+def test_archive_rows_count(tmp_path):
+	writer = ArchiveWriter( str(tmp_path / "ts.psa"), 3 )
+	writer.add( b"A1", DATES[ :2 ].astype( np.int64 ), [ 1.0, 2.0 ] )
+	with pytest.raises( PSStoreError ):
+		writer.close()
+
+
+def test_open_store(tmp_path):
+	closeStores()
+	store = str(tmp_path / "ts.psts")
+	writeStore( store, [ "A1" ], DATES, np.ones( (1, 3) ) )
+	archive = str(tmp_path / "ts.psa")
+	writer = ArchiveWriter( archive, 1 )
+	writer.add( b"A1", DATES[ :1 ].astype( np.int64 ), [ 1.0 ] )
+	writer.close()
+
+	assert isinstance( openStore( store ), PSStore )
+	assert isinstance( openStore( archive ), PSArchive )
+	assert openStore( store ) is openStore( store )
+	closeStores()
+
+
+def _writeDump(path, rows):
+	with open( path, 'w' ) as f:
+		f.write( "code\tdataripresa\tvalore\n" )
+		for row in rows:
+			f.write( "%s\t%s\t%s\n" % row )
+
+
+def test_convert_to_store(tmp_path):
+	dump = str(tmp_path / "ts.txt")
+	_writeDump( dump, [ ("B2", "20030410", "-8.33"), ("A1", "20030317", "0.0"), ("B2", "20030317", "1.5"),
+			("A1", "20030504", "-9.18"), ("C3", "2003-04-10", "x"), ("A1", "20030410", "3.3") ] )
+	psts, psa = str(tmp_path / "ts.psts"), str(tmp_path / "ts.psa")
+	stats = convertDump( dump, psts, chunkRows=2 )
+	assert stats['format'] == 'psts'
+	assert convertDump( dump, psa, chunkRows=2 )['format'] == 'psa'
+
+	store, archive = PSStore( psts ), PSArchive( psa )
+	assert len(store) == len(archive) == stats['codes'] == 3
+	np.testing.assert_array_equal( store.dates, DATES )
+	for code in archive.codes:
+		# values which are not numbers are missing in the store
+		dates, values = store.fetch( code.decode() )
+		expectedDates, expectedValues = archive.fetch( code.decode() )
+		valid = ~np.isnan( expectedValues )
+		np.testing.assert_array_equal( dates, expectedDates[ valid ] )
+		np.testing.assert_allclose( values, expectedValues[ valid ], atol=1e-6 )
+	assert len(store.fetch( "C3" )[0]) == 0
+
+
+def test_convert_repeated_dates(tmp_path, testdata):
+	# the PS of the sample dump have several values for some dates
+	dump = os.path.join( testdata, "PostGIS-Spatialite", "ts_all_asce.txt" )
+	with pytest.raises( PSStoreError ):
+		convertDump( dump, str(tmp_path / "ts.psts") )
+	assert not os.path.exists( str(tmp_path / "ts.psts") )
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pytest
+
+from pstimeseries.ts_backends import BACKENDS, registerBackend, findBackend, FeatureBackend, SpatialiteBackend, \
+		GpkgBackend, PostgisBackend, StoreBackend, ShapefileBackend, OciBackend, VrtBackend, TSBackendError, \
+		quoteValue
+from pstimeseries.ts_sql import TSSqlReader
+from pstimeseries.ps_store import writeStore, closeStores
+from pstimeseries.dbf_reader import closeDbfs
+
+SHAPEFILE = os.path.join( "shape", "BOISSANO_RSAT_S3_A_T290_COMUNEBOISSANO_GBO-TSR" )
+
+
+@pytest.mark.parametrize( "providerType, source, backend", [
+	( 'postgres', "dbname='ps' table=\"public\".\"ps\" (the_geom)", PostgisBackend ),
+	( 'spatialite', "dbname='/data/ps.sqlite' table=\"ps\" (the_geom)", SpatialiteBackend ),
+	( 'ogr', "/data/ps.gpkg|layername=ps", GpkgBackend ),
+	( 'ogr', "/data/PS.SHP", ShapefileBackend ),
+	( 'ogr', "/data/ts.vrt", VrtBackend ),
+	( 'ogr', "OCI:user/pwd@db:PS", OciBackend ),
+	( 'ogr', "/data/ts.psts", StoreBackend ),
+	( 'ogr', "/data/ts.PSA", StoreBackend ),
+	( 'ogr', "/data/ps.kml", None ),
+	( 'memory', "Point?crs=epsg:4326", None ),
+] )
+def test_find_backend(providerType, source, backend):
+	assert findBackend( providerType, source ) is backend
+
+def test_registry():
+	for name, cls in BACKENDS.items():
+		assert cls.name == name
+
+
+def test_quote_value():
+	assert quoteValue( None ) == "NULL"
+	assert quoteValue( True ) == "TRUE"
+	assert quoteValue( 12 ) == "12"
+	assert quoteValue( 1.5 ) == "1.5"
+	assert quoteValue( "it's" ) == "'it''s'"
+	assert quoteValue( "a\\b\n" ) == "'a\\\\b\\n'"
+
+
+class FakeRows:
+	""" rows function of the features of a time-series layer. The rows
+	are filtered by the quoted text codes within the expression, or all
+	of them are returned as by a provider which can't filter them """
+
+	def __init__(self, features, filtered=False):
+		self.features = features
+		self.filtered = filtered
+		self.expressions = []
+
+	def __call__(self, expression, isCanceled):
+		self.expressions.append( expression )
+		if not self.filtered:
+			return iter( self.features )
+		return ( f for f in self.features if quoteValue( f[0][0] ) in expression )
+
+
+def test_feature_backend():
+	rows = FakeRows( [
+		( [ "A1" ], "20030410", 2.0 ),
+		( [ "B2" ], "20030317", 5.0 ),
+		( [ "A1" ], "20030317", 1.0 ),
+		( [ "A1" ], "", 9.0 ),				# no valid date
+		( [ "C3" ], "20030504", 7.0 ),		# not requested
+		( [ 12.0 ], "20030504", 3.0 ),		# numeric codes match by their text
+	] )
+	backend = FeatureBackend( rows, [ 'code' ] )
+	series = backend.fetchMany( [ "A1", "B2", "A1", 12, "D4" ] )
+	assert sorted( series, key=str ) == [ 12, "A1", "B2", "D4" ]
+	np.testing.assert_array_equal( series[ "A1" ][0], np.array( [ '2003-03-17', '2003-04-10' ], dtype='datetime64[D]' ) )
+	np.testing.assert_array_equal( series[ "A1" ][1], [ 1.0, 2.0 ] )
+	np.testing.assert_array_equal( series[ "B2" ][1], [ 5.0 ] )
+	np.testing.assert_array_equal( series[ 12 ][1], [ 3.0 ] )
+	assert len(series[ "D4" ][0]) == len(series[ "D4" ][1]) == 0
+	assert series[ "D4" ][0].dtype == np.dtype('datetime64[D]')
+	assert rows.expressions == [ "\"code\" IN ('A1', 'B2', 12, 'D4')" ]
+	assert backend.fetch( "B2" )[1].tolist() == [ 5.0 ]
+
+
+def test_feature_backend_compound_keys():
+	rows = FakeRows( [
+		( [ 1, "A1" ], "2003-03-17", 1.0 ),
+		( [ 2, "A1" ], "2003-03-17", 2.0 ),
+		( [ "1", "A1" ], "2003-04-10", 3.0 ),
+	] )
+	backend = FeatureBackend( rows, [ 'id_dataset', 'code_target' ] )
+	series = backend.fetchMany( [ (1, "A1"), (3, "A1") ] )
+	np.testing.assert_array_equal( series[ (1, "A1") ][1], [ 1.0, 3.0 ] )
+	assert len(series[ (3, "A1") ][0]) == 0
+	assert rows.expressions == [ "(\"id_dataset\" = 1 AND \"code_target\" = 'A1') OR (\"id_dataset\" = 3 AND \"code_target\" = 'A1')" ]
+
+
+def test_feature_backend_chunks():
+	rows = FakeRows( [ ( [ "A%d" % i ], "20030317", float(i) ) for i in range(5) ], True )
+	series = FeatureBackend( rows, [ 'code' ] ).fetchMany( [ "A%d" % i for i in range(5) ], chunkSize=2 )
+	assert len(rows.expressions) == 3
+	assert [ series[ "A%d" % i ][1].tolist() for i in range(5) ] == [ [ float(i) ] for i in range(5) ]
+
+
+def test_feature_backend_canceled():
+	rows = FakeRows( [ ( [ "A1" ], "20030317", 1.0 ) ] )
+	backend = FeatureBackend( rows, [ 'code' ] ).bind( isCanceled=lambda: True )
+	series = backend.fetchMany( [ "A1" ] )
+	assert rows.expressions == []
+	assert len(series[ "A1" ][0]) == 0
+
+
+def test_sql_backend(tsDatabase):
+	reader = TSSqlReader()
+	try:
+		backend = SpatialiteBackend( reader, tsDatabase, None, 'ts' )
+		series = backend.fetchMany( [ "A6KW1", "NOPS" ], chunkSize=1 )
+		x, y = backend.fetch( "A6KW1" )
+		np.testing.assert_array_equal( series[ "A6KW1" ][0], x )
+		assert len(x) > 0 and np.all( np.diff( x.astype( np.int64 ) ) >= 0 )
+		assert len(series[ "NOPS" ][0]) == 0
+		assert backend.stamp() is not None
+
+		other = TSSqlReader()
+		assert backend.bind( other ).reader is other
+		assert backend.bind( reader ) is backend
+		other.close()
+
+		with pytest.raises( TSBackendError ):
+			SpatialiteBackend( reader, tsDatabase, None, 'nots' ).fetchMany( [ "A6KW1" ] )
+	finally:
+		reader.close()
+
+
+def test_store_backend(tmp_path):
+	closeStores()
+	path = str(tmp_path / "ts.psts")
+	dates = np.array( [ '2003-03-17', '2003-04-10' ], dtype='datetime64[D]' )
+	writeStore( path, [ "A1" ], dates, np.array( [ [ 1.0, 2.0 ] ] ) )
+	series = StoreBackend( path ).fetchMany( [ "A1", "B2" ] )
+	np.testing.assert_array_equal( series[ "A1" ][0], dates )
+	assert len(series[ "B2" ][0]) == 0
+
+	with pytest.raises( TSBackendError ):
+		StoreBackend( str(tmp_path / "none.psts") ).fetchMany( [ "A1" ] )
+	closeStores()
+
+
+def test_shapefile_backend(testdata):
+	closeDbfs()
+	dbfPath = os.path.join( testdata, SHAPEFILE + ".dbf" )
+	dates = np.array( [ '2003-03-17', '2003-04-10' ], dtype='datetime64[D]' )
+	backend = ShapefileBackend( dbfPath, [ 'd20030317', 'd20030410' ], dates )
+	series = backend.fetchMany( [ 3, 0 ] )
+	assert sorted( series ) == [ 0, 3 ]
+	assert series[ 0 ][0] is dates
+	assert series[ 0 ][1].shape == (2,)
+
+	with pytest.raises( TSBackendError ):
+		ShapefileBackend( dbfPath, [ 'd19990101' ], dates[ :1 ] ).fetchMany( [ 0 ] )
+	closeDbfs()
+
+
+class FakeHost:
+	""" the plugin as seen by setupJob """
+
+	def __init__(self, table):
+		self.table = table
+		self.tsSql = None
+		self.asked = []
+
+	def askTSTable(self, ps_layer, default):
+		self.asked.append( default )
+		return self.table
+
+
+class FakeJob:
+
+	def __init__(self, keyFields=( 'code', )):
+		self.keyFields = list(keyFields)
+		self.dateField, self.valueField = "dataripresa", "valore"
+		self.uri = self.backend = None
+
+	def featureRows(self, expression, isCanceled=None):
+		return iter( [] )
+
+
+def test_setup_store_job():
+	job = FakeJob()
+	assert StoreBackend.setupJob( FakeHost( None ), job, None, "/data/ts.psts" )
+	assert job.uri == "/data/ts.psts"
+	assert isinstance(job.backend, StoreBackend) and job.backend.path == "/data/ts.psts"
+
+
+def test_setup_oci_job():
+	host = FakeHost( "TS" )
+	job = FakeJob( OciBackend.keyFields )
+	assert OciBackend.setupJob( host, job, None, "OCI:user/pwd@db:PS" )
+	assert host.asked == [ OciBackend.defaultTable ]
+	assert job.uri == "OCI:user/pwd@db:TS"
+	assert isinstance(job.backend, OciBackend) and job.backend.keyFields == OciBackend.keyFields
+
+	# canceled by the user
+	job = FakeJob()
+	assert not OciBackend.setupJob( FakeHost( None ), job, None, "OCI:user/pwd@db:PS" )
+	assert job.backend is None
+
+
+def test_setup_gpkg_job(tmp_path):
+	checked = []
+	host = FakeHost( "ts" )
+	host.checkGpkgTable = lambda dbpath, table: checked.append( (dbpath, table) ) or True
+	job = FakeJob()
+	dbpath = str(tmp_path / "ps.gpkg")
+	assert GpkgBackend.setupJob( host, job, None, "%s|layername=ps" % dbpath )
+	assert host.asked == [ "ts_ps" ] and checked == [ (dbpath, "ts") ]
+	assert job.uri == "%s|layername=ts" % dbpath
+	assert (job.backend.conninfo, job.backend.table) == (dbpath, "ts")
+
+	assert GpkgBackend.layerOf( "/data/ps.gpkg" ) == ( "/data/ps.gpkg", "ps" )
+
+
+def test_register_backend():
+	# a new kind of source needs nothing but its class
+	@registerBackend
+	class MemoryBackend(StoreBackend):
+		name = 'memory_test'
+
+		@classmethod
+		def accepts(cls, providerType, source):
+			return providerType == 'memory'
+
+	try:
+		assert findBackend( 'memory', "Point?crs=epsg:4326" ) is MemoryBackend
+		job = FakeJob()
+		assert MemoryBackend.setupJob( FakeHost( None ), job, None, "Point" )
+		assert isinstance(job.backend, MemoryBackend)
+	finally:
+		del BACKENDS[ 'memory_test' ]
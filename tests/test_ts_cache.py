@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from pstimeseries.ts_cache import SeriesCache
+
+X = np.array( [ '2003-03-17', '2003-04-10', '2003-05-04' ], dtype='datetime64[D]' )
+Y = np.array( [ 0.0, -8.33, np.nan ] )
+
+
+def _key(code, source="dbname='ps'", table="ts"):
+	return ( source, table, code )
+
+
+@pytest.mark.parametrize( "compact", [ True, False ] )
+def test_round_trip(compact):
+	cache = SeriesCache( compact=compact )
+	assert cache.get( _key( "A1" ) ) is None
+
+	x, y = cache.put( _key( "A1" ), [ '2003-03-17', '2003-04-10', '2003-05-04' ], Y )
+	assert x.dtype == np.dtype('datetime64[D]') and y.dtype == np.float32
+	cx, cy = cache.get( _key( "A1" ) )
+	np.testing.assert_array_equal( cx, X )
+	np.testing.assert_array_equal( cy, Y.astype( np.float32 ) )
+
+	assert _key( "A1" ) in cache and len(cache) == 1
+	stats = cache.stats()
+	assert (stats['entries'], stats['hits'], stats['misses']) == (1, 1, 1)
+	assert stats['bytes'] > 0
+
+	cache.remove( _key( "A1" ) )
+	assert len(cache) == 0 and cache.stats()['bytes'] == 0
+
+
+@pytest.mark.parametrize( "compact", [ True, False ] )
+def test_lru_budget(compact):
+	cache = SeriesCache( compact=compact )
+	cache.put( _key( "A0" ), X, Y )
+	size = cache.stats()['bytes']
+	cache.setMaxBytes( size * 3 )
+
+	for i in range(1, 3):
+		cache.put( _key( "A%d" % i ), X, Y )
+	# A0 is used, so A1 is the least recently used one
+	assert cache.get( _key( "A0" ) ) is not None
+	cache.put( _key( "A3" ), X, Y )
+	assert _key( "A1" ) not in cache
+	assert [ _key( "A%d" % i ) in cache for i in (0, 2, 3) ] == [ True, True, True ]
+	assert cache.stats()['bytes'] == size * 3
+
+	# storing a key again doesn't count it twice
+	cache.put( _key( "A3" ), X, Y )
+	assert len(cache) == 3 and cache.stats()['bytes'] == size * 3
+
+	cache.setMaxBytes( size )
+	assert len(cache) == 1 and _key( "A3" ) in cache
+
+	# too big for the budget
+	cache.setMaxBytes( size - 1 )
+	assert cache.put( _key( "A4" ), X, Y ) is None
+	assert _key( "A4" ) not in cache
+
+
+def test_invalidate():
+	cache = SeriesCache()
+	for source in ( "a.sqlite", "b.sqlite" ):
+		for table in ( "ts", "ts2" ):
+			cache.put( _key( "A1", source, table ), X, Y )
+
+	cache.invalidate( "a.sqlite", "ts" )
+	assert _key( "A1", "a.sqlite", "ts" ) not in cache
+	assert len(cache) == 3
+
+	cache.invalidate( "b.sqlite" )
+	assert len(cache) == 1 and _key( "A1", "a.sqlite", "ts2" ) in cache
+	size = cache.stats()['bytes']
+
+	cache.clear()
+	assert len(cache) == 0 and cache.stats()['bytes'] == 0 and size > 0
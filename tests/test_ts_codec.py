@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from pstimeseries.ts_codec import NAN_VALUES, quantizedDtype, quantize, dequantize, deltaDtype, encodeDays, \
+		decodeDays, EncodedSeries
+
+
+@pytest.mark.parametrize( "values, dtype", [
+	( [ 0.0, -8.33, 12.5, np.nan ], '<i2' ),
+	( [ 327.66, -327.66 ], '<i2' ),
+	( [ 327.68 ], '<i4' ),
+	( [ 1e8 ], None ),			# beyond int32 in units of precision
+	( [ 0.125 ], None ),		# not a multiple of the precision
+	( [ np.nan ], '<i2' ),
+	( [], '<i2' ),
+] )
+def test_quantized_dtype(values, dtype):
+	expected = np.dtype(dtype) if dtype is not None else None
+	assert quantizedDtype( values ) == expected
+
+
+@pytest.mark.parametrize( "dtype", [ '<i2', '<i4' ] )
+def test_quantize_round_trip(dtype):
+	values = np.array( [ 0.0, -8.33, 12.5, np.nan, 0.01 ], dtype=np.float32 )
+	q = quantize( values, dtype )
+	assert q.dtype == np.dtype(dtype)
+	assert q[3] == NAN_VALUES[ np.dtype(dtype) ]
+	np.testing.assert_array_equal( dequantize( q ), values )
+
+
+@pytest.mark.parametrize( "deltas, dtype", [
+	( [], '<u1' ), ( [ 0, 255 ], '<u1' ), ( [ 256 ], '<u2' ), ( [ 70000 ], '<i4' ), ( [ -1 ], '<i4' ), ( [ 2**40 ], '<i8' ),
+] )
+def test_delta_dtype(deltas, dtype):
+	assert deltaDtype( np.array( deltas, dtype=np.int64 ) ) == np.dtype(dtype)
+
+
+def test_days_round_trip():
+	dates = np.array( [ '2003-03-17', '2003-04-10', '2003-04-10', '2010-01-01' ], dtype='datetime64[D]' )
+	start, deltas = encodeDays( dates.astype( np.int64 ) )
+	assert deltas.dtype == np.dtype('<u2')
+	np.testing.assert_array_equal( decodeDays( start, deltas ), dates )
+
+	start, deltas = encodeDays( [] )
+	assert len(deltas) == 0
+
+
+@pytest.mark.parametrize( "y", [
+	[ 0.0, -8.33, np.nan ],		# quantized
+	[ 0.125, 1e-3, np.nan ],	# kept as float32
+] )
+def test_encoded_series(y):
+	x = np.array( [ '2003-03-17', '2003-04-10', '2003-05-04' ], dtype='datetime64[D]' )
+	y = np.array( y, dtype=np.float32 )
+	entry = EncodedSeries( x, y )
+	assert entry.nbytes == entry.deltas.nbytes + entry.values.nbytes + 16
+	dx, dy = entry.decode()
+	np.testing.assert_array_equal( dx, x )
+	np.testing.assert_array_equal( dy, y )
+
+	parts = EncodedSeries.fromParts( entry.start, entry.deltas, entry.values, entry.count )
+	np.testing.assert_array_equal( parts.decode()[1], y )
+
+
+def test_encoded_series_empty():
+	entry = EncodedSeries( np.array( [], dtype='datetime64[D]' ), [] )
+	x, y = entry.decode()
+	assert x.dtype == np.dtype('datetime64[D]') and y.dtype == np.float32
+	assert len(x) == len(y) == 0
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import os
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from pstimeseries.ps_store import PSArchive
+from pstimeseries.ts_convert import convertDump, outputFormat, formatStats, ConvertError
+
+from conftest import dumpRows
+
+
+@pytest.fixture
+def dump(testdata):
+	return os.path.join( testdata, "PostGIS-Spatialite", "ts_all_asce.txt" )
+
+
+def test_output_format():
+	assert outputFormat( "/data/ts.PSTS" ) == 'psts'
+	assert outputFormat( "/data/ts.psa" ) == 'psa'
+
+
+@pytest.mark.parametrize( "chunkRows", [ 7, 1000000 ] )
+def test_convert_dump(tmp_path, dump, chunkRows):
+	path = str(tmp_path / "ts.psa")
+	progress = []
+	stats = convertDump( dump, path, chunkRows=chunkRows, progress=progress.append )
+	rows = dumpRows()
+	assert stats['rows'] == len(rows) and stats['skipped'] == 0
+	assert stats['format'] == 'psa' and stats['valueType'] == 'int16'
+	assert progress[-1] == 100.0 and progress == sorted( progress )
+	assert formatStats( stats ).startswith( "%d rows of %d PS" % (len(rows), stats['codes']) )
+
+	series = defaultdict( list )
+	for code, date, value, rowid in rows:
+		series[ code ].append( ( date, value ) )
+
+	archive = PSArchive( path )
+	assert len(archive) == len(series) == stats['codes']
+	for code, values in series.items():
+		# the values of a repeated date keep the order of the dump
+		values.sort( key=lambda v: v[0] )
+		dates, vals = archive.fetch( code )
+		np.testing.assert_array_equal( dates, np.array( [ "%s-%s-%s" % (d[:4], d[4:6], d[6:]) for d, v in values ], dtype='datetime64[D]' ) )
+		np.testing.assert_allclose( vals, [ v for d, v in values ], atol=1e-5 )
+
+
+def test_convert_errors(tmp_path, dump):
+	path = str(tmp_path / "ts.psa")
+	with pytest.raises( ConvertError ):
+		convertDump( dump, path, valueField="spost" )
+	with pytest.raises( ConvertError ):
+		convertDump( dump, path, fmt="csv" )
+	with pytest.raises( ConvertError ):
+		convertDump( dump, path, chunkRows=7, isCanceled=lambda: True )
+	assert not os.path.exists( path )
+	assert os.listdir( str(tmp_path) ) == []
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+from pstimeseries.ts_disk_cache import DiskSeriesCache
+
+X = np.array( [ '2003-03-17', '2003-04-10', '2003-05-04' ], dtype='datetime64[D]' )
+Y = np.array( [ 0.0, -8.33, np.nan ] )
+KEY = ( "dbname='ps' user='me' password='secret'", "ts", "A6KW1" )
+
+
+@pytest.fixture
+def cache(tmp_path):
+	cache = DiskSeriesCache( str(tmp_path / "cache" / "series.sqlite") )
+	yield cache
+	cache.close()
+
+
+def test_round_trip(cache):
+	assert cache.get( KEY, "rows:1" ) is None
+	cache.put( KEY, "rows:1", X, Y )
+	x, y = cache.get( KEY, "rows:1" )
+	np.testing.assert_array_equal( x, X )
+	np.testing.assert_allclose( y, Y, atol=1e-6 )
+
+	# several key values
+	key = ( "/data/ts.vrt", None, (1, "A1") )
+	cache.put( key, "mtime:1", X[ :1 ], Y[ :1 ] )
+	np.testing.assert_array_equal( cache.get( key, "mtime:1" )[0], X[ :1 ] )
+
+	stats = cache.stats()
+	assert (stats['entries'], stats['hits'], stats['misses'], stats['errors']) == (2, 2, 1, 0)
+
+
+def test_credentials_not_stored(cache):
+	cache.put( KEY, "rows:1", X, Y )
+	with open( cache.path, 'rb' ) as f:
+		data = f.read()
+	with open( cache.path + "-wal", 'rb' ) as f:
+		data += f.read()
+	assert b"secret" not in data
+
+
+def test_stale(cache):
+	cache.put( KEY, "rows:1", X, Y )
+	assert cache.get( KEY, "rows:2" ) is None
+	# the stale entry is dropped
+	assert cache.stats()['entries'] == 0
+	assert cache.stats()['bytes'] == 0
+
+
+def test_persistent(tmp_path):
+	path = str(tmp_path / "series.sqlite")
+	cache = DiskSeriesCache( path )
+	cache.put( KEY, "rows:1", X, Y )
+	size = cache.stats()['bytes']
+	cache.close()
+
+	cache = DiskSeriesCache( path )
+	assert cache.stats()['bytes'] == size
+	np.testing.assert_array_equal( cache.get( KEY, "rows:1" )[0], X )
+	cache.clear()
+	assert cache.stats()['entries'] == cache.stats()['bytes'] == 0
+	cache.close()
+
+
+def test_trim(cache):
+	keys = [ ( "source", "ts", "A%d" % i ) for i in range(10) ]
+	for key in keys:
+		cache.put( key, "s", X, Y )
+	size = cache.stats()['bytes'] // 10
+
+	# the least recently used are dropped first
+	cache.get( keys[0], "s" )
+	cache.setMaxBytes( size * 5 )
+	stats = cache.stats()
+	assert stats['bytes'] <= size * 5 * 0.9
+	assert cache.get( keys[0], "s" ) is not None
+	assert cache.get( keys[1], "s" ) is None
+
+	# too big to be cached
+	cache.setMaxBytes( size - 1 )
+	cache.put( keys[1], "s", X, Y )
+	assert cache.get( keys[1], "s" ) is None
+
+
+def test_locked(cache):
+	cache.put( KEY, "rows:1", X, Y )
+	other = sqlite3.connect( cache.path, isolation_level=None )
+	other.execute( "BEGIN EXCLUSIVE" )
+	try:
+		# the file is locked by another QGIS instance: the put is skipped,
+		# the entry is still read but its use isn't recorded
+		cache.put( ( "source", "ts", "B2" ), "rows:1", X, Y )
+		np.testing.assert_array_equal( cache.get( KEY, "rows:1" )[0], X )
+		assert cache.stats()['errors'] == 2
+	finally:
+		other.execute( "ROLLBACK" )
+		other.close()
+
+	assert cache.get( KEY, "rows:1" ) is not None
+	assert cache.get( ( "source", "ts", "B2" ), "rows:1" ) is None
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from pstimeseries.ts_fit import FitCache, polyFit, splineFit, splineEval
+
+
+def test_fit_cache():
+	cache = FitCache( maxEntries=2 )
+	calls = []
+	def compute(value):
+		return lambda: calls.append( value ) or value
+
+	assert cache.get( 1, 'poly', [ 2 ], compute( "a" ) ) == "a"
+	assert cache.get( 1, 'poly', ( 2, ), compute( "b" ) ) == "a"
+	assert cache.get( 1, 'poly', [ 3 ], compute( "c" ) ) == "c"
+	# another version of the series is another fit
+	assert cache.get( 2, 'poly', [ 2 ], compute( "d" ) ) == "d"
+	assert calls == [ "a", "c", "d" ]
+	assert (cache.hits, cache.misses) == (1, 3)
+
+	# the least recently used one was dropped
+	assert cache.get( 1, 'poly', [ 3 ], compute( "e" ) ) == "c"
+	assert cache.get( 1, 'poly', [ 2 ], compute( "f" ) ) == "f"
+
+	cache.clear()
+	assert cache.get( 1, 'poly', [ 3 ], compute( "g" ) ) == "g"
+
+
+def test_fit_cache_none_result():
+	# a fit which can't be computed isn't computed again
+	cache = FitCache()
+	calls = []
+	assert cache.get( 1, 'spline', [], lambda: calls.append( 1 ) ) is None
+	assert cache.get( 1, 'spline', [], lambda: calls.append( 1 ) ) is None
+	assert calls == [ 1 ]
+
+
+def test_poly_fit():
+	x = np.arange( 10, dtype=np.float64 )
+	y = 0.5 * x ** 2 - x + 3
+	np.testing.assert_allclose( polyFit( x, y, 2 ), y )
+	np.testing.assert_allclose( polyFit( x, 2 * x + 1, 1 ), 2 * x + 1 )
+
+
+def test_spline():
+	pytest.importorskip( "scipy" )
+	x = np.arange( 10, dtype=np.float64 )
+	y = np.sin( x )
+	tck = splineFit( x, y )
+	sx, sy = splineEval( tck, 0, 9, 10 )
+	np.testing.assert_allclose( sx, x )
+	np.testing.assert_allclose( sy, y, atol=1e-9 )
+
+	# too few points to interpolate
+	assert splineFit( x[ :2 ], y[ :2 ] ) is None
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from pstimeseries.ts_lod import decimateLine, decimatePoints
+
+
+def _columns(px, py, idx):
+	# column -> (first, last, lowest, highest) of the vertices
+	columns = {}
+	for i in idx:
+		if np.isfinite( py[i] ):
+			columns.setdefault( int(np.floor( px[i] )), [] ).append( i )
+	return dict( (c, ( py[ v[0] ], py[ v[-1] ], py[ v ].min(), py[ v ].max() )) for c, v in columns.items() )
+
+
+def test_line_sparse():
+	px = np.arange( 20, dtype=np.float64 ) * 10
+	py = np.sin( px )
+	# the vertices within the view and the nearest ones out of it
+	np.testing.assert_array_equal( decimateLine( px, py, 35, 95 ), np.arange( 3, 11 ) )
+	np.testing.assert_array_equal( decimateLine( px, py, -50, 500 ), np.arange( 20 ) )
+	assert len(decimateLine( px, py, 500, 600 )) == 1
+
+
+def test_line_dense():
+	rng = np.random.RandomState( 1 )
+	px = np.sort( rng.uniform( 0, 100, 100000 ) )
+	py = rng.normal( size=len(px) )
+	py[ [ 10, 5000, 5001 ] ] = np.nan
+
+	idx = decimateLine( px, py, 0, 100 )
+	assert len(idx) < 4 * 100 + 3 + 2
+	assert np.all( np.diff( idx ) > 0 )
+	# the same pixels are drawn: ends and extremes of each column, and the gaps
+	assert _columns( px, py, idx ) == _columns( px, py, np.arange( len(px) ) )
+	assert set( [ 10, 5000, 5001 ] ) <= set( idx.tolist() )
+
+	# zoomed in 1000 times the raw vertices are drawn
+	idx = decimateLine( px * 1000, py, 10000, 10050 )
+	np.testing.assert_array_equal( idx, np.arange( idx[0], idx[-1] + 1 ) )
+	assert len(idx) == np.count_nonzero( (px >= 10) & (px <= 10.05) ) + 2
+
+
+def test_line_no_values():
+	px = np.arange( 1000, dtype=np.float64 ) / 100
+	py = np.full( len(px), np.nan )
+	np.testing.assert_array_equal( decimateLine( px, py, 0, 10 ), np.arange( 1000 ) )
+
+
+def test_points():
+	px = np.array( [ 10.1, 10.2, 10.7, -30.0, 50.0, 10.15, 105.0 ] )
+	py = np.array( [ 5.1, 5.2, 5.1, 5.0, 50.0, 5.15, 5.0 ] )
+	idx = decimatePoints( px, py, 0, 0, 100, 100, margin=16, cell=0.5 )
+	# 1 and 5 are in the cell of 0, 3 is out of the box by more than the margin
+	np.testing.assert_array_equal( idx, [ 0, 2, 4, 6 ] )
+
+
+def test_points_cover_cells():
+	rng = np.random.RandomState( 2 )
+	px = rng.uniform( -20, 120, 50000 )
+	py = rng.uniform( -20, 120, 50000 )
+	idx = decimatePoints( px, py, 0, 0, 100, 100 )
+	assert np.all( np.diff( idx ) > 0 )
+
+	cells = lambda i: set( zip( np.floor( px[i] * 2 ).astype( int ), np.floor( py[i] * 2 ).astype( int ) ) )
+	inside = np.flatnonzero( (np.abs( px - 50 ) < 66) & (np.abs( py - 50 ) < 66) )
+	assert len(idx) == len(cells( idx ))
+	assert cells( idx ) == cells( inside )
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from pstimeseries.date_utils import decodeDates
+from pstimeseries import ts_sql
+from pstimeseries.ts_sql import TSSqlReader, TSSqlError, sqliteHasTable, sqliteHasIndex, quoteIdentifier, qualifiedName, \
+		seriesTableComment
+
+from conftest import dumpRows
+
+
+def _expected():
+	# code -> (dates, values) of the sample dump, in the order of the rows
+	series = defaultdict( lambda: ([], []) )
+	for code, date, value, rowid in dumpRows():
+		series[ code ][0].append( date )
+		series[ code ][1].append( value )
+	return dict( (code, (decodeDates( x ), np.array( y ))) for code, (x, y) in series.items() )
+
+def _assertSeries(found, expected):
+	# the series are sorted by date, the order of repeated dates is free
+	x, y = found
+	assert x.dtype == np.dtype('datetime64[D]')
+	order = np.lexsort( ( expected[1], expected[0] ) )
+	np.testing.assert_array_equal( x, expected[0][ order ] )
+	for day in np.unique( x ):
+		np.testing.assert_allclose( np.sort( y[ x == day ] ), np.sort( expected[1][ expected[0] == day ] ) )
+
+
+@pytest.fixture
+def reader():
+	reader = TSSqlReader()
+	yield reader
+	reader.close()
+
+
+@pytest.mark.parametrize( "providerType", [ 'spatialite', 'gpkg' ] )
+def test_fetch(reader, tsDatabase, providerType):
+	expected = _expected()
+	for code in expected:
+		_assertSeries( reader.fetch( providerType, tsDatabase, None, 'ts', code, 'dataripresa', 'valore' ), expected[ code ] )
+
+	x, y = reader.fetch( providerType, tsDatabase, None, 'ts', 'NOPS', 'dataripresa', 'valore' )
+	assert len(x) == len(y) == 0
+
+
+@pytest.mark.parametrize( "chunkSize", [ 1, 3, 500 ] )
+def test_fetch_many(reader, tsDatabase, chunkSize):
+	expected = _expected()
+	codes = sorted( expected ) + [ 'NOPS' ]
+	series = reader.fetchMany( 'spatialite', tsDatabase, None, 'ts', codes, 'dataripresa', 'valore', chunkSize )
+	assert sorted( series ) == sorted( codes )
+	for code in expected:
+		_assertSeries( series[ code ], expected[ code ] )
+	assert len(series[ 'NOPS' ][0]) == 0
+
+
+def test_fetch_errors(reader, tsDatabase):
+	with pytest.raises( TSSqlError ):
+		reader.fetch( 'spatialite', tsDatabase, None, 'nots', 'A6KW1', 'dataripresa', 'valore' )
+	# the reader works again after the error
+	assert len(reader.fetch( 'spatialite', tsDatabase, None, 'ts', 'A6KW1', 'dataripresa', 'valore' )[0]) > 0
+
+
+def test_table_stamp(reader, tsDatabase, tmp_path):
+	rows = dumpRows()
+	assert reader.tableStamp( 'spatialite', tsDatabase, None, 'ts' ) == "rows:%d,id:%d" % (len(rows), max( r[3] for r in rows ))
+
+	path = str(tmp_path / "noid.sqlite")
+	conn = sqlite3.connect( path )
+	conn.execute( "CREATE TABLE ts (code TEXT, dataripresa TEXT, valore REAL)" )
+	conn.execute( "INSERT INTO ts VALUES ('A1', '20030317', 1.0)" )
+	conn.commit()
+	conn.close()
+	assert reader.tableStamp( 'spatialite', path, None, 'ts' ) == "rows:1,id:None"
+
+
+def test_sqlite_catalog(tsDatabase):
+	assert sqliteHasTable( tsDatabase, 'ts' )
+	assert not sqliteHasTable( tsDatabase, 'nots' )
+	assert sqliteHasIndex( tsDatabase, 'ts', 'CODE' )
+	assert not sqliteHasIndex( tsDatabase, 'ts', 'valore' )
+
+
+def test_quoting():
+	assert quoteIdentifier( 'a"b' ) == '"a""b"'
+	assert qualifiedName( None, 'ts' ) == '"ts"'
+	assert qualifiedName( 'public', 'ts' ) == '"public"."ts"'
+
+
+def test_null_rows(reader, tmp_path):
+	# a NULL value is a missing acquisition, a NULL or invalid date drops
+	# the row: values never move onto the dates of other rows
+	path = str(tmp_path / "nulls.sqlite")
+	conn = sqlite3.connect( path )
+	conn.execute( "CREATE TABLE ts (code TEXT, dataripresa TEXT, valore REAL)" )
+	conn.executemany( "INSERT INTO ts VALUES (?, ?, ?)", [ ( 'A1', '20200101', 1.0 ), ( 'A1', '20200107', None ),
+			( 'A1', '20200113', 3.0 ), ( 'A1', None, 4.0 ), ( 'A1', 'x', 6.0 ), ( 'A1', '20200119', 5.0 ),
+			( 'B2', None, 1.0 ) ] )
+	conn.commit()
+	conn.close()
+
+	expected = np.array( [ '2020-01-01', '2020-01-07', '2020-01-13', '2020-01-19' ], dtype='datetime64[D]' )
+	for x, y in ( reader.fetch( 'spatialite', path, None, 'ts', 'A1', 'dataripresa', 'valore' ),
+			reader.fetchMany( 'gpkg', path, None, 'ts', [ 'A1' ], 'dataripresa', 'valore' )[ 'A1' ] ):
+		np.testing.assert_array_equal( x, expected )
+		np.testing.assert_array_equal( y, [ 1.0, np.nan, 3.0, 5.0 ] )
+
+	x, y = reader.fetch( 'spatialite', path, None, 'ts', 'B2', 'dataripresa', 'valore' )
+	assert len(x) == len(y) == 0
+	x, y = reader.fetchMany( 'spatialite', path, None, 'ts', [ 'B2' ], 'dataripresa', 'valore' )[ 'B2' ]
+	assert len(x) == len(y) == 0
+
+
+def test_decode():
+	x, y = TSSqlReader._decode( [ '2020-01-01', None, '2020-01-13' ], [ 1.0, 2.0, None ] )
+	np.testing.assert_array_equal( x, np.array( [ '2020-01-01', '2020-01-13' ], dtype='datetime64[D]' ) )
+	np.testing.assert_array_equal( y, [ 1.0, np.nan ] )
+
+
+class FakePostgis:
+	""" connection and cursor answering the series table check with the
+	comment of the series table and the catalog data of the TS table """
+
+	def __init__(self, comment, maxid):
+		self.exists = True
+		self.comment = comment
+		self.maxid = maxid
+		self.queries = 0
+
+	def cursor(self):
+		return self
+
+	def execute(self, sql, params=None):
+		self.queries += 1
+		if "obj_description" in sql:
+			self.row = ( self.exists, self.comment if self.exists else None )
+		elif "relkind" in sql:
+			self.row = ( 'r', 16384, 10, 0, 0, True )
+		else:
+			self.row = ( self.maxid, )
+
+	def fetchone(self):
+		return self.row
+
+	def close(self):
+		pass
+
+
+def test_series_table_freshness(reader, monkeypatch):
+	stamp = "node:16384,ins:10,upd:0,del:0,id:10"
+	db = FakePostgis( seriesTableComment( stamp ), 10 )
+	monkeypatch.setattr( reader, "_connect", lambda providerType, conninfo: db )
+	assert reader._hasSeriesTable( "dbname=ps", "public", "ts" )
+	assert reader.popStaleSeriesTables() == set()
+
+	# checked again only after a while
+	db.maxid = 11
+	queries = db.queries
+	assert reader._hasSeriesTable( "dbname=ps", "public", "ts" )
+	assert db.queries == queries
+
+	# rows loaded since the series table was built
+	monkeypatch.setattr( ts_sql, "SERIES_TABLE_CHECK", 0 )
+	assert not reader._hasSeriesTable( "dbname=ps", "public", "ts" )
+	assert reader.popStaleSeriesTables() == set( [ ("dbname=ps", "public", "ts") ] )
+	assert reader.popStaleSeriesTables() == set()
+
+	# one built before the stamps were recorded
+	db.comment = None
+	assert not reader._hasSeriesTable( "dbname=ps", "public", "ts" )
+	assert len(reader.popStaleSeriesTables()) == 1
+
+	db.exists = False
+	assert not reader._hasSeriesTable( "dbname=ps", "public", "ts" )
+	assert reader.popStaleSeriesTables() == set()
@@ -0,0 +1,523 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Time-series backends, one class for each kind of source the time series are
+read from. Each one reads the series of a PS with fetch(code) and those of
+several PS at once with fetchMany(codes), as (dates, values) arrays.
+
+A backend is created in the main thread with everything it needs to read the
+series, then used from worker threads. It doesn't depend on QGIS: the feature
+backends are given a function yielding the rows of the time-series layer.
+Only setupJob(), which the plugin calls on each click to create the backend
+of the PS layer, imports what it needs of QGIS.
+"""
+
+import os
+import copy
+from collections import OrderedDict
+
+import numpy as np
+
+from .date_utils import decodeDates
+from .ts_sql import CHUNK_SIZE, TSSqlError, quoteIdentifier
+
+
+class TSBackendError(Exception):
+	pass
+
+
+# name -> backend class, in the order the sources are matched
+BACKENDS = OrderedDict()
+
+def registerBackend(cls):
+	""" class decorator adding the backend to the registry """
+	BACKENDS[ cls.name ] = cls
+	return cls
+
+def findBackend(providerType, source):
+	""" return the class of the backend reading the time series of the PS
+	layer source, None if it's not supported """
+	for cls in BACKENDS.values():
+		if cls.accepts( providerType, source ):
+			return cls
+
+
+def emptySeries():
+	return np.array( [], dtype='datetime64[D]' ), np.array( [], dtype=np.float64 )
+
+def fileStamp(path):
+	""" return the version of a file, None if it can't be read """
+	try:
+		st = os.stat( path )
+	except EnvironmentError:
+		return
+	return "mtime:%d,size:%d" % (st.st_mtime_ns, st.st_size)
+
+
+class TSBackend:
+	""" base class of the backends. fetch() and fetchMany() return empty
+	arrays for the PS with no time series, None when the backend can't
+	read them and another one must be tried. They raise TSBackendError
+	on errors """
+
+	name = None
+
+	# PS fields identifying the PS in the time-series table, none when the
+	# values are stored within the PS features
+	keyFields = ( 'code', )
+	dateField = "dataripresa"
+	valueField = "valore"
+
+	# whether the series can be read from a time-series layer too, and
+	# whether they're worth caching
+	tsLayer = True
+	cached = True
+
+	# whether stamp() queries a database, so it's better asked once
+	costlyStamp = False
+
+	label = None		# the way series are read, for the latency stats
+
+	@classmethod
+	def accepts(cls, providerType, source):
+		return False
+
+	@classmethod
+	def setupJob(cls, host, job, ps_layer, source):
+		""" set the uri of the time-series table and the backend of the
+		TSFetchJob of a click on the PS layer, in the main thread. host is
+		the plugin: host.askTSTable(ps_layer, default) returns the name of
+		the TS table, None if the user canceled, and host.tsSql is its
+		TSSqlReader. Return False to give up the click """
+		raise NotImplementedError
+
+	def bind(self, reader=None, isCanceled=None):
+		""" return the backend to be used by a worker thread, with its own
+		SQL reader and cancel check """
+		return self
+
+	def fetch(self, code):
+		series = self.fetchMany( [code] )
+		if series is None:
+			return
+		return series.get( code )
+
+	def fetchMany(self, codes):
+		""" return {code: (dates, values)} of the PS codes """
+		raise NotImplementedError
+
+	def stamp(self):
+		""" return the version of the time-series data, fetched series with
+		another one are stale. None if it can't be told """
+		return
+
+
+@registerBackend
+class StoreBackend(TSBackend):
+	""" binary time-series store (.psts) or archive (.psa), the series are
+	read straight from the memory-mapped file """
+
+	name = 'store'
+	tsLayer = False
+	cached = False		# reading the store costs less than caching the series
+	label = "time-series store"
+
+	def __init__(self, path):
+		self.path = path
+
+	@classmethod
+	def accepts(cls, providerType, source):
+		return source.lower().endswith( (".psts", ".psa") )
+
+	@classmethod
+	def setupJob(cls, host, job, ps_layer, source):
+		job.uri = source
+		job.backend = cls( source )
+		return True
+
+	def fetchMany(self, codes):
+		from .ps_store import openStore, PSStoreError
+		try:
+			store = openStore( self.path )
+		except (PSStoreError, EnvironmentError) as e:
+			raise TSBackendError( str(e) )
+
+		series = {}
+		for code in codes:
+			found = store.fetch( code )
+			series[ code ] = found if found is not None else emptySeries()
+		return series
+
+	def stamp(self):
+		return fileStamp( self.path )
+
+
+@registerBackend
+class ShapefileBackend(TSBackend):
+	""" the values are stored within the shapefile PS, in the fields whose
+	names are the dates. They're read straight from the .dbf records of the
+	feature ids, which are the codes of this backend """
+
+	name = 'shapefile'
+	keyFields = ()
+	dateField = valueField = None
+	tsLayer = False
+	label = ".dbf records"
+
+	def __init__(self, dbfPath, dateFields, dates):
+		self.path = dbfPath
+		self.dateFields = dateFields	# names of the date fields within the .dbf
+		self.dates = dates				# datetime64 dates of those fields
+
+	@classmethod
+	def accepts(cls, providerType, source):
+		return providerType == 'ogr' and source.lower().endswith( ".shp" )
+
+	@classmethod
+	def setupJob(cls, host, job, ps_layer, source):
+		# the records are read from the file unless there are edits not
+		# saved to it yet, then the values are read from the feature
+		dbf = "%s.dbf" % os.path.splitext( source )[0]
+		if os.path.isfile( dbf ) and not ps_layer.isModified():
+			fields = ps_layer.fields()
+			job.backend = cls( dbf, [ fields.at( idx ).name() for idx in job.psProfile.dateIndexes ], job.psProfile.dates )
+		return True
+
+	def fetchMany(self, fids):
+		from .dbf_reader import openDbf, DBFError
+		fids = list(fids)
+		try:
+			dbf = openDbf( self.path )
+			if not dbf.hasFields( self.dateFields ):
+				raise TSBackendError( "%s has no %s fields" % (self.path, ", ".join( self.dateFields )) )
+			values = dbf.read( fids, self.dateFields )
+		except (DBFError, EnvironmentError) as e:
+			raise TSBackendError( str(e) )
+		return dict( (fid, (self.dates, row)) for fid, row in zip( fids, values ) )
+
+	def stamp(self):
+		return fileStamp( self.path )
+
+
+class FeatureBackend(TSBackend):
+	""" read the series from the features of the time-series layer. The
+	rows function is called as rows(expression, isCanceled) and yields
+	(key values, date, value) for each feature matching the expression.
+	The codes are a key value, or a tuple of them with several key fields """
+
+	label = "feature request"
+
+	def __init__(self, rows, keyFields, uri=None, isCanceled=None):
+		self.rows = rows
+		self.keyFields = tuple(keyFields)
+		self.uri = uri
+		self.isCanceled = isCanceled
+
+	def bind(self, reader=None, isCanceled=None):
+		backend = copy.copy( self )
+		backend.isCanceled = isCanceled
+		return backend
+
+	def fetchMany(self, codes, chunkSize=CHUNK_SIZE):
+		from .csv_index import keyText
+		keyOf = lambda values: tuple( keyText( v ) for v in values )
+
+		codes = list(OrderedDict.fromkeys( codes ))
+		keys = [ code if isinstance(code, tuple) else (code,) for code in codes ]
+		found = dict( (keyOf( values ), ([], [])) for values in keys )
+
+		for i in range(0, len(keys), chunkSize):
+			if self.isCanceled is not None and self.isCanceled():
+				break
+			for values, date, value in self.rows( self.expression( keys[ i:i + chunkSize ] ), self.isCanceled ):
+				xy = found.get( keyOf( values ) )
+				if xy is not None:
+					xy[0].append( date )
+					xy[1].append( value )
+
+		series = {}
+		for code, values in zip( codes, keys ):
+			x, y = found[ keyOf( values ) ]
+			x = decodeDates( x )
+			y = np.array( y, dtype=np.float64 )
+
+			# skip the acquisitions with no valid date
+			valid = ~np.isnat( x )
+			x, y = x[ valid ], y[ valid ]
+			order = np.argsort( x, kind='stable' )
+			series[ code ] = x[ order ], y[ order ]
+		return series
+
+	def expression(self, keys):
+		""" return the filter expression matching the PS of the key values """
+		if len(self.keyFields) == 1:
+			return "%s IN (%s)" % (quoteIdentifier( self.keyFields[0] ),
+					", ".join( quoteValue( values[0] ) for values in keys ))
+		return " OR ".join( "(%s)" % " AND ".join( "%s = %s" % (quoteIdentifier( name ), quoteValue( value )) \
+				for name, value in zip( self.keyFields, values ) ) for values in keys )
+
+	def stamp(self):
+		if self.uri and os.path.isfile( self.uri ):
+			return fileStamp( self.uri )
+
+
+def quoteValue(value):
+	""" return the literal of the value within a QGIS expression """
+	if value is None:
+		return "NULL"
+	if isinstance(value, bool):
+		return "TRUE" if value else "FALSE"
+	if isinstance(value, (int, float)):
+		return repr(value)
+	text = str(value).replace( '\\', '\\\\' ).replace( "'", "''" ).replace( '\n', '\\n' ).replace( '\t', '\\t' )
+	return "'%s'" % text
+
+
+class SqlBackend(TSBackend):
+	""" query the whole series from a time-series table with a single SQL
+	statement, and those of several PS with chunked IN (...) lists of codes.
+	The name of the backend is the provider type of the TSSqlReader """
+
+	def __init__(self, reader, conninfo, schema, table, dateField=None, valueField=None):
+		self.reader = reader		# TSSqlReader
+		self.conninfo = conninfo	# database path of the SQLite based providers
+		self.schema = schema
+		self.table = table
+		self.dateField = dateField or self.dateField
+		self.valueField = valueField or self.valueField
+
+	@classmethod
+	def accepts(cls, providerType, source):
+		return providerType == cls.name
+
+	@classmethod
+	def setupJob(cls, host, job, ps_layer, source):
+		# the TS table is in the same database of the PS layer
+		from qgis.core import QgsDataSourceUri, QgsWkbTypes
+		dsuri = QgsDataSourceUri( source )
+		table = host.askTSTable( ps_layer, "ts_%s" % dsuri.table() )
+		if table is None:
+			return False
+		dsuri.setDataSource( dsuri.schema(), table, None )
+		dsuri.setWkbType( QgsWkbTypes.Unknown )
+		dsuri.setSrid( None )
+		job.uri = dsuri.uri()
+		job.backend = cls( host.tsSql, cls.connectionOf( dsuri ), dsuri.schema(), table, job.dateField, job.valueField )
+		return True
+
+	@staticmethod
+	def connectionOf(dsuri):
+		""" return the conninfo of the QgsDataSourceUri of a table """
+		return dsuri.database()
+
+	@property
+	def label(self):
+		return "prepared %s statement" % self.name
+
+	def bind(self, reader=None, isCanceled=None):
+		if reader is None or reader is self.reader:
+			return self
+		backend = copy.copy( self )
+		backend.reader = reader
+		return backend
+
+	def fetch(self, code):
+		try:
+			return self.reader.fetch( self.name, self.conninfo, self.schema, self.table, code, self.dateField, self.valueField )
+		except TSSqlError as e:
+			raise TSBackendError( "query on %s failed: %s" % (self.table, e) )
+
+	def fetchMany(self, codes, chunkSize=CHUNK_SIZE):
+		try:
+			return self.reader.fetchMany( self.name, self.conninfo, self.schema, self.table, codes,
+					self.dateField, self.valueField, chunkSize )
+		except TSSqlError as e:
+			raise TSBackendError( "query on %s failed: %s" % (self.table, e) )
+
+	def stamp(self):
+		# the database file of the SQLite based providers
+		return fileStamp( self.conninfo )
+
+
+@registerBackend
+class GpkgBackend(SqlBackend):
+	""" query the series from a table of the same GeoPackage of the PS
+	layer, as for SpatiaLite """
+
+	name = 'gpkg'
+
+	@classmethod
+	def accepts(cls, providerType, source):
+		return providerType == 'ogr' and source.split( '|' )[0].lower().endswith( ".gpkg" )
+
+	@classmethod
+	def setupJob(cls, host, job, ps_layer, source):
+		# host.checkGpkgTable warns the user when the table is missing
+		dbpath, layername = cls.layerOf( source )
+		table = host.askTSTable( ps_layer, "ts_%s" % layername )
+		if table is None or not host.checkGpkgTable( dbpath, table ):
+			return False
+		job.uri = "%s|layername=%s" % (dbpath, table)
+		job.backend = cls( host.tsSql, dbpath, None, table, job.dateField, job.valueField )
+		return True
+
+	@staticmethod
+	def layerOf(source):
+		""" return the GeoPackage path and the layer name of an OGR source
+		like path.gpkg|layername=name """
+		parts = source.split( '|' )
+		for part in parts[1:]:
+			if part.lower().startswith( "layername=" ):
+				return parts[0], part[ len("layername="): ]
+		return parts[0], os.path.splitext( os.path.basename( parts[0] ) )[0]
+
+
+@registerBackend
+class OciBackend(FeatureBackend):
+	""" Oracle Spatial, the series are read from the features of the
+	time-series table """
+
+	name = 'oci'
+	keyFields = ( 'id_dataset', 'code_target' )
+	dateField = "data_misura"
+	valueField = "spost_rel_mm"
+	defaultTable = "RISKNAT.RNAT_TARGET_SSTO"
+	label = "OCI feature request"
+
+	@classmethod
+	def accepts(cls, providerType, source):
+		return providerType == 'ogr' and source.upper().startswith( "OCI:" )
+
+	@classmethod
+	def setupJob(cls, host, job, ps_layer, source):
+		table = host.askTSTable( ps_layer, cls.defaultTable )
+		if table is None:
+			return False
+		# uri is like OCI:userid/password@database:table
+		pos = source.find( ':', 4 )
+		if pos >= 0:
+			source = source[ 0:pos ]
+		job.uri = "%s:%s" % (source, table)
+		job.backend = cls( job.featureRows, job.keyFields, job.uri )
+		return True
+
+
+class CsvBackend(TSBackend):
+	""" read the lines of the PS from a CSV file through its byte-offset
+	index (see csv_index) instead of scanning the file """
+
+	label = "CSV index"
+
+	def __init__(self, csvPath, keyColumns, dateColumn, valueColumn):
+		self.csvPath = csvPath
+		self.keyColumns = keyColumns
+		self.dateColumn = dateColumn
+		self.valueColumn = valueColumn
+
+	def fetchMany(self, codes):
+		from .csv_index import openCsvIndex, CSVIndexError
+		codes = list(codes)
+		keys = [ code if isinstance(code, tuple) else (code,) for code in codes ]
+		try:
+			series = openCsvIndex( self.csvPath, self.keyColumns ).seriesMany( keys, self.dateColumn, self.valueColumn )
+		except (CSVIndexError, EnvironmentError) as e:
+			raise TSBackendError( "unable to index %s: %s" % (self.csvPath, e) )
+		if series is None:
+			return
+		return dict( (code, series[ values ]) for code, values in zip( codes, keys ) )
+
+	def stamp(self):
+		return fileStamp( self.csvPath )
+
+
+@registerBackend
+class VrtBackend(CsvBackend):
+	""" a VRT time-series table, read through the index of the CSV file it
+	wraps. Other VRT tables can't be read but as features """
+
+	name = 'vrt'
+	keyFields = ( 'id_dataset', 'code_target' )
+	dateField = "data_misura"
+	valueField = "spost_rel_mm"
+	defaultTable = "rnat_target_sso.vrt"
+
+	def __init__(self, vrtPath, keyFields=None, dateField=None, valueField=None):
+		from .csv_index import csvLayerOfVrt
+		self.vrtPath = vrtPath
+		self.csvPath = None
+
+		csvLayer = csvLayerOfVrt( vrtPath )
+		if csvLayer is not None:
+			csvPath, columns = csvLayer
+			column = lambda name: columns.get( name.lower(), name )
+			CsvBackend.__init__( self, csvPath, [ column( name ) for name in keyFields or self.keyFields ],
+					column( dateField or self.dateField ), column( valueField or self.valueField ) )
+
+	@classmethod
+	def accepts(cls, providerType, source):
+		return providerType == 'ogr' and source.lower().endswith( ".vrt" )
+
+	@classmethod
+	def setupJob(cls, host, job, ps_layer, source):
+		table = host.askTSTable( ps_layer, cls.defaultTable )
+		if table is None:
+			return False
+		from qgis.PyQt.QtCore import QFileInfo, QDir
+		job.uri = QDir.toNativeSeparators( "%s/%s" % (QFileInfo( source ).path(), table) )
+		# when it wraps a CSV file, the lines of the PS are read through a
+		# byte-offset index instead of scanning the file
+		job.backend = cls( job.uri, job.keyFields, job.dateField, job.valueField )
+		return True
+
+	def fetchMany(self, codes):
+		if self.csvPath is None:
+			return
+		return CsvBackend.fetchMany( self, codes )
+
+	def stamp(self):
+		return fileStamp( self.csvPath or self.vrtPath )
+
+
+@registerBackend
+class PostgisBackend(SqlBackend):
+	""" query the series from a PostGIS time-series table, or from its
+	series table when it has been built (see pg_series_table) """
+
+	name = 'postgres'
+	costlyStamp = True		# catalog data and the max id of the table
+
+	@staticmethod
+	def connectionOf(dsuri):
+		return dsuri.connectionInfo( True )
+
+	def stamp(self):
+		try:
+			return self.reader.tableStamp( self.name, self.conninfo, self.schema, self.table )
+		except TSSqlError as e:
+			raise TSBackendError( "unable to check %s: %s" % (self.table, e) )
+
+
+@registerBackend
+class SpatialiteBackend(SqlBackend):
+	""" query the series from a SpatiaLite time-series table """
+
+	name = 'spatialite'
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .ts_codec import EncodedSeries
+
+
+class SeriesCache:
+	""" LRU cache of the fetched time series, keyed by
+	(source uri, TS table, PS code) and bounded by a memory budget.
+	Series are kept in the compact encoding unless compact is False.
+	It's shared with the worker threads fetching the series """
+
+	def __init__(self, maxBytes=64*1024*1024, compact=True):
+		self.maxBytes = maxBytes
+		self.compact = compact
+		self.hits = 0
+		self.misses = 0
+
+		self._entries = OrderedDict()	# key -> EncodedSeries or (dates, values)
+		self._bytes = 0
+		self._lock = threading.RLock()
+
+	@staticmethod
+	def _nbytes(entry):
+		if isinstance(entry, EncodedSeries):
+			return entry.nbytes
+		return entry[0].nbytes + entry[1].nbytes
+
+	def get(self, key):
+		""" return the (dates, values) arrays stored for the key or None """
+		with self._lock:
+			entry = self._entries.get( key )
+			if entry is None:
+				self.misses += 1
+				return
+
+			self.hits += 1
+			self._entries.move_to_end( key )
+		if isinstance(entry, EncodedSeries):
+			return entry.decode()
+		return entry
+
+	def put(self, key, x, y):
+		""" store the series, x are dates and y displacement values """
+		series = ( np.asarray(x, dtype='datetime64[D]'), np.asarray(y, dtype=np.float32) )
+		entry = EncodedSeries( *series ) if self.compact else series
+		size = self._nbytes( entry )
+		if size > self.maxBytes:
+			return
+
+		with self._lock:
+			self.remove( key )
+			self._entries[ key ] = entry
+			self._bytes += size
+			self._trim()
+		return series
+
+	def remove(self, key):
+		with self._lock:
+			entry = self._entries.pop( key, None )
+			if entry is not None:
+				self._bytes -= self._nbytes( entry )
+
+	def invalidate(self, source, table=None):
+		""" drop the series fetched from the source (and table) """
+		with self._lock:
+			for key in list(self._entries.keys()):
+				if key[0] == source and (table is None or key[1] == table):
+					self.remove( key )
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self._bytes = 0
+
+	def setMaxBytes(self, maxBytes):
+		with self._lock:
+			self.maxBytes = maxBytes
+			self._trim()
+
+	def _trim(self):
+		# evict the least recently used series until within the budget,
+		# the lock must be held by the caller
+		while self._bytes > self.maxBytes and self._entries:
+			key, entry = self._entries.popitem( last=False )
+			self._bytes -= self._nbytes( entry )
+
+	def stats(self):
+		return { 'entries': len(self._entries), 'bytes': self._bytes, 'maxBytes': self.maxBytes,
+				'hits': self.hits, 'misses': self.misses }
+
+	def __len__(self):
+		return len(self._entries)
+
+	def __contains__(self, key):
+		return key in self._entries
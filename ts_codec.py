@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Compact encoding of the time series: displacements are integers in units of
+the precision of the data (0.01 mm), in the smallest of int16 and int32 they
+fit, and dates are the first day plus the day offsets between acquisitions.
+Values which would lose precision stay float32, so encoding is lossless.
+"""
+
+import numpy as np
+
+PRECISION = 0.01	# mm
+
+# the minimum of each integer type marks missing values
+NAN_VALUES = { np.dtype('<i2'): np.iinfo(np.int16).min, np.dtype('<i4'): np.iinfo(np.int32).min }
+
+
+def quantizedDtype(values, precision=PRECISION):
+	""" return the smallest integer dtype holding the values in units of
+	precision, None if some of them would lose precision """
+	values = np.asarray( values, dtype=np.float32 )
+	valid = values[ ~np.isnan( values ) ]
+	if len(valid) == 0:
+		return np.dtype('<i2')
+
+	q = np.round( valid.astype( np.float64 ) / precision )
+	if not np.array_equal( (q * precision).astype( np.float32 ), valid ):
+		return
+
+	limit = np.abs( q ).max()
+	for dtype in ( np.dtype('<i2'), np.dtype('<i4') ):
+		if limit < -NAN_VALUES[ dtype ]:
+			return dtype
+
+def quantize(values, dtype, precision=PRECISION):
+	""" return the values as integers in units of precision, NaN are
+	stored as the minimum of dtype """
+	values = np.asarray( values, dtype=np.float64 )
+	nan = np.isnan( values )
+	q = np.round( np.where( nan, 0, values ) / precision ).astype( dtype )
+	q[ nan ] = NAN_VALUES[ np.dtype(dtype) ]
+	return q
+
+def dequantize(q, precision=PRECISION):
+	""" return the float32 values of the quantized ones """
+	values = (q * precision).astype( np.float32 )
+	values[ q == NAN_VALUES[ q.dtype ] ] = np.nan
+	return values
+
+
+def deltaDtype(deltas):
+	""" return the smallest dtype of the day offsets """
+	if len(deltas) == 0:
+		return np.dtype('<u1')
+	lo, hi = deltas.min(), deltas.max()
+	for dtype in ( np.dtype('<u1'), np.dtype('<u2'), np.dtype('<i4') ):
+		info = np.iinfo( dtype )
+		if lo >= info.min and hi <= info.max:
+			return dtype
+	return np.dtype('<i8')
+
+def encodeDays(days):
+	""" return the first day and the offsets from the previous day """
+	days = np.asarray( days, dtype=np.int64 )
+	if len(days) == 0:
+		return 0, np.array( [], dtype='<u1' )
+	deltas = np.diff( days )
+	return int(days[0]), deltas.astype( deltaDtype( deltas ) )
+
+def decodeDays(start, deltas):
+	""" return the datetime64[D] dates of the first day and the offsets """
+	days = np.empty( len(deltas) + 1, dtype=np.int64 )
+	days[0] = start
+	np.cumsum( deltas, dtype=np.int64, out=days[1:] )
+	days[1:] += start
+	return days.astype( 'datetime64[D]' )
+
+
+class EncodedSeries:
+	""" a time series in the compact encoding """
+
+	__slots__ = ( 'start', 'deltas', 'values', 'count' )
+
+	def __init__(self, x, y, precision=PRECISION):
+		x = np.asarray( x, dtype='datetime64[D]' )
+		y = np.asarray( y, dtype=np.float32 )
+		self.count = len(x)
+		self.start, self.deltas = encodeDays( x.astype( np.int64 ) )
+
+		dtype = quantizedDtype( y, precision )
+		self.values = y if dtype is None else quantize( y, dtype, precision )
+
+	@classmethod
+	def fromParts(cls, start, deltas, values, count):
+		""" return the series of already encoded parts """
+		entry = cls.__new__( cls )
+		entry.start, entry.deltas, entry.values, entry.count = start, deltas, values, count
+		return entry
+
+	@property
+	def nbytes(self):
+		return self.deltas.nbytes + self.values.nbytes + 16
+
+	def decode(self, precision=PRECISION):
+		""" return the (dates, values) arrays """
+		if self.count == 0:
+			return np.array( [], dtype='datetime64[D]' ), np.array( [], dtype=np.float32 )
+		x = decodeDays( self.start, self.deltas )
+		y = self.values if self.values.dtype.kind == 'f' else dequantize( self.values, precision )
+		return x, y
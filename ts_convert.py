@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Convert a long-format time-series dump (one line for each PS and date, like
+ts_all_asce.txt) to a columnar archive (.psa) or, when all the PS share the
+same dates, a time-series store (.psts) the plugin opens directly.
+
+The dump is read in chunks of rows, each one sorted by code and date and
+spilled to a temporary run, then the runs are merged one code at a time, so
+the memory used depends on the chunk size and not on the dump size.
+
+It doesn't need QGIS, from the directory containing the plugin:
+
+	python -m pstimeseries.ts_convert ts_all_asce.txt ts_all_asce.psa
+	python -m pstimeseries.ts_convert --format psts ts_all_asce.txt
+"""
+
+import os
+import sys
+import time
+import heapq
+import shutil
+import argparse
+import tempfile
+import itertools
+
+import numpy as np
+
+from .date_utils import decodeDates
+from .ps_store import ArchiveWriter, StoreWriter
+from .ts_codec import quantizedDtype
+
+try:
+	import resource
+except ImportError:	# Windows
+	resource = None
+
+
+class ConvertError(Exception):
+	pass
+
+
+def peakRss():
+	""" return the peak resident set size of the process in bytes, None if
+	it's not available """
+	if resource is None:
+		return
+	rss = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+	# kilobytes on Linux, bytes on macOS
+	return rss if sys.platform == 'darwin' else rss * 1024
+
+
+FORMATS = ( 'psa', 'psts' )
+
+
+def outputFormat(path):
+	""" return the format of the output file by its extension, psa by
+	default """
+	ext = os.path.splitext( path )[1].lower().lstrip( '.' )
+	return ext if ext in FORMATS else 'psa'
+
+def convertDump(src, dst, codeField="code", dateField="dataripresa", valueField="valore",
+		delimiter="\t", chunkRows=1000000, tmpdir=None, progress=None, isCanceled=None, fmt=None):
+	""" convert the dump at src to the archive or store (fmt "psa" or
+	"psts", by the dst extension if None) at dst, return the stats of the
+	conversion as a dict. progress is called with the percentage done,
+	isCanceled is polled to stop the conversion """
+	fmt = fmt or outputFormat( dst )
+	if fmt not in FORMATS:
+		raise ConvertError( "unknown format %s" % fmt )
+	start = time.time()
+	size = max(1, os.path.getsize( src ))
+
+	def setProgress(value):
+		if progress is not None:
+			progress( value )
+	def checkCanceled():
+		if isCanceled is not None and isCanceled():
+			raise ConvertError( "conversion canceled" )
+
+	runsDir = tempfile.mkdtemp( prefix="pstimeseries_", dir=tmpdir )
+	try:
+		# sort the dump in runs of chunkRows rows, reading it takes
+		# most of the time
+		runs = []
+		rows = skipped = 0
+		valueDtype = np.dtype('<i2')	# None once a value can't be quantized
+		read = 0
+		with open( src, 'r', encoding='utf-8', newline='' ) as f:
+			header = f.readline()
+			read += len(header)
+			names = [ name.strip().lower() for name in header.rstrip( '\r\n' ).split( delimiter ) ]
+			try:
+				columns = [ names.index( name.lower() ) for name in (codeField, dateField, valueField) ]
+			except ValueError:
+				raise ConvertError( "the dump must have the %s, %s and %s columns" % (codeField, dateField, valueField) )
+
+			while True:
+				checkCanceled()
+				lines = list(itertools.islice( f, chunkRows ))
+				if not lines:
+					break
+				read += sum( len(l) for l in lines )
+
+				run, n = _sortChunk( lines, columns, delimiter )
+				skipped += len(lines) - n
+				rows += n
+				if n > 0:
+					runs.append( _saveRun( runsDir, len(runs), *run ) )
+					valueDtype = _widerDtype( valueDtype, quantizedDtype( run[2] ) )
+				setProgress( 80.0 * read / size )
+
+		# merge the runs
+		codes = merged = 0
+		if fmt == 'psts':
+			# a column of values for each date of any PS
+			valueDtype = None
+			days = [ np.unique( np.load( paths[1], mmap_mode='r' ) ) for paths in runs ]
+			days = np.unique( np.concatenate( days ) ) if days else np.array( [], dtype='<i4' )
+			writer = StoreWriter( dst, days.astype( 'datetime64[D]' ) )
+		else:
+			writer = ArchiveWriter( dst, rows, valueDtype )
+		try:
+			for code, dates, values in _mergeRuns( runs ):
+				writer.add( code, dates, values )
+				codes += 1
+				merged += len(dates)
+				if codes % 10000 == 0:
+					checkCanceled()
+					setProgress( 80.0 + 20.0 * merged / max(1, rows) )
+		except BaseException:
+			writer._file.close()
+			os.remove( dst )
+			raise
+		writer.close()
+
+	finally:
+		shutil.rmtree( runsDir, ignore_errors=True )
+
+	setProgress( 100.0 )
+	seconds = max(1e-6, time.time() - start)
+	return {
+		'rows': rows,
+		'skipped': skipped,
+		'codes': codes,
+		'seconds': seconds,
+		'rowsPerSecond': rows / seconds,
+		'mbPerSecond': size / seconds / 1024.0 / 1024.0,
+		'inputBytes': size,
+		'outputBytes': os.path.getsize( dst ),
+		'peakRss': peakRss(),
+		'valueType': str(valueDtype) if valueDtype is not None else 'float32',
+		'format': fmt,
+	}
+
+
+def _widerDtype(a, b):
+	# the quantized dtype holding the values of both, None if either
+	# can't be quantized
+	if a is None or b is None:
+		return
+	return a if a.itemsize >= b.itemsize else b
+
+
+def _sortChunk(lines, columns, delimiter):
+	""" parse the lines and return the (codes, dates, values) arrays sorted
+	by code and date, and the number of valid rows """
+	ci, di, vi = columns
+	last = max(columns)
+	fields = [ l.rstrip( '\r\n' ).split( delimiter ) for l in lines ]
+	fields = [ f for f in fields if len(f) > last ]
+
+	codes = np.char.encode( np.array( [ f[ci].strip() for f in fields ], dtype='U' ), 'utf-8' )
+	dates = decodeDates( [ f[di].strip() for f in fields ] )
+	values = _parseValues( [ f[vi] for f in fields ] )
+
+	valid = ~np.isnat( dates ) & (np.char.str_len( codes ) > 0)
+	codes, dates, values = codes[ valid ], dates[ valid ], values[ valid ]
+
+	order = np.lexsort( (dates, codes) )
+	days = dates[ order ].astype( np.int64 ).astype( '<i4' )
+	return ( codes[ order ], days, values[ order ] ), len(order)
+
+
+def _parseValues(values):
+	# numpy parses the whole column at once, element by element only if
+	# some of them aren't numbers
+	try:
+		return np.array( values, dtype='<f4' )
+	except ValueError:
+		def parse(v):
+			try:
+				return float(v)
+			except ValueError:
+				return np.nan
+		return np.array( [ parse(v) for v in values ], dtype='<f4' )
+
+
+def _saveRun(runsDir, n, codes, dates, values):
+	paths = []
+	for name, arr in ( ('codes', codes), ('dates', dates), ('values', values) ):
+		path = os.path.join( runsDir, "run%d_%s.npy" % (n, name) )
+		np.save( path, arr )
+		paths.append( path )
+	return paths
+
+
+def _runGroups(n, codes):
+	# yield (code, run, start, end) for each code of the sorted run
+	uniq, starts = np.unique( codes, return_index=True )
+	ends = np.append( starts[1:], len(codes) )
+	for code, start, end in zip( uniq, starts, ends ):
+		yield code, n, int(start), int(end)
+
+
+def _mergeRuns(runs):
+	""" yield (code, dates, values) for each code in ascending order, with
+	the dates of the code sorted """
+	# the runs are memory-mapped, only the codes being merged are read
+	arrays = [ [ np.load( path, mmap_mode='r' ) for path in paths ] for paths in runs ]
+	groups = heapq.merge( *[ _runGroups( n, arr[0] ) for n, arr in enumerate( arrays ) ] )
+
+	for code, parts in itertools.groupby( groups, key=lambda g: g[0] ):
+		parts = list(parts)
+		if len(parts) == 1:
+			_, n, start, end = parts[0]
+			yield code, np.array( arrays[n][1][ start:end ] ), np.array( arrays[n][2][ start:end ] )
+			continue
+
+		# the code is split among several runs
+		dates = np.concatenate( [ arrays[n][1][ start:end ] for _, n, start, end in parts ] )
+		values = np.concatenate( [ arrays[n][2][ start:end ] for _, n, start, end in parts ] )
+		order = np.argsort( dates, kind='stable' )
+		yield code, dates[ order ], values[ order ]
+
+
+def formatStats(stats):
+	""" return a one line report of the conversion """
+	report = "%(rows)d rows of %(codes)d PS converted in %(seconds).1f s (%(rowsPerSecond).0f rows/s, %(mbPerSecond).1f MB/s)" % stats
+	if stats['skipped']:
+		report += ", %d rows skipped" % stats['skipped']
+	if stats['peakRss'] is not None:
+		report += ", peak RSS %.1f MB" % (stats['peakRss'] / 1024.0 / 1024.0)
+	return report
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser( description="Convert a long-format time-series dump to a PS time-series archive (.psa) or store (.psts)" )
+	parser.add_argument( "dump", help="tab separated dump with one line for each PS and date" )
+	parser.add_argument( "archive", nargs="?", help="output file, the dump name with the extension of the format by default" )
+	parser.add_argument( "--format", choices=FORMATS, help="psa for PS with different dates, psts for PS sharing the same dates. "
+			"By the output extension by default, psa if it's neither" )
+	parser.add_argument( "--code-field", default="code" )
+	parser.add_argument( "--date-field", default="dataripresa" )
+	parser.add_argument( "--value-field", default="valore" )
+	parser.add_argument( "--delimiter", default="\t" )
+	parser.add_argument( "--chunk-rows", type=int, default=1000000, help="rows sorted in memory at once" )
+	parser.add_argument( "--tmpdir", help="directory of the temporary sorted runs" )
+	args = parser.parse_args( argv )
+
+	fmt = args.format or (outputFormat( args.archive ) if args.archive else 'psa')
+	archive = args.archive or "%s.%s" % (os.path.splitext( args.dump )[0], fmt)
+	try:
+		stats = convertDump( args.dump, archive, args.code_field, args.date_field, args.value_field,
+				args.delimiter, max(1, args.chunk_rows), args.tmpdir, fmt=fmt )
+	except (ConvertError, EnvironmentError) as e:
+		sys.stderr.write( "%s\n" % e )
+		return 1
+
+	print( formatStats( stats ) )
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit( main() )
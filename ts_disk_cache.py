@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+
+from .ts_codec import EncodedSeries
+
+
+class DiskSeriesCache:
+	""" time series kept in a SQLite file across sessions, keyed like the
+	SeriesCache. Each entry is stamped with the version of the table it was
+	read from (file mtime or row count), entries with another stamp are
+	stale. The least recently used entries are dropped beyond maxBytes.
+	The file can be shared with another QGIS instance: when it's locked
+	get is a miss and put is skipped """
+
+	# seconds waiting for the file locked by another connection
+	BUSY_TIMEOUT = 0.5
+
+	SCHEMA = """CREATE TABLE IF NOT EXISTS series (
+			source TEXT NOT NULL,
+			tbl TEXT NOT NULL,
+			code TEXT NOT NULL,
+			stamp TEXT NOT NULL,
+			start INTEGER NOT NULL,
+			count INTEGER NOT NULL,
+			deltas BLOB NOT NULL,
+			deltasType TEXT NOT NULL,
+			vals BLOB NOT NULL,
+			valsType TEXT NOT NULL,
+			bytes INTEGER NOT NULL,
+			used REAL NOT NULL,
+			PRIMARY KEY (source, tbl, code) )"""
+
+	def __init__(self, path, maxBytes=256*1024*1024):
+		self.path = path
+		self.maxBytes = maxBytes
+		self.hits = 0
+		self.misses = 0
+		self.errors = 0
+		self._lock = threading.Lock()	# the connection is shared with the worker threads
+
+		dirname = os.path.dirname( path )
+		if dirname and not os.path.isdir( dirname ):
+			os.makedirs( dirname )
+		self._conn = sqlite3.connect( path, timeout=self.BUSY_TIMEOUT, check_same_thread=False, isolation_level=None )
+		self._conn.execute( "PRAGMA journal_mode=WAL" )
+		self._conn.execute( "PRAGMA synchronous=NORMAL" )
+		self._conn.execute( self.SCHEMA )
+		self._conn.execute( "CREATE INDEX IF NOT EXISTS series_used ON series (used)" )
+		self._bytes = self._conn.execute( "SELECT coalesce(sum(bytes), 0) FROM series" ).fetchone()[0]
+
+	@staticmethod
+	def _key(key):
+		# the source uri may contain credentials, only its hash is stored
+		source, table, code = key
+		if isinstance(code, tuple):
+			code = "\x1f".join( str(c) for c in code )
+		return hashlib.sha1( source.encode( 'utf-8' ) ).hexdigest(), table or "", str(code)
+
+	def get(self, key, stamp):
+		""" return the (dates, values) arrays stored for the key if they're
+		still valid for the stamp, None otherwise """
+		k = self._key( key )
+		row = None
+		with self._lock:
+			try:
+				row = self._conn.execute( "SELECT stamp, start, count, deltas, deltasType, vals, valsType FROM series "
+						"WHERE source=? AND tbl=? AND code=?", k ).fetchone()
+				if row is None or row[0] != stamp:
+					self.misses += 1
+					if row is not None:
+						self._delete( k )
+					return
+
+				self.hits += 1
+				self._conn.execute( "UPDATE series SET used=? WHERE source=? AND tbl=? AND code=?", (time.time(),) + k )
+			except sqlite3.Error:
+				self.errors += 1
+				if row is None or row[0] != stamp:
+					return
+
+		stamp, start, count, deltas, deltasType, vals, valsType = row
+		entry = EncodedSeries.fromParts( start, np.frombuffer( deltas, dtype=deltasType ),
+				np.frombuffer( vals, dtype=valsType ), count )
+		return entry.decode()
+
+	def put(self, key, stamp, x, y):
+		""" store the series read from the table whose version is stamp """
+		entry = EncodedSeries( x, y )
+		size = entry.nbytes
+		if size > self.maxBytes:
+			return
+
+		k = self._key( key )
+		with self._lock:
+			try:
+				self._delete( k )
+				self._conn.execute( "INSERT INTO series VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", k + (
+						stamp, entry.start, entry.count, entry.deltas.tobytes(), entry.deltas.dtype.str,
+						entry.values.tobytes(), entry.values.dtype.str, size, time.time() ) )
+				self._bytes += size
+				self._trim()
+			except sqlite3.Error:
+				self.errors += 1
+
+	def _delete(self, k):
+		# the lock must be held by the caller
+		row = self._conn.execute( "SELECT bytes FROM series WHERE source=? AND tbl=? AND code=?", k ).fetchone()
+		if row is not None:
+			self._conn.execute( "DELETE FROM series WHERE source=? AND tbl=? AND code=?", k )
+			self._bytes -= row[0]
+
+	def _trim(self):
+		# drop the least recently used series down to 90% of the budget,
+		# so it's not trimmed again on the next put. The lock must be held
+		if self._bytes <= self.maxBytes:
+			return
+		target = self.maxBytes * 0.9
+		rows = self._conn.execute( "SELECT rowid, bytes FROM series ORDER BY used" )
+		dropped = []
+		for rowid, size in rows:
+			if self._bytes <= target:
+				break
+			dropped.append( (rowid,) )
+			self._bytes -= size
+		rows.close()
+		self._conn.executemany( "DELETE FROM series WHERE rowid=?", dropped )
+
+	def setMaxBytes(self, maxBytes):
+		with self._lock:
+			self.maxBytes = maxBytes
+			self._trim()
+
+	def clear(self):
+		with self._lock:
+			self._conn.execute( "DELETE FROM series" )
+			self._conn.execute( "VACUUM" )
+			self._bytes = 0
+
+	def stats(self):
+		with self._lock:
+			try:
+				entries = self._conn.execute( "SELECT count(*) FROM series" ).fetchone()[0]
+			except sqlite3.Error:
+				entries = None
+		return { 'entries': entries, 'bytes': self._bytes, 'maxBytes': self.maxBytes,
+				'hits': self.hits, 'misses': self.misses, 'errors': self.errors }
+
+	def close(self):
+		with self._lock:
+			self._conn.close()
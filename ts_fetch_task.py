@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from qgis.core import QgsTask, QgsVectorLayerFeatureSource, QgsFeatureRequest
+
+
+class TSFetchJob:
+	""" everything a background fetch needs, collected in the main thread
+	since layers cannot be accessed from a worker thread """
+
+	def __init__(self, ps_layer, rect):
+		self.layerId = ps_layer.id()
+		self.source = ps_layer.source()
+		self.providerType = ps_layer.providerType()
+		self.psSource = QgsVectorLayerFeatureSource( ps_layer )
+		self.psProfile = None
+		self.rect = rect			# search rectangle in layer coordinates
+		self.infoFields = {}		# index->field of the info to be displayed
+		self.pointIndexes = None	# PointIndexRegistry, to find the nearest PS
+
+		# where the time series are read from, unset when the values are
+		# stored within the PS feature (shapefile)
+		self.keyFields = []			# PS fields used to join the TS table
+		self.tsTable = None
+		self.tsSource = None		# feature source of the time-series layer
+		self.tsProfile = None
+		self.dateField = None
+		self.valueField = None
+		self.backend = None			# TSBackend reading the series of the source
+		self.fallback = None		# FeatureBackend of the time-series layer
+		self.uri = self.source
+		self.subset = ""
+
+		# results
+		self.fid = None
+		self.x = []
+		self.y = []
+
+	def pointIndex(self, wait=True):
+		""" return the PointIndex of the PS layer, building it if needed.
+		None if it's not ready yet and wait is False """
+		if self.pointIndexes is None:
+			return
+		return self.pointIndexes.index( self.layerId, self.psSource, wait )
+
+	def attributesRequest(self, fids):
+		""" return the request for the attributes of the PS needed to get
+		their time series, either the key fields or the date fields """
+		if self.keyFields:
+			attrs = [ self.psProfile.indexOf( name ) for name in self.keyFields ]
+			attrs = [ idx for idx in attrs if idx is not None ]
+		else:
+			attrs = self.psProfile.dateIndexes
+
+		request = QgsFeatureRequest()
+		request.setFilterFids( fids )
+		request.setFlags( QgsFeatureRequest.NoGeometry )
+		request.setSubsetOfAttributes( attrs )
+		return request
+
+	def setTSLayer(self, ts_layer, profile):
+		self.tsSource = QgsVectorLayerFeatureSource( ts_layer )
+		self.tsProfile = profile
+
+	def backends(self):
+		""" return the backends to try in turn """
+		return [ b for b in (self.backend, self.fallback) if b is not None ]
+
+	def featureRows(self, expression, isCanceled=None):
+		""" yield (key values, date, value) of the time-series features
+		matching the expression, the rows function of the FeatureBackend """
+		from .ts_backends import TSBackendError
+		fields = list(self.keyFields) + [ self.dateField, self.valueField ]
+		indexes = [ self.tsProfile.indexOf( name ) for name in fields ]
+		if None in indexes:
+			raise TSBackendError( "fields %s -> indexes %s" % (", ".join( fields ), indexes) )
+		keyIndexes, dateIdx, valueIdx = indexes[ :-2 ], indexes[-2], indexes[-1]
+
+		# the filter is passed within the request so the pooled layer and
+		# its provider are not reloaded
+		request = QgsFeatureRequest()
+		request.setFilterExpression( expression )
+		request.setFlags( QgsFeatureRequest.NoGeometry )
+		request.setSubsetOfAttributes( indexes )
+		for f in self.tsSource.getFeatures( request ):
+			if isCanceled is not None and isCanceled():
+				return
+			a = f.attributes()
+			yield [ a[ idx ] for idx in keyIndexes ], a[ dateIdx ], a[ valueIdx ]
+
+
+class TSFetchTask(QgsTask):
+	""" look for the clicked PS and fetch its time series in background """
+
+	def __init__(self, job, fetchFunc, callback):
+		QgsTask.__init__(self, "PS Time Series Viewer: fetching time series", QgsTask.CanCancel)
+		self.job = job
+		self.fetchFunc = fetchFunc	# called as fetchFunc(task, job) in the worker thread
+		self.callback = callback	# called as callback(task, ok) in the main thread
+		self.exception = None
+
+	def run(self):
+		try:
+			self.fetchFunc( self, self.job )
+		except Exception as e:
+			self.exception = e
+			return False
+		return not self.isCanceled()
+
+	def finished(self, ok):
+		self.callback( self, ok )
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+def polyFit(x, y, grade):
+	""" return the values of the least squares polynomial of grade at x """
+	p = np.polyfit( x, y, grade )
+	return np.polyval( p, x )
+
+def splineFit(x, y):
+	""" return the interpolating spline representation of the series, None
+	if scipy is not installed or the series can't be interpolated """
+	try:
+		from scipy import interpolate
+		return interpolate.splrep( x, y )
+	except (ImportError, ValueError, TypeError):
+		return
+
+def splineEval(tck, xmin, xmax, samples):
+	""" return the (x, y) arrays of the spline at samples points evenly
+	spaced between xmin and xmax """
+	from scipy import interpolate
+	x = np.linspace( xmin, xmax, samples )
+	return x, interpolate.splev( x, tck, der=0 )
+
+
+class FitCache:
+	""" results of the fits on the series of a plot, keyed on the version
+	of the series and the fit parameters, so they're computed once for
+	each series however many times the overlays are toggled or restyled.
+	The least recently used results are dropped beyond maxEntries """
+
+	def __init__(self, maxEntries=32):
+		self.maxEntries = maxEntries
+		self.hits = 0
+		self.misses = 0
+		self._entries = OrderedDict()	# (version, kind, params) -> result
+
+	def get(self, version, kind, params, compute):
+		""" return the result of the fit, calling compute() to get it the
+		first time """
+		key = ( version, kind, tuple(params) )
+		if key in self._entries:
+			self.hits += 1
+			self._entries.move_to_end( key )
+			return self._entries[ key ]
+
+		self.misses += 1
+		result = compute()
+		self._entries[ key ] = result
+		while len(self._entries) > self.maxEntries:
+			self._entries.popitem( last=False )
+		return result
+
+	def clear(self):
+		self._entries.clear()
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+from qgis.core import QgsTask
+
+from .ts_sql import psycopg2, DB_ERRORS, SQLITE_PROVIDERS, TSSqlError, quoteIdentifier, qualifiedName, sqliteHasIndex
+
+
+def indexName(table, column):
+	return "idx_%s_%s" % (table, column)
+
+
+def inspectIndex(providerType, conninfo, schema, table, column):
+	""" return a dict telling whether an index of the table starts with
+	the column, and the estimated rows and bytes scanned on each lookup
+	without it (None where unknown). Raise TSSqlError on database errors """
+	try:
+		if providerType == 'postgres':
+			return _inspectPostgis( conninfo, schema, table, column )
+		return _inspectSqlite( conninfo, table, column )
+	except DB_ERRORS as e:
+		raise TSSqlError( str(e) )
+
+def _inspectPostgis(conninfo, schema, table, column):
+	conn = psycopg2.connect( conninfo )
+	try:
+		conn.set_session( readonly=True, autocommit=True )
+		cur = conn.cursor()
+		tbl = qualifiedName( schema, table )
+		cur.execute( "SELECT EXISTS (SELECT 1 FROM pg_index i "
+				"JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0] "
+				"WHERE i.indrelid = %s::regclass AND lower(a.attname) = lower(%s))", (tbl, column) )
+		indexed = cur.fetchone()[0]
+
+		cur.execute( "SELECT reltuples::bigint, pg_relation_size(oid) FROM pg_class WHERE oid = %s::regclass", (tbl,) )
+		rows, size = cur.fetchone()
+
+		# planner cost of the lookup of a PS, of a code read from the table
+		# and cast to the type of the column, so text and integer codes
+		# are alike. A NULL one would be planned as no lookup at all
+		cur.execute( "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+				"WHERE attrelid = %s::regclass AND lower(attname) = lower(%s) AND attnum > 0 AND NOT attisdropped", (tbl, column) )
+		row = cur.fetchone()
+		if row is None:
+			raise TSSqlError( "%s has no %s column" % (table, column) )
+		colType = row[0]
+
+		cost = None
+		cur.execute( "SELECT %s::text FROM %s LIMIT 1" % (quoteIdentifier( column ), tbl) )
+		row = cur.fetchone()
+		if row is not None and row[0] is not None:
+			cur.execute( "EXPLAIN (FORMAT JSON) SELECT * FROM %s WHERE %s = %%s::%s" % (tbl, quoteIdentifier( column ), colType), (row[0],) )
+			plan = cur.fetchone()[0]
+			cost = plan[0]['Plan']['Total Cost'] if plan else None
+	finally:
+		conn.close()
+	return { 'indexed': indexed, 'rows': rows if rows >= 0 else None, 'bytes': size, 'cost': cost }
+
+def _inspectSqlite(dbpath, table, column):
+	indexed = sqliteHasIndex( dbpath, table, column )
+	conn = sqlite3.connect( dbpath )
+	try:
+		try:
+			rows = conn.execute( "SELECT max(rowid) FROM %s" % quoteIdentifier( table ) ).fetchone()[0]
+		except sqlite3.Error:
+			rows = None		# WITHOUT ROWID tables and views
+	finally:
+		conn.close()
+	return { 'indexed': indexed, 'rows': rows, 'bytes': os.path.getsize( dbpath ), 'cost': None }
+
+
+class IndexBuilder:
+	""" create the index on the column of the TS table reporting the
+	progress, it can be canceled from another thread """
+
+	# sqlite progress handler period, and the rough number of VM steps
+	# spent on each row to estimate the progress
+	SQLITE_STEPS = 10000
+	SQLITE_STEPS_PER_ROW = 10
+
+	def __init__(self, providerType, conninfo, schema, table, column, rows=None):
+		self.providerType = providerType
+		self.conninfo = conninfo
+		self.schema = schema
+		self.table = table
+		self.column = column
+		self.rows = rows			# estimated rows of the table
+		self._canceled = False
+		self._conn = None
+
+	def _sql(self):
+		return "CREATE INDEX IF NOT EXISTS %s ON %s (%s)" % ( quoteIdentifier( indexName( self.table, self.column ) ),
+				qualifiedName( self.schema if self.providerType == 'postgres' else None, self.table ),
+				quoteIdentifier( self.column ) )
+
+	def run(self, progress=None):
+		""" create the index, raise TSSqlError on errors or if canceled """
+		try:
+			if self.providerType == 'postgres':
+				self._runPostgis( progress )
+			elif self.providerType in SQLITE_PROVIDERS:
+				self._runSqlite( progress )
+		except DB_ERRORS as e:
+			raise TSSqlError( "canceled" if self._canceled else str(e) )
+
+	def cancel(self):
+		self._canceled = True
+		conn = self._conn
+		if conn is not None and self.providerType == 'postgres':
+			try:
+				conn.cancel()
+			except DB_ERRORS:
+				pass
+
+	def _runSqlite(self, progress):
+		conn = sqlite3.connect( self.conninfo )
+		total = max(1, self.rows or 0) * self.SQLITE_STEPS_PER_ROW
+		steps = [ 0 ]
+		def handler():
+			steps[0] += self.SQLITE_STEPS
+			if progress is not None:
+				progress( min( 99.0, 100.0 * steps[0] / total ) )
+			# a non-zero value interrupts the statement
+			return 1 if self._canceled else 0
+
+		try:
+			conn.set_progress_handler( handler, self.SQLITE_STEPS )
+			with conn:
+				conn.execute( self._sql() )
+		finally:
+			conn.close()
+
+	def _runPostgis(self, progress):
+		# the statement blocks, so it runs in its own thread while this
+		# one polls its progress (PostgreSQL 12 or later)
+		self._conn = psycopg2.connect( self.conninfo )
+		self._conn.autocommit = True
+		monitor = psycopg2.connect( self.conninfo )
+		monitor.autocommit = True
+		errors = []
+
+		def execute():
+			try:
+				cur = self._conn.cursor()
+				cur.execute( self._sql() )
+				cur.close()
+			except DB_ERRORS as e:
+				errors.append( e )
+
+		try:
+			pid = self._conn.get_backend_pid()
+			thread = threading.Thread( target=execute )
+			thread.start()
+			while thread.is_alive():
+				thread.join( 0.5 )
+				if progress is not None and thread.is_alive():
+					value = self._postgisProgress( monitor, pid )
+					if value is not None:
+						progress( value )
+			if errors:
+				raise errors[0]
+		finally:
+			monitor.close()
+			conn, self._conn = self._conn, None
+			conn.close()
+
+	@staticmethod
+	def _postgisProgress(monitor, pid):
+		try:
+			cur = monitor.cursor()
+			cur.execute( "SELECT blocks_done, blocks_total, tuples_done, tuples_total "
+					"FROM pg_stat_progress_create_index WHERE pid = %s", (pid,) )
+			row = cur.fetchone()
+			cur.close()
+		except DB_ERRORS:
+			return	# older server
+		if row is None:
+			return
+		blocksDone, blocksTotal, tuplesDone, tuplesTotal = row
+		if tuplesTotal:
+			# loading the sorted tuples in the index
+			return 90.0 + 9.0 * tuplesDone / tuplesTotal
+		if blocksTotal:
+			# scanning the table
+			return 90.0 * blocksDone / blocksTotal
+
+
+class TSIndexTask(QgsTask):
+	""" run the IndexBuilder in background """
+
+	def __init__(self, builder):
+		QgsTask.__init__(self, "PS Time Series Viewer: indexing %s on %s" % (builder.table, builder.column), QgsTask.CanCancel)
+		self.builder = builder
+		self.exception = None
+		self.seconds = None
+
+	def run(self):
+		start = time.time()
+		try:
+			self.builder.run( self.setProgress )
+		except TSSqlError as e:
+			self.exception = e
+			return False
+		self.seconds = time.time() - start
+		return not self.isCanceled()
+
+	def cancel(self):
+		self.builder.cancel()
+		QgsTask.cancel(self)
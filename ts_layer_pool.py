@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import time
+from collections import OrderedDict
+
+from qgis.PyQt.QtCore import QTimer
+
+from qgis.core import QgsProject, QgsVectorLayer
+
+
+class TSLayerPool:
+	""" keep the time-series layers open across clicks, one for each
+	(PS layer, TS table) pair, so that providers, connections and field
+	metadata are reused instead of being recreated on every click """
+
+	def __init__(self, maxSize=8, maxIdle=300):
+		self.maxSize = maxSize	# max number of open layers
+		self.maxIdle = maxIdle	# seconds before an unused layer is closed
+
+		self._entries = OrderedDict()	# (ps_layerid, ts_tablename) -> [layer, lastUsed, uri, providerType]
+
+		self._timer = QTimer()
+		self._timer.setInterval( 60 * 1000 )
+		self._timer.timeout.connect( self.evictIdle )
+		self._timer.start()
+
+		QgsProject.instance().layerWillBeRemoved.connect( self.removePSLayer )
+
+	def acquire(self, ps_layer, ts_tablename, uri, providerType):
+		""" return the open time-series layer for the PS layer and table,
+		creating it if needed. Return None if the layer is not valid """
+		key = (ps_layer.id(), ts_tablename)
+
+		entry = self._entries.get( key )
+		if entry is not None:
+			# the provider rewrites the source (e.g. key= and checkPrimaryKeyUnicity
+			# are added to the postgres uri), compare with the requested one
+			layer = entry[0]
+			if entry[2:] == [ uri, providerType ] and layer.isValid():
+				entry[1] = time.time()
+				self._entries.move_to_end( key )
+				return layer
+			# the source changed, drop the stale layer
+			self._remove( key )
+
+		self.evictIdle()
+
+		layer = QgsVectorLayer( uri, "time_series_layer", providerType )
+		if not layer.isValid():
+			layer.deleteLater()
+			return
+
+		self._entries[ key ] = [ layer, time.time(), uri, providerType ]
+		while len(self._entries) > self.maxSize:
+			self._remove( next(iter(self._entries)) )
+
+		return layer
+
+	def evictIdle(self):
+		""" close the layers not used for more than maxIdle seconds """
+		now = time.time()
+		for key, entry in list(self._entries.items()):
+			if now - entry[1] > self.maxIdle:
+				self._remove( key )
+
+	def removePSLayer(self, layerid):
+		""" close the time-series layers related to the PS layer """
+		for key in list(self._entries.keys()):
+			if key[0] == layerid:
+				self._remove( key )
+
+	def clear(self):
+		""" close all the open layers """
+		for key in list(self._entries.keys()):
+			self._remove( key )
+
+	def close(self):
+		self.clear()
+		self._timer.stop()
+		try:
+			QgsProject.instance().layerWillBeRemoved.disconnect( self.removePSLayer )
+		except TypeError:
+			pass
+
+	def _remove(self, key):
+		entry = self._entries.pop( key, None )
+		if entry is not None:
+			entry[0].deleteLater()
+
+	def __len__(self):
+		return len(self._entries)
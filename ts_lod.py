@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Level of detail of the plots: the vertices of a line and the markers of a set
+of points which draw the same pixels as the whole data in the current view.
+Coordinates are in pixels, so any axis scale and zoom is handled alike.
+"""
+
+import numpy as np
+
+# below this many vertices for each pixel column the line is drawn as it is
+RAW_POINTS_PER_COLUMN = 4
+
+# markers centered up to this many pixels out of the axes still show in part
+MARKER_MARGIN = 16
+
+# side of the cells of the markers grid in pixels, markers are drawn at
+# sub-pixel positions so one for each pixel slightly shrinks dense clouds
+MARKER_CELL = 0.5
+
+
+def decimateLine(px, py, x0, x1, rawPerColumn=RAW_POINTS_PER_COLUMN):
+	""" return the indexes of the vertices of the line to draw between the
+	pixel columns x0 and x1, px must be sorted. All the vertices within
+	the columns and the nearest ones on each side are kept when they're
+	at most rawPerColumn for each column, otherwise the first, last,
+	lowest and highest of each column, which draw the same pixels (M4).
+	Vertices with no value are kept to break the line """
+	start = max( 0, np.searchsorted( px, x0, 'left' ) - 1 )
+	stop = min( len(px), np.searchsorted( px, x1, 'right' ) + 1 )
+	if stop - start <= rawPerColumn * max( 1.0, x1 - x0 ):
+		return np.arange( start, stop )
+
+	idx = np.arange( start, stop )
+	finite = np.isfinite( py[ start:stop ] )
+	gaps = idx[ ~finite ]
+	idx = idx[ finite ]
+	if len(idx) == 0:
+		return gaps
+
+	# vertices of a column are contiguous, px being sorted
+	columns = np.floor( px[ idx ] ).astype( np.int64 )
+	bounds = np.flatnonzero( np.diff( columns ) )
+	first = np.concatenate( ( [0], bounds + 1 ) )
+	last = np.concatenate( ( bounds, [len(columns) - 1] ) )
+
+	# sorted by value within each column the lowest come first
+	order = np.lexsort( ( py[ idx ], columns ) )
+	return np.unique( np.concatenate( ( idx[ first ], idx[ last ], idx[ order[ first ] ], idx[ order[ last ] ], gaps ) ) )
+
+def decimatePoints(px, py, x0, y0, x1, y1, margin=MARKER_MARGIN, cell=MARKER_CELL):
+	""" return the indexes of the markers to draw within the pixel box,
+	one for each cell of the grid: markers of the same style centered in
+	the same cell cover each other. Those out of the box by margin pixels
+	or more are dropped, drawing order is kept """
+	inside = (px > x0 - margin) & (px < x1 + margin) & (py > y0 - margin) & (py < y1 + margin)
+	idx = np.flatnonzero( inside )
+
+	rows = int( np.ceil( (y1 - y0 + 2 * margin) / cell ) ) + 1
+	cells = np.floor( (px[ idx ] - x0 + margin) / cell ).astype( np.int64 ) * rows + \
+			np.floor( (py[ idx ] - y0 + margin) / cell ).astype( np.int64 )
+	first = np.unique( cells, return_index=True )[1]
+	return idx[ np.sort( first ) ]
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from qgis.core import QgsApplication, QgsTask, QgsSettings, QgsMessageLog
+
+from .ts_sql import TSSqlReader
+
+
+class TSPrefetchTask(QgsTask):
+	""" load the time series of the PS around the clicked one into the
+	series cache, so the next click doesn't wait for the database """
+
+	# PS fetched at once by each worker, the nearest ones first
+	BATCH_SIZE = 25
+
+	def __init__(self, job, extent, count, concurrency, fetchFunc, nearest=True):
+		QgsTask.__init__(self, "PS Time Series Viewer: prefetching time series", QgsTask.CanCancel)
+		self.job = job
+		self.extent = extent		# canvas extent in layer coordinates
+		self.count = count			# max number of PS to prefetch
+		self.nearest = nearest		# the nearest PS or those within the extent
+		self.concurrency = max(1, concurrency)
+		self.fetchFunc = fetchFunc	# called as fetchFunc(task, job, attrsList, tsSql) in worker threads
+		self.fetched = 0
+		self.exception = None
+
+	def run(self):
+		try:
+			fids = self.neighbours()
+			if not fids or self.isCanceled():
+				return not self.isCanceled()
+
+			# split the PS among the workers, each one with its own
+			# connections so they never wait for each other nor for the
+			# interactive fetch
+			chunks = [ fids[i::self.concurrency] for i in range(self.concurrency) ]
+			with ThreadPoolExecutor( max_workers=len(chunks) ) as executor:
+				for n in executor.map( self._prefetch, chunks ):
+					self.fetched += n
+		except Exception as e:
+			self.exception = e
+			return False
+
+		return not self.isCanceled()
+
+	def neighbours(self):
+		""" return the ids of the PS within the canvas extent, sorted by
+		distance from the clicked one """
+		center = self.job.rect.center()
+		index = self.job.pointIndex()
+		if index is None:
+			return []	# the layer was dropped meanwhile
+
+		if self.nearest:
+			# one more since the clicked PS is the nearest one
+			ids = index.nearest( center, self.count + 1 )
+		else:
+			ids = index.intersects( self.extent )
+		ids = [ fid for fid in ids if fid != self.job.fid ]
+
+		dists = [ index.distance2( fid, center ) for fid in ids ]
+		order = np.argsort( dists, kind='stable' )[ :self.count ]
+		return [ ids[ i ] for i in order ]
+
+	def _prefetch(self, fids):
+		fetched = 0
+		tsSql = TSSqlReader()
+		try:
+			feats = {}
+			for f in self.job.psSource.getFeatures( self.job.attributesRequest( fids ) ):
+				feats[ f.id() ] = f.attributes()
+
+			# keep the order by distance, a batch at a time
+			attrsList = [ feats[ fid ] for fid in fids if fid in feats ]
+			for i in range(0, len(attrsList), self.BATCH_SIZE):
+				if self.isCanceled():
+					break
+				fetched += self.fetchFunc( self, self.job, attrsList[ i:i + self.BATCH_SIZE ], tsSql )
+		finally:
+			tsSql.close()
+		return fetched
+
+
+class TSPrefetcher:
+	""" start and cancel the prefetch of the PS around the clicked one.
+	Its settings are:
+	- /pstimeseries/prefetchMode: "nearest" for the k nearest PS, "extent" for
+	  all the PS in the canvas extent up to a limit, "off" to disable it
+	- /pstimeseries/prefetchDepth: how many nearest PS to prefetch
+	- /pstimeseries/prefetchExtentLimit: how many PS to prefetch in "extent" mode
+	- /pstimeseries/prefetchConcurrency: how many PS are fetched in parallel """
+
+	def __init__(self, fetchFunc):
+		self.fetchFunc = fetchFunc
+		self.task = None
+		self._runningTasks = set()	# referenced until they actually end
+
+	def start(self, job, extent):
+		self.cancel()
+
+		settings = QgsSettings()
+		mode = settings.value( "/pstimeseries/prefetchMode", "nearest", type=str )
+		if mode == "extent":
+			count = settings.value( "/pstimeseries/prefetchExtentLimit", 200, type=int )
+		elif mode == "nearest":
+			count = settings.value( "/pstimeseries/prefetchDepth", 10, type=int )
+		else:
+			return
+		concurrency = settings.value( "/pstimeseries/prefetchConcurrency", 2, type=int )
+		if count <= 0:
+			return
+
+		self.task = TSPrefetchTask( job, extent, count, concurrency, self.fetchFunc, mode == "nearest" )
+		self.task.taskCompleted.connect( lambda task=self.task: self._finished( task ) )
+		self.task.taskTerminated.connect( lambda task=self.task: self._finished( task ) )
+		self._runningTasks.add( self.task )
+		QgsApplication.taskManager().addTask( self.task )
+
+	def cancel(self):
+		if self.task is None:
+			return
+		try:
+			self.task.cancel()
+		except RuntimeError:
+			pass	# the task was already deleted
+		self.task = None
+
+	def _finished(self, task):
+		self._runningTasks.discard( task )
+		if task is self.task:
+			self.task = None
+		if task.exception is not None:
+			QgsMessageLog.logMessage( "prefetching time series failed: %s" % task.exception, "PSTimeSeriesViewer" )
+		QgsMessageLog.logMessage( "prefetched %d time series" % task.fetched, "PSTimeSeriesViewer" )
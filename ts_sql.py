@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 18, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .date_utils import decodeDates
+
+try:
+	import psycopg2
+	DB_ERRORS = (sqlite3.Error, psycopg2.Error)
+except ImportError:
+	psycopg2 = None
+	DB_ERRORS = (sqlite3.Error,)
+
+
+class TSSqlError(Exception):
+	pass
+
+
+def quoteIdentifier(name):
+	return '"%s"' % name.replace('"', '""')
+
+def qualifiedName(schema, table):
+	if schema:
+		return "%s.%s" % (quoteIdentifier( schema ), quoteIdentifier( table ))
+	return quoteIdentifier( table )
+
+def seriesTableName(table):
+	""" return the name of the PostGIS table holding the series of the TS
+	table as arrays, one row per PS (see pg_series_table) """
+	return "%s_series" % table
+
+def seriesTableComment(stamp):
+	""" return the comment of the series table recording the stamp of the
+	TS table it was built or refreshed from """
+	return "pstimeseries stamp %s" % stamp
+
+def postgisTableStamp(cur, tbl):
+	""" return the stamp of the PostGIS table, None if it can't be told
+	cheaply. cur is a cursor of its database """
+	# counting the rows would scan the whole table, the stamp is made
+	# of the catalog data instead: the file node changes on truncate
+	# and rewrites, the tuple counters on any change, and the max id,
+	# read from its index, as soon as new rows are committed
+	cur.execute( "SELECT c.relkind, c.relfilenode, s.n_tup_ins, s.n_tup_upd, s.n_tup_del, "
+			"EXISTS (SELECT 1 FROM pg_index i JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0] "
+			"WHERE i.indrelid = c.oid AND a.attname = 'id') "
+			"FROM pg_class c LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid WHERE c.oid = %s::regclass", (tbl,) )
+	kind, node, inserted, updated, deleted, idIndexed = cur.fetchone()
+	if kind != 'r':
+		return		# views, partitioned and foreign tables have no stamp
+
+	maxid = None
+	if idIndexed:
+		cur.execute( "SELECT max(id) FROM %s" % tbl )
+		maxid = cur.fetchone()[0]
+	return "node:%s,ins:%s,upd:%s,del:%s,id:%s" % (node, inserted, updated, deleted, maxid)
+
+# seconds a series table is known to be up to date before checking again
+SERIES_TABLE_CHECK = 60
+
+
+# SQLite based providers, GeoPackage tables are read as SpatiaLite ones
+SQLITE_PROVIDERS = ('spatialite', 'gpkg')
+
+# max PS codes within the IN (...) list of a batched query
+CHUNK_SIZE = 500
+
+
+def sqliteHasTable(dbpath, table):
+	conn = sqlite3.connect( dbpath )
+	try:
+		row = conn.execute( "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (table,) ).fetchone()
+	finally:
+		conn.close()
+	return row is not None
+
+def sqliteHasIndex(dbpath, table, column):
+	""" return True if an index of the table starts with the column """
+	conn = sqlite3.connect( dbpath )
+	try:
+		for index in conn.execute( "PRAGMA index_list(%s)" % quoteIdentifier( table ) ).fetchall():
+			cols = conn.execute( "PRAGMA index_info(%s)" % quoteIdentifier( index[1] ) ).fetchall()
+			if cols and cols[0][2] is not None and cols[0][2].lower() == column.lower():
+				return True
+	finally:
+		conn.close()
+	return False
+
+
+class LatencyStats:
+	""" number and duration of the series lookups by the way they were
+	read, to compare them. It's shared with the worker threads """
+
+	def __init__(self):
+		self._stats = OrderedDict()	# path -> [count, seconds]
+		self._lock = threading.Lock()
+
+	def add(self, path, seconds):
+		with self._lock:
+			stats = self._stats.setdefault( path, [0, 0.0] )
+			stats[0] += 1
+			stats[1] += seconds
+
+	def mean(self, path):
+		with self._lock:
+			count, seconds = self._stats.get( path, (0, 0.0) )
+		return seconds / count if count else None
+
+	def summary(self):
+		with self._lock:
+			return ", ".join( "%s: %d lookups, %.1f ms mean" % (path, count, 1000.0 * seconds / count) \
+					for path, (count, seconds) in self._stats.items() if count )
+
+
+class TSSqlReader:
+	""" fetch the whole time series of a PS with a single SQL statement,
+	sorted by date on the server side and decoded straight into arrays.
+	Statements are parameterized and planned once per connection: prepared
+	on PostGIS, kept compiled by the sqlite3 statement cache on SQLite """
+
+	def __init__(self):
+		self._connections = {}	# (providerType, connection string) -> connection
+		self._prepared = {}		# (providerType, connection string) -> {sql: statement name}
+		self._statements = {}	# (kind, providerType, schema, table, fields) -> sql
+		self._seriesTables = {}	# (connection string, schema, table) -> (whether the series table is used, time)
+		self._staleSeriesTables = set()	# same keys, found older than their TS table
+		self._lock = threading.Lock()	# fetches run in worker threads
+
+	@staticmethod
+	def isAvailable(providerType):
+		if providerType == 'postgres':
+			return psycopg2 is not None
+		return providerType in SQLITE_PROVIDERS
+
+	def fetch(self, providerType, conninfo, schema, table, code, dateField, valueField):
+		""" return the (dates, values) arrays of the PS code, or None if the
+		provider is not supported. Raise TSSqlError on database errors """
+		if not self.isAvailable( providerType ):
+			return
+
+		with self._lock:
+			try:
+				if providerType == 'postgres':
+					return self._fetchPostgis( conninfo, schema, table, code, dateField, valueField )
+				return self._fetchSpatialite( providerType, conninfo, table, code, dateField, valueField )
+			except DB_ERRORS as e:
+				self._drop( providerType, conninfo )
+				raise TSSqlError( str(e) )
+
+	def fetchMany(self, providerType, conninfo, schema, table, codes, dateField, valueField, chunkSize=CHUNK_SIZE):
+		""" return {code: (dates, values)} of the PS codes, with empty arrays
+		for those not found, or None if the provider is not supported. The
+		codes are queried chunkSize at a time with IN (...) lists. Raise
+		TSSqlError on database errors """
+		if not self.isAvailable( providerType ):
+			return
+
+		codes = list(OrderedDict.fromkeys( codes ))
+		series = {}
+		with self._lock:
+			try:
+				for i in range(0, len(codes), chunkSize):
+					chunk = codes[ i:i + chunkSize ]
+					if providerType == 'postgres':
+						self._fetchManyPostgis( conninfo, schema, table, chunk, dateField, valueField, series )
+					else:
+						self._fetchManySpatialite( providerType, conninfo, table, chunk, dateField, valueField, series )
+			except DB_ERRORS as e:
+				self._drop( providerType, conninfo )
+				raise TSSqlError( str(e) )
+
+		for code in codes:
+			if code not in series:
+				series[ code ] = self._empty()
+		return series
+
+	def tableStamp(self, providerType, conninfo, schema, table):
+		""" return a string which changes whenever time series are loaded
+		into the table, None if it can't be told cheaply. Raise TSSqlError
+		on database errors """
+		if not self.isAvailable( providerType ):
+			return
+
+		tbl = qualifiedName( schema if providerType == 'postgres' else None, table )
+
+		with self._lock:
+			try:
+				conn = self._connect( providerType, conninfo )
+				cur = conn.cursor()
+				try:
+					if providerType == 'postgres':
+						return postgisTableStamp( cur, tbl )
+					try:
+						cur.execute( "SELECT count(*), max(id) FROM %s" % tbl )
+					except DB_ERRORS:
+						# no id column
+						cur.execute( "SELECT count(*), NULL FROM %s" % tbl )
+					count, maxid = cur.fetchone()
+				finally:
+					cur.close()
+			except DB_ERRORS as e:
+				self._drop( providerType, conninfo )
+				raise TSSqlError( str(e) )
+		return "rows:%s,id:%s" % (count, maxid)
+
+	@staticmethod
+	def _empty():
+		return np.array( [], dtype='datetime64[D]' ), np.array( [], dtype=np.float64 )
+
+	@staticmethod
+	def _decode(dates, values):
+		# the (dates, values) arrays of the aggregated rows, skipping the
+		# acquisitions with no valid date as the feature requests do
+		x = decodeDates( dates )
+		y = np.array( values, dtype=np.float64 )
+		valid = ~np.isnat( x )
+		return x[ valid ], y[ valid ]
+
+	@staticmethod
+	def _decodePacked(packed):
+		# the (dates, values) arrays of the value:date pairs of SQLite
+		values, _, dates = zip( *( pair.partition( ':' ) for pair in packed.split( ',' ) ) )
+		return TSSqlReader._decode( list(dates), [ float(v) if v else np.nan for v in values ] )
+
+	def _connect(self, providerType, conninfo):
+		key = (providerType, conninfo)
+		conn = self._connections.get( key )
+		if conn is None:
+			if providerType == 'postgres':
+				conn = psycopg2.connect( conninfo )
+				conn.set_session( readonly=True, autocommit=True )
+			else:
+				conn = sqlite3.connect( conninfo, check_same_thread=False, cached_statements=256 )
+			self._connections[ key ] = conn
+		return conn
+
+	def _execute(self, providerType, conninfo, sql, codes):
+		# run the statement of the PS codes and return its rows. The PostGIS
+		# statements are prepared on first use and then executed by name,
+		# so they're neither parsed nor planned again
+		params = tuple( str(code) for code in codes )
+		cur = self._connect( providerType, conninfo ).cursor()
+		try:
+			if providerType == 'postgres':
+				names = self._prepared.setdefault( (providerType, conninfo), {} )
+				name = names.get( sql )
+				if name is None:
+					name = "pstimeseries_%d" % (len(names) + 1)
+					cur.execute( "PREPARE %s AS %s" % (name, sql) )
+					names[ sql ] = name
+				cur.execute( "EXECUTE %s (%s)" % (name, ", ".join( ["%s"] * len(params) )), params )
+			else:
+				cur.execute( sql, params )
+			return cur.fetchall()
+		finally:
+			cur.close()
+
+	def _statement(self, kind, providerType, schema, table, dateField=None, valueField=None, count=None):
+		# return the text of the statement, built once since the same
+		# text is what reuses the prepared or cached statement. The batched
+		# ones select the code too and match count codes
+		key = (kind, providerType, schema, table, dateField, valueField, count)
+		sql = self._statements.get( key )
+		if sql is not None:
+			return sql
+
+		if count is None:
+			code, where, group = "", "code = %s" % ("$1" if providerType == 'postgres' else "?"), ""
+		else:
+			if providerType == 'postgres':
+				params = [ "$%d" % (i + 1) for i in range(count) ]
+			else:
+				params = [ "?" ] * count
+			code, where, group = "code::text, " if providerType == 'postgres' else "c, ", \
+					"code IN (%s)" % ", ".join( params ), " GROUP BY %s" % ("code" if providerType == 'postgres' else "c")
+
+		if kind == 'series':
+			sql = "SELECT %sdates, vals FROM %s WHERE %s" % (code, qualifiedName( schema, seriesTableName( table ) ), where)
+		elif providerType == 'postgres':
+			sql = "SELECT %(c)sarray_agg(%(d)s::text ORDER BY %(d)s), array_agg(%(v)s::float8 ORDER BY %(d)s) " \
+					"FROM %(t)s WHERE %(w)s%(g)s" % { 'c': code, 'd': quoteIdentifier( dateField ), 'v': quoteIdentifier( valueField ),
+					't': qualifiedName( schema, table ), 'w': where, 'g': group }
+		else:
+			# pack the whole series in a single row of comma separated
+			# value:date pairs. group_concat skips NULLs, so each pair is
+			# a single token: a missing value is kept as an empty one and
+			# the acquisitions with no date are dropped
+			sql = "SELECT %(c)sgroup_concat(coalesce(v, '') || ':' || d) FROM (" \
+					"SELECT CAST(code AS TEXT) AS c, CAST(%(d)s AS TEXT) AS d, CAST(%(v)s AS REAL) AS v " \
+					"FROM %(t)s WHERE %(w)s ORDER BY c, %(d)s)%(g)s" % { 'c': code, 'd': quoteIdentifier( dateField ),
+					'v': quoteIdentifier( valueField ), 't': quoteIdentifier( table ), 'w': where, 'g': group }
+		self._statements[ key ] = sql
+		return sql
+
+	@staticmethod
+	def _padded(codes):
+		# the codes of a batch padded with the last one to a power of two,
+		# so a few statements serve batches of any size
+		count = 1 << (len(codes) - 1).bit_length()
+		return list(codes) + [ codes[-1] ] * (count - len(codes))
+
+	def _drop(self, providerType, conninfo):
+		self._prepared.pop( (providerType, conninfo), None )
+		conn = self._connections.pop( (providerType, conninfo), None )
+		if conn is not None:
+			try:
+				conn.close()
+			except Exception:
+				pass
+
+	def forgetSeriesTables(self):
+		""" check again whether the series tables exist on next fetch """
+		with self._lock:
+			self._seriesTables.clear()
+
+	def popStaleSeriesTables(self):
+		""" return the (connection string, schema, table) of the TS tables
+		whose series table was found older than them since the last call """
+		with self._lock:
+			stale, self._staleSeriesTables = self._staleSeriesTables, set()
+		return stale
+
+	def _hasSeriesTable(self, conninfo, schema, table):
+		# whether the series table exists and was built or refreshed from
+		# the current version of the TS table. Otherwise the PS which got
+		# new acquisitions since then would miss them, so the TS table is
+		# read instead until the series table is refreshed
+		key = (conninfo, schema, table)
+		cached = self._seriesTables.get( key )
+		if cached is not None and time.time() - cached[1] < SERIES_TABLE_CHECK:
+			return cached[0]
+
+		cur = self._connect( 'postgres', conninfo ).cursor()
+		try:
+			cur.execute( "SELECT t.oid IS NOT NULL, obj_description(t.oid, 'pg_class') FROM (SELECT to_regclass(%s) AS oid) AS t",
+					(qualifiedName( schema, seriesTableName( table ) ),) )
+			exists, comment = cur.fetchone()
+			used = exists
+			if exists:
+				stamp = postgisTableStamp( cur, qualifiedName( schema, table ) )
+				used = comment == seriesTableComment( stamp )
+				if not used:
+					self._staleSeriesTables.add( key )
+		finally:
+			cur.close()
+		self._seriesTables[ key ] = ( used, time.time() )
+		return used
+
+	def _fetchPostgisSeriesTable(self, conninfo, schema, table, code):
+		# read the row of the PS from the series table, None if it's not
+		# there (yet)
+		sql = self._statement( 'series', 'postgres', schema, table )
+		rows = self._execute( 'postgres', conninfo, sql, [code] )
+		if not rows:
+			return
+		return self._decode( rows[0][0], rows[0][1] )
+
+	def _fetchPostgis(self, conninfo, schema, table, code, dateField, valueField):
+		# one row of arrays from the series table when it has been built
+		if self._hasSeriesTable( conninfo, schema, table ):
+			series = self._fetchPostgisSeriesTable( conninfo, schema, table, code )
+			if series is not None:
+				return series
+
+		sql = self._statement( 'table', 'postgres', schema, table, dateField, valueField )
+		dates, values = self._execute( 'postgres', conninfo, sql, [code] )[0]
+		if not dates:
+			return self._empty()
+		return self._decode( dates, values )
+
+	def _fetchSpatialite(self, providerType, dbpath, table, code, dateField, valueField):
+		sql = self._statement( 'table', providerType, None, table, dateField, valueField )
+		rows = self._execute( providerType, dbpath, sql, [code] )
+		if not rows or not rows[0][0]:
+			return self._empty()
+		return self._decodePacked( rows[0][0] )
+
+	@staticmethod
+	def _matched(rows, codes, series, decode):
+		# add the rows of a batch to series, keyed by the requested codes
+		wanted = dict( (str(code), code) for code in codes )
+		for row in rows:
+			code = wanted.get( row[0] )
+			if code is not None and row[1]:
+				series[ code ] = decode( *row[1:] )
+
+	def _fetchManyPostgis(self, conninfo, schema, table, codes, dateField, valueField, series):
+		decode = self._decode
+		if self._hasSeriesTable( conninfo, schema, table ):
+			params = self._padded( codes )
+			sql = self._statement( 'series', 'postgres', schema, table, count=len(params) )
+			self._matched( self._execute( 'postgres', conninfo, sql, params ), codes, series, decode )
+			# the PS loaded since the series table was built
+			codes = [ code for code in codes if code not in series ]
+			if not codes:
+				return
+
+		params = self._padded( codes )
+		sql = self._statement( 'table', 'postgres', schema, table, dateField, valueField, len(params) )
+		self._matched( self._execute( 'postgres', conninfo, sql, params ), codes, series, decode )
+
+	def _fetchManySpatialite(self, providerType, dbpath, table, codes, dateField, valueField, series):
+		decode = self._decodePacked
+		params = self._padded( codes )
+		sql = self._statement( 'table', providerType, None, table, dateField, valueField, len(params) )
+		self._matched( self._execute( providerType, dbpath, sql, params ), codes, series, decode )
+
+	def close(self):
+		with self._lock:
+			for key in list(self._connections.keys()):
+				self._drop( *key )